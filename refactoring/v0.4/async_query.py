@@ -0,0 +1,118 @@
+"""Moduł zawierający asynchroniczny (asyncio) interfejs zapytań obszarowych
+
+"""
+
+import asyncio
+
+
+class AsyncRangeQueries:
+    """Klasa udostępniająca wyszukiwanie obszarów dla kodu asyncio
+    - zapytanie nie blokuje pętli zdarzeń - przeszukiwanie odbywa się w executorze
+    - zapytania zebrane w krótkim oknie czasowym są wykonywane razem, jednym
+      wywołaniem search_ranges (przejście wektorowe zamiast Q osobnych przejść)
+    - identyczne obszary z jednego okna są wyszukiwane tylko raz, a wynik
+      trafia do wszystkich oczekujących
+    Źródłem może być dowolny obiekt z metodą search_ranges(rects)
+    (KDTree, QueryPool)
+
+    """
+
+    def __init__(self, tree, window=0.002, max_batch=1024, executor=None):
+        """Inicjalizacja interfejsu
+
+        :param tree: drzewo KD lub inny obiekt z metodą search_ranges
+        :param window: czas zbierania zapytań do jednej paczki (sekundy)
+        :param max_batch: liczba różnych obszarów, po której paczka jest wysyłana od razu
+        :param executor: executor dla przeszukiwania, domyślnie executor pętli zdarzeń
+        """
+        self.__tree = tree
+        self.__window = window
+        self.__max_batch = max_batch
+        self.__executor = executor
+        # oczekujące obszary aktualnej paczki: klucz obszaru -> wspólna przyszłość wyniku
+        self.__pending = {}
+        self.__timer = None
+        self.__tasks = set()
+        self.__requests = 0
+        self.__batches = 0
+
+    @property
+    def requests(self):
+        """Getter liczby przyjętych zapytań
+
+        :return: liczba zapytań
+        """
+        return self.__requests
+
+    @property
+    def batches(self):
+        """Getter liczby wykonanych paczek (wywołań search_ranges)
+
+        :return: liczba paczek
+        """
+        return self.__batches
+
+    async def search_range(self, bottom_left, top_right):
+        """Wyszukiwanie punktów należących do zadanego przedziału
+
+        :param bottom_left: dolny róg przedziału
+        :param top_right: górny róg przedziału
+        :return: punkty należące do przedziału
+        """
+        loop = asyncio.get_running_loop()
+        self.__requests += 1
+        key = (tuple(bottom_left), tuple(top_right))
+        future = self.__pending.get(key)
+        if future is None:
+            future = loop.create_future()
+            self.__pending[key] = future
+            if len(self.__pending) >= self.__max_batch:
+                self.__flush()
+            elif self.__timer is None:
+                self.__timer = loop.call_later(self.__window, self.__flush)
+        # shield - anulowanie jednego oczekującego nie anuluje wyniku pozostałych
+        return list(await asyncio.shield(future))
+
+    def __flush(self):
+        """Wysłanie zebranej paczki zapytań do executora
+
+        :return: None
+        """
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+        if not self.__pending:
+            return
+        batch, self.__pending = self.__pending, {}
+        task = asyncio.get_running_loop().create_task(self.__run(batch))
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    async def __run(self, batch):
+        """Wykonanie paczki zapytań i przekazanie wyników oczekującym
+
+        :param batch: słownik klucz obszaru -> przyszłość wyniku
+        :return: None
+        """
+        self.__batches += 1
+        rects = list(batch)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.__executor, self.__tree.search_ranges, rects)
+        except Exception as error:  # pylint: disable=broad-except
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for future, result in zip(batch.values(), results):
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self):
+        """Wykonanie oczekujących zapytań i zaczekanie na trwające paczki
+
+        :return: None
+        """
+        self.__flush()
+        if self.__tasks:
+            await asyncio.gather(*self.__tasks)
@@ -1,8 +1,20 @@
 """Moduł zawiera klasę generatora danych dla przypadków testowych zadania kdtree
+oraz strumieniowe generatory dużych zbiorów punktów (testy wydajności)
 
 """
 import random
 
+try:
+    import numpy as np
+except ImportError:
+    # numpy jest opcjonalny - potrzebny tylko dla generatorów strumieniowych
+    np = None
+
+# rozkłady strumieniowego generatora punktów (generate_points)
+DISTRIBUTIONS = ('uniform', 'gaussian', 'zipf', 'grid', 'duplicates')
+# liczba punktów losowanych z jednego ziarna - wynik nie zależy od rozmiaru paczek
+_BLOCK_SIZE = 1 << 16
+
 
 class Generator:
     """Klasa odpowiadająca za przetrzymywanie i generowanie przypadków testowych
@@ -274,7 +286,21 @@ class Generator:
         """
         self.__sets.append(user_set)
 
-    def generate_point_set(self, point_count, bounds, div=10, in_place=False, index=-1, empty=0):
+    @staticmethod
+    def __sample(values, count, rng):
+        """Losowanie bez zwracania z sumy dwóch rozłącznych zakresów liczb
+
+        :param values: krotka 2 obiektów range
+        :param count: liczba losowanych wartości
+        :param rng: źródło losowości (moduł random lub obiekt random.Random)
+        :return: lista wylosowanych wartości w losowej kolejności
+        """
+        first, second = values
+        return [first[index] if index < len(first) else second[index - len(first)]
+                for index in rng.sample(range(len(first) + len(second)), count)]
+
+    def generate_point_set(self, point_count, bounds, div=10, in_place=False, index=-1, empty=0,
+                           seed=None):
         """Generowanie nowego zbioru punktów na podstawie zadanych parametrów
         Wszystkie punkty mają różne współrzędne X i Y
 
@@ -285,38 +311,31 @@ class Generator:
         :param index: indeks zbioru do nadpisania (jeśli in_place == True)
                       jeśli index == -1 to nadpisujemy aktualnie oglądany zbiór
         :param empty: rozmiar symetrycznej powierzchni (względem 0,0) bez punktów
+        :param seed: ziarno losowania - ten sam seed daje ten sam zbiór,
+                     None - globalny stan modułu random
         """
-        new_set = []
-        x_values = []
-        y_values = []
-        # tworzenie listy potencjalnych wartości dla X i Y
+        rng = random if seed is None else random.Random(seed)
+        # zakresy potencjalnych wartości dla X i Y
         # rozdzielczość 1/divider pomiędzy <-max;max)
         # uwzględnia pustą przestrzeń okreslona przez parametr 'empty'
         bounds = (bounds[0] * div, bounds[1] * div)
         empty *= div
-        x_values.extend(range(-bounds[0], -empty, 1))
-        x_values.extend(range(empty, bounds[0], 1))
-        y_values.extend(range(-bounds[1], -empty, 1))
-        y_values.extend(range(empty, bounds[1], 1))
+        x_values = (range(-bounds[0], -empty, 1), range(empty, bounds[0], 1))
+        y_values = (range(-bounds[1], -empty, 1), range(empty, bounds[1], 1))
+        x_count = len(x_values[0]) + len(x_values[1])
+        y_count = len(y_values[0]) + len(y_values[1])
         # sprawdzenie czy liczba dostępnych współrzędnych
         # nie jest zbyt mała
-        if len(y_values) < point_count or len(x_values) < point_count:
+        if y_count < point_count or x_count < point_count:
             raise Exception('Error creating new point set - allowed range too small!'
                             '\nfree x: {:d}'
                             '\nfree y: {:d}'
-                            '\nneeded: {:d}'.format(len(x_values), len(y_values), point_count))
-        # dodawanie nowych punktów do zbioru
-        while len(new_set) < point_count:
-            # wybranie losowegom elementu tablicy
-            # z dostępnymi współrzednymi x i y
-            x_index = random.randrange(0, len(x_values))
-            y_index = random.randrange(0, len(y_values))
-            # utworzneie i dodanie punktu
-            point = (x_values[x_index] / div, y_values[y_index] / div)
-            new_set.append(point)
-            # usunięcie współrzędnych
-            del x_values[x_index]
-            del y_values[y_index]
+                            '\nneeded: {:d}'.format(x_count, y_count, point_count))
+        # losowanie bez zwracania - różne współrzędne X i Y w czasie O(point_count)
+        # (random.sample na obiekcie range nie tworzy listy wszystkich wartości)
+        new_set = [(x_value / div, y_value / div)
+                   for x_value, y_value in zip(self.__sample(x_values, point_count, rng),
+                                               self.__sample(y_values, point_count, rng))]
         # zapisanie nowego zbioru punktów w tablicy
         if in_place:
             if index == -1:
@@ -325,3 +344,141 @@ class Generator:
                 self.__sets[index] = new_set
         else:
             self.__sets.append(new_set)
+
+
+def _distribution_model(distribution, count, half, rng, options):
+    """Parametry rozkładu losowane raz dla całego zbioru (środki skupisk, pula punktów...)
+
+    :param distribution: nazwa rozkładu
+    :param count: liczba punktów zbioru
+    :param half: tablica numpy połówek zakresów osi
+    :param rng: generator numpy dla parametrów
+    :param options: słownik parametrów rozkładów (generate_points)
+    :return: słownik parametrów rozkładu
+    """
+    dimensions = len(half)
+    if distribution == 'gaussian':
+        return {'centers': rng.uniform(-half, half, (options['clusters'], dimensions)),
+                'sigma': half * options['spread']}
+    if distribution == 'zipf':
+        cells = options['cells']
+        # losowa kolejność komórek - najpopularniejsze komórki nie leżą obok siebie
+        return {'order': rng.permutation(cells ** dimensions), 'step': 2 * half / cells}
+    if distribution == 'grid':
+        side = max(1, int(np.ceil(count ** (1 / dimensions))))
+        while side ** dimensions < count:
+            side += 1
+        return {'side': side, 'step': 2 * half / side}
+    if distribution == 'duplicates':
+        return {'pool': rng.uniform(-half, half, (options['distinct'], dimensions))}
+    return {}
+
+
+def _distribution_block(distribution, model, start, size, half, rng, options):
+    """Losowanie jednego bloku punktów
+
+    :param distribution: nazwa rozkładu
+    :param model: parametry rozkładu (_distribution_model)
+    :param start: numer pierwszego punktu bloku w zbiorze
+    :param size: liczba punktów bloku
+    :param half: tablica numpy połówek zakresów osi
+    :param rng: generator numpy bloku
+    :param options: słownik parametrów rozkładów
+    :return: tablica numpy (size, k)
+    """
+    dimensions = len(half)
+    if distribution == 'gaussian':
+        centers = model['centers'][rng.integers(0, len(model['centers']), size)]
+        return np.clip(centers + rng.normal(0, model['sigma'], (size, dimensions)), -half, half)
+    if distribution == 'zipf':
+        # numer komórki o rozkładzie Zipfa (ranga 1 - najczęstsza), punkt losowy w komórce
+        ranks = (rng.zipf(options['exponent'], size) - 1) % len(model['order'])
+        cells = np.unravel_index(model['order'][ranks], (options['cells'],) * dimensions)
+        return -half + (np.stack(cells, axis=1) + rng.random((size, dimensions))) * model['step']
+    if distribution == 'grid':
+        nodes = np.unravel_index(np.arange(start, start + size), (model['side'],) * dimensions)
+        return -half + (np.stack(nodes, axis=1) + 0.5) * model['step']
+    if distribution == 'duplicates':
+        return model['pool'][rng.integers(0, len(model['pool']), size)]
+    return rng.uniform(-half, half, (size, dimensions))
+
+
+def generate_points(count, distribution='uniform', bounds=(100, 100), seed=None,
+                    chunk_size=1 << 20, **options):
+    """Strumieniowe generowanie dużych zbiorów punktów (10^7 - 10^8) w paczkach
+    Dostępne rozkłady (DISTRIBUTIONS):
+    - uniform - jednostajny w całym zakresie
+    - gaussian - mieszanina skupisk normalnych (clusters, spread - odchylenie
+      jako część zakresu osi)
+    - zipf - skośny: komórki siatki cells^k o popularności wg prawa Zipfa (exponent)
+    - grid - regularna siatka (bez losowości)
+    - duplicates - punkty losowane ze zwracaniem z puli distinct punktów
+    Punkty losowane są blokami, z których każdy ma własne ziarno wyprowadzone
+    z seed, więc ten sam seed daje te same punkty niezależnie od chunk_size
+
+    :param count: liczba punktów
+    :param distribution: nazwa rozkładu
+    :param bounds: max zakres wartości każdej osi - symetryczny względem 0
+                   (liczba elementów = liczba wymiarów)
+    :param seed: ziarno losowania, None - losowe
+    :param chunk_size: liczba punktów w paczce
+    :param options: parametry rozkładów (clusters=8, spread=0.05, exponent=1.5,
+                    cells=64, distinct=1000)
+    :return: generator tablic numpy (chunk_size, k) - ostatnia paczka może być mniejsza
+    """
+    if np is None:
+        raise ImportError('numpy is required for streaming point generation')
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError('Unknown distribution: {}'.format(distribution))
+    unknown = set(options) - {'clusters', 'spread', 'exponent', 'cells', 'distinct'}
+    if unknown:
+        raise ValueError('Unknown distribution options: {}'.format(sorted(unknown)))
+    options = dict({'clusters': 8, 'spread': 0.05, 'exponent': 1.5, 'cells': 64,
+                    'distinct': 1000}, **options)
+    half = np.asarray(bounds, dtype=np.float64)
+    root = np.random.SeedSequence(seed)
+    model = _distribution_model(distribution, count, half, np.random.default_rng(root), options)
+    pending = []
+    pending_count = 0
+    for start in range(0, count, _BLOCK_SIZE):
+        size = min(_BLOCK_SIZE, count - start)
+        rng = np.random.default_rng(
+            np.random.SeedSequence(root.entropy, spawn_key=(start // _BLOCK_SIZE,)))
+        pending.append(_distribution_block(distribution, model, start, size, half, rng, options))
+        pending_count += size
+        if pending_count >= chunk_size:
+            points = np.concatenate(pending)
+            whole = pending_count - pending_count % chunk_size
+            for offset in range(0, whole, chunk_size):
+                yield points[offset:offset + chunk_size]
+            pending = [points[whole:]]
+            pending_count -= whole
+    if pending_count:
+        yield np.concatenate(pending)
+
+
+def write_points(path, count, distribution='uniform', bounds=(100, 100), seed=None,
+                 chunk_size=1 << 20, **options):
+    """Zapis strumieniowo generowanego zbioru punktów bezpośrednio do pliku .npy
+    W pamięci jest naraz tylko jedna paczka, a plik można potem wczytać bez kopiowania:
+    numpy.load(path, mmap_mode='r') i przekazać do kdtree.KDTree
+
+    :param path: ścieżka pliku .npy
+    :param count: liczba punktów
+    :param distribution: nazwa rozkładu (jak w generate_points)
+    :param bounds: max zakres wartości każdej osi
+    :param seed: ziarno losowania
+    :param chunk_size: liczba punktów w paczce
+    :param options: parametry rozkładów (jak w generate_points)
+    :return: None
+    """
+    if np is None:
+        raise ImportError('numpy is required for streaming point generation')
+    output = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64,
+                                       shape=(count, len(bounds)))
+    offset = 0
+    for chunk in generate_points(count, distribution, bounds, seed, chunk_size, **options):
+        output[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
+    output.flush()
+    del output
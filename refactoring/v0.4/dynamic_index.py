@@ -0,0 +1,256 @@
+"""Moduł zawierający dynamiczny indeks punktów zbudowany ze statycznych drzew KD
+(metoda logarytmiczna Bentleya-Saxe'a)
+
+"""
+
+import heapq
+import itertools
+
+import kdtree as kdt
+
+
+class DynamicKDTree:
+    """Klasa reprezentująca dynamiczny indeks punktów
+    Punkty przechowywane są w ciągu statycznych drzew KD - poziom i zawiera
+    drzewo z B*2^i punktami albo jest pusty (jak bity licznika binarnego)
+    - nowe punkty trafiają najpierw do małego bufora (B punktów) przeszukiwanego
+      liniowo, dzięki czemu nie budujemy osobnego drzewa dla każdego punktu
+    - pełny bufor łączony jest z kolejnymi zajętymi poziomami w jedno nowe drzewo
+      na pierwszym wolnym poziomie ("przeniesienie" w dodawaniu binarnym),
+      każdy punkt jest przebudowywany co najwyżej log N razy,
+      więc koszt zamortyzowany to O(log^2 N)
+    - zapytania są wykonywane na buforze i na każdym z co najwyżej log N drzew,
+      a wyniki łączone
+    Drzewa poziomów budowane są zwykłym, zbalansowanym konstruktorem KDTree
+    (z numpy - wektorowo)
+
+    """
+
+    def __init__(self, points=(), dimensions=None, buffer_size=64, **tree_options):
+        """Inicjalizacja indeksu
+
+        :param points: początkowy zbiór punktów (opcjonalnie)
+        :param dimensions: liczba wymiarów punktów, domyślnie wyznaczana z pierwszego punktu
+        :param buffer_size: rozmiar bufora nowych punktów (B)
+        :param tree_options: parametry przekazywane do konstruktora KDTree
+                             (np. subtree_counts, cell_bounds)
+        """
+        self.__dimensions = dimensions
+        self.__tree_options = tree_options
+        if buffer_size < 1:
+            raise ValueError('buffer_size must be positive, got {}'.format(buffer_size))
+        self.__buffer_size = buffer_size
+        self.__buffer = []
+        # poziomy indeksu - drzewo z 2^i punktami lub None
+        self.__levels = []
+        self.__point_count = 0
+        self.__version = 0
+        for point in points:
+            self.insert(point)
+
+    @property
+    def levels(self):
+        """Getter drzew niepustych poziomów
+
+        :return: lista par (poziom, drzewo), poziom i zawiera buffer_size*2^i punktów
+        """
+        return [(level, tree) for level, tree in enumerate(self.__levels) if tree is not None]
+
+    @property
+    def dimensions(self):
+        """Getter prywatnej zmiennej __dimensions
+
+        :return: liczba wymiarów punktów lub None, jeśli indeks jeszcze jej nie zna
+        """
+        return self.__dimensions
+
+    @property
+    def version(self):
+        """Getter prywatnej zmiennej __version
+        Licznik zwiększany przy każdej modyfikacji indeksu
+
+        :return: numer wersji indeksu
+        """
+        return self.__version
+
+    def __len__(self):
+        """Liczba punktów indeksu
+
+        :return: liczba punktów
+        """
+        return self.__point_count
+
+    def __points(self, tree):
+        """Punkty drzewa poziomu - tablica numpy (N, k) lub lista krotek bez numpy
+        Powtórzone punkty występują tyle razy, ile wynosi ich krotność
+
+        :param tree: drzewo KD
+        :return: punkty drzewa
+        """
+        multiplicity = tree.multiplicity
+        if kdt.np is None:
+            return [point for index, point in enumerate(tree.storage[0:len(tree.storage)])
+                    if point is not None
+                    for _ in range(1 if multiplicity is None else multiplicity[index])]
+        columns, mask = tree.storage.as_numpy()
+        points = kdt.np.stack(columns, axis=1)[mask]
+        if multiplicity is not None:
+            copies = kdt.np.frombuffer(multiplicity, dtype=kdt.np.uint32)[mask]
+            points = kdt.np.repeat(points, copies, axis=0)
+        return points
+
+    @staticmethod
+    def __contains(point, bottom_left, top_right):
+        """Sprawdzenie czy punkt należy do przedziału
+
+        :param point: punkt
+        :param bottom_left: dolny róg przedziału
+        :param top_right: górny róg przedziału
+        :return: True jeśli punkt należy do przedziału
+        """
+        return all(low <= coordinate <= high
+                   for low, coordinate, high in zip(bottom_left, point, top_right))
+
+    def insert(self, point):
+        """Wstawienie punktu do indeksu
+        Punkt trafia do bufora, a pełny bufor i zajęte poziomy 0, 1, ... są
+        budowane w jedno drzewo na pierwszym wolnym poziomie
+
+        :param point: wstawiany punkt
+        :return: None
+        """
+        if self.__dimensions is None:
+            self.__dimensions = len(point)
+        elif len(point) != self.__dimensions:
+            raise ValueError('Expected {:d}-dimensional point, got {}'.format(
+                self.__dimensions, point))
+        self.__buffer.append(tuple(point))
+        self.__point_count += 1
+        self.__version += 1
+        if len(self.__buffer) < self.__buffer_size:
+            return
+        carry = [self.__buffer]
+        self.__buffer = []
+        level = 0
+        while level < len(self.__levels) and self.__levels[level] is not None:
+            carry.append(self.__points(self.__levels[level]))
+            self.__levels[level] = None
+            level += 1
+        if level == len(self.__levels):
+            self.__levels.append(None)
+        if kdt.np is not None:
+            carry = kdt.np.concatenate(carry)
+        else:
+            carry = [point for part in carry for point in part]
+        if kdt.debug_level() >= 1:
+            kdt.LOGGER.log(kdt.LOG_LEVELS[1], 'Building level %d of %d points', level, len(carry))
+        self.__levels[level] = kdt.KDTree(carry, dimensions=self.__dimensions,
+                                          **self.__tree_options)
+
+    def remove(self, point):
+        """Usunięcie punktu z indeksu - z bufora lub z drzewa poziomu, które go zawiera
+
+        :param point: usuwany punkt
+        :return: None
+        """
+        point = tuple(point)
+        if point in self.__buffer:
+            self.__buffer.remove(point)
+            self.__point_count -= 1
+            self.__version += 1
+            return
+        for tree in self.__levels:
+            if tree is not None and tree.count_range(point, point) > 0:
+                tree.remove(point)
+                self.__point_count -= 1
+                self.__version += 1
+                return
+        raise ValueError('Point {} is not in the index'.format(point))
+
+    def search_range(self, bottom_left, top_right):
+        """Wyszukiwanie punktów należących do zadanego przedziału na wszystkich poziomach
+
+        :param bottom_left: dolny róg przedziału
+        :param top_right: górny róg przedziału
+        :return: punkty należące do przedziału
+        """
+        range_points = [point for point in self.__buffer
+                        if self.__contains(point, bottom_left, top_right)]
+        for tree in self.__levels:
+            if tree is not None:
+                range_points.extend(tree.search_range(bottom_left, top_right))
+        return range_points
+
+    def iter_range(self, bottom_left, top_right, limit=None):
+        """Leniwe wyszukiwanie punktów przedziału - najpierw bufor, potem kolejne poziomy
+        (KDTree.iter_range), bez budowania listy wyników
+        Modyfikacja indeksu (insert/remove) w trakcie iteracji powoduje RuntimeError
+        przy pobraniu kolejnego punktu (jak przy iteracji słownika)
+
+        :param bottom_left: dolny róg przedziału
+        :param top_right: górny róg przedziału
+        :param limit: największa liczba zwracanych punktów lub None (bez ograniczenia)
+        :return: iterator punktów należących do przedziału
+        """
+        if limit is not None and limit < 0:
+            raise ValueError('limit must be non-negative, got {}'.format(limit))
+        # wersja z chwili utworzenia iteratora - generator startuje dopiero przy next()
+        points = self.__iter_range(bottom_left, top_right, self.__version)
+        return points if limit is None else itertools.islice(points, limit)
+
+    def __iter_range(self, bottom_left, top_right, version):
+        """Generator punktów przedziału z bufora i kolejnych poziomów
+        Po każdym zwróconym punkcie porównywana jest wersja indeksu - insert może
+        zastąpić drzewa poziomów nowymi, więc dalsza iteracja byłaby niespójna
+
+        :param bottom_left: dolny róg przedziału
+        :param top_right: górny róg przedziału
+        :param version: wersja indeksu z chwili utworzenia iteratora
+        :return: generator punktów należących do przedziału
+        """
+        points = itertools.chain(
+            (point for point in self.__buffer if self.__contains(point, bottom_left, top_right)),
+            itertools.chain.from_iterable(tree.iter_range(bottom_left, top_right)
+                                          for tree in self.__levels if tree is not None))
+        for point in points:
+            yield point
+            if self.__version != version:
+                raise RuntimeError('DynamicKDTree changed during iteration')
+
+    def count_range(self, bottom_left, top_right):
+        """Zliczanie punktów należących do przedziału na wszystkich poziomach
+
+        :param bottom_left: dolny róg przedziału
+        :param top_right: górny róg przedziału
+        :return: liczba punktów należących do przedziału
+        """
+        return sum(1 for point in self.__buffer
+                   if self.__contains(point, bottom_left, top_right)) \
+            + sum(tree.count_range(bottom_left, top_right)
+                  for tree in self.__levels if tree is not None)
+
+    def knn(self, point, k):
+        """Wyszukiwanie k najbliższych sąsiadów punktu
+        Każdy poziom zwraca swoich k kandydatów, które razem z buforem
+        są kandydatami na k najbliższych
+
+        :param point: punkt, dla którego szukamy sąsiadów
+        :param k: liczba szukanych sąsiadów
+        :return: lista co najwyżej k punktów posortowana rosnąco po odległości
+        """
+        candidates = list(self.__buffer)
+        for tree in self.__levels:
+            if tree is not None:
+                candidates.extend(tree.knn(point, k))
+        return heapq.nsmallest(
+            k, candidates,
+            key=lambda candidate: sum((a - b) * (a - b) for a, b in zip(point, candidate)))
+
+    def nearest(self, point):
+        """Wyszukiwanie najbliższego punktu indeksu
+
+        :param point: punkt, dla którego szukamy sąsiada
+        :return: najbliższy punkt lub None dla pustego indeksu
+        """
+        result = self.knn(point, 1)
+        return result[0] if result else None
@@ -1,82 +1,891 @@
 """Moduł zawierający obsługę drzew KD."""
 
+import heapq
+import itertools
+import logging
+import math
+import mmap
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy jest opcjonalny - bez niego działa tylko budowanie z listy krotek
+    np = None
+
+from tree_storage import PointStorage
+
+# logger modułu - domyślnie nic nie wypisuje, konfiguracja należy do aplikacji
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+# mapowanie poziomów szczegółowości drzewa (0-5) na poziomy modułu logging
+# 0 - komunikaty o operacjach, 5 - pojedyncze porównania punktów; wszystkie
+# poziomy leżą na DEBUG lub niżej, bo każde zapytanie wypisuje co najmniej jeden
+LOG_LEVELS = (logging.DEBUG, logging.DEBUG - 1, logging.DEBUG - 2,
+              logging.DEBUG - 3, logging.DEBUG - 4, logging.DEBUG - 5)
+
+# tryby zapisu przebiegu wyszukiwania obszaru (parametr 'traversal')
+# NONE - tylko wynik, COUNTS - liczniki odwiedzonych/znalezionych węzłów,
+# POINTS - dodatkowo lista odwiedzonych węzłów (wizualizacja)
+TRAVERSAL_NONE = 0
+TRAVERSAL_POINTS = 1
+TRAVERSAL_COUNTS = 2
+
+# minimalna liczba punktów, od której budowanie z workers > 1 jest równoległe
+# (dla mniejszych zbiorów koszt uruchomienia procesów przewyższa zysk)
+PARALLEL_MIN_POINTS = 1 << 16
+
+# komunikat błędu iteratora przedziału po modyfikacji drzewa (KDTree.iter_range)
+_CHANGED_DURING_ITERATION = 'KDTree changed during iteration'
+
+# format pliku drzewa (KDTree.save / KDTree.load)
+# nagłówek: magic, wersja, liczba wymiarów, typ współrzędnych, flagi,
+# pojemność kubełka, rozmiar drzewa, liczba punktów
+_FILE_MAGIC = b'KDTR'
+_FILE_VERSION = 1
+_FILE_HEADER = struct.Struct('<4sHHcBI2xQQ')
+# flagi opcjonalnych sekcji pliku
+_FILE_COUNTS = 1
+_FILE_CELLS = 2
+_FILE_EXTENT = 4
+_FILE_MULTIPLICITY = 8
+_FILE_FLAGS = _FILE_COUNTS | _FILE_CELLS | _FILE_EXTENT | _FILE_MULTIPLICITY
+
+
+def debug_level():
+    """Zwraca najwyższy aktualnie włączony poziom szczegółowości logów drzewa
+    Wynik jest sprawdzany raz na operację, dzięki czemu wyłączone logowanie
+    kosztuje w pętlach tylko porównanie dwóch liczb
+
+    :return: poziom z zakresu 0-5 lub -1, jeśli logowanie jest wyłączone
+    """
+    for level in range(len(LOG_LEVELS) - 1, -1, -1):
+        if LOGGER.isEnabledFor(LOG_LEVELS[level]):
+            return level
+    return -1
+
+
+def configure_logging(level, stream=None):
+    """Konfiguracja wypisywania logów drzewa (odpowiednik dawnego DEBUG_LEVEL)
+
+    :param level: poziom szczegółowości 0-5, None lub -1 wyłącza logowanie
+    :param stream: strumień wyjściowy, domyślnie sys.stdout
+    :return: None
+    """
+    if level is None or level < 0:
+        LOGGER.setLevel(logging.WARNING)
+        return
+    LOGGER.setLevel(LOG_LEVELS[min(level, len(LOG_LEVELS) - 1)])
+    if not any(isinstance(handler, logging.StreamHandler) for handler in LOGGER.handlers):
+        handler = logging.StreamHandler(sys.stdout if stream is None else stream)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        LOGGER.addHandler(handler)
+        # własny handler - bez przekazywania do loggera głównego (podwójne linie)
+        LOGGER.propagate = False
+
+
+def _storage_size(tree_size, leaf_size=1):
+    """Liczba miejsc na punkty: węzły drzewa i kubełki (tree_size + 1 kubełków
+    - dzieci ostatniego poziomu węzłów)
+
+    :param tree_size: rozmiar tablicy węzłów
+    :param leaf_size: pojemność kubełka
+    :return: liczba miejsc
+    """
+    if leaf_size > 1:
+        return tree_size + (tree_size + 1) * leaf_size
+    return tree_size
+
+
+def _tree_size(point_count, leaf_size=1):
+    """Rozmiar tablicy węzłów (2^h - 1) zbalansowanego drzewa dla zadanej liczby punktów
+    - bez kubełków: najmniejsza tablica, która pomieści wszystkie punkty
+    - z kubełkami (leaf_size > 1): najmniejsza tablica węzłów wewnętrznych (co najmniej
+      korzeń), która razem z 2^h kubełkami po leaf_size miejsc pomieści wszystkie punkty
+
+    :param point_count: liczba punktów
+    :param leaf_size: pojemność kubełka
+    :return: rozmiar tablicy węzłów
+    """
+    size = 1
+    if leaf_size > 1:
+        while size + (size + 1) * leaf_size < point_count:
+            size = size*2+1
+        return size
+    while size <= point_count:
+        size *= 2
+    return size - 1
+
+
+def _presort(points, axis, rows=None):
+    """Indeksy punktów posortowane w zadanej osi (porządek leksykograficzny
+    współrzędnych a, a+1, ..., a-1, przy równych punktach rosnące indeksy)
+
+    :param points: tablica numpy (N, k) współrzędnych punktów
+    :param axis: oś sortowania
+    :param rows: rosnące indeksy sortowanych punktów lub None (wszystkie punkty)
+    :return: tablica indeksów punktów
+    """
+    dimensions = points.shape[1]
+    selected = points if rows is None else points[rows]
+    # lexsort traktuje ostatni klucz jako główny
+    order = np.lexsort([selected[:, (axis + shift) % dimensions]
+                        for shift in range(dimensions - 1, -1, -1)])
+    return order if rows is None else rows[order]
+
+
+def _collapse_duplicates(points, orders):
+    """Zwinięcie powtórzonych punktów do jednego reprezentanta z krotnością
+    Równe punkty sąsiadują ze sobą w porządku każdej osi, a lexsort jest stabilny,
+    więc w każdej tablicy indeksów pierwszy z grupy to ten sam punkt
+    (o najmniejszym indeksie) - pozostałe są usuwane w czasie liniowym
+
+    :param points: tablica numpy (N, k) współrzędnych punktów
+    :param orders: indeksy punktów posortowane w kolejnych osiach
+    :return: krotka (tablice indeksów bez powtórzeń, krotności punktów - tablica N liczb,
+             0 dla usuniętych powtórzeń) lub (orders, None), jeśli powtórzeń nie ma
+    """
+    first = orders[0]
+    same = (points[first[1:]] == points[first[:-1]]).all(axis=1)
+    if not same.any():
+        return orders, None
+    group_starts = np.flatnonzero(np.concatenate(([True], ~same)))
+    weights = np.zeros(len(points), dtype=np.intp)
+    weights[first[group_starts]] = np.diff(np.append(group_starts, len(first)))
+    return [order[weights[order] > 0] for order in orders], weights
+
+
+def _split_levels(points, sorted_points, outputs, frontier, tree_level, stop_level=None):
+    """Podział segmentów poziom po poziomie (część wspólna _median_split
+    i budowania równoległego)
+    Każdy segment opisuje jedno poddrzewo, segmenty są rozłączne we wszystkich
+    tablicach indeksów i w tablicy drzewa, więc rozłączne zbiory segmentów
+    mogą być dzielone niezależnie (także w osobnych procesach)
+
+    :param points: tablica numpy (N, k) współrzędnych punktów
+    :param sorted_points: krotka (indeksy posortowane w kolejnych osiach, rangi w tych osiach,
+                          krotności punktów lub None) - tablice indeksów są przestawiane
+                          w miejscu
+    :param outputs: krotka (indeksy punktów węzłów, liczności poddrzew, komórki lub None)
+                    - wypełniana w miejscu
+    :param frontier: krotka tablic (początki, końce, węzły, dolne i górne granice komórek
+                     - None, jeśli komórki nie są wyznaczane)
+    :param tree_level: poziom drzewa segmentów
+    :param stop_level: poziom, na którym przerywamy podział (None - do końca)
+    :return: segmenty poziomu stop_level w postaci frontier
+    """
+    dimensions = points.shape[1]
+    orders, ranks, weights = sorted_points
+    slots, counts, bounds = outputs
+    starts, ends, nodes, cell_low, cell_high = frontier
+    cells = bounds is not None
+    while len(nodes) > 0 and tree_level != stop_level:
+        axis = tree_level % dimensions
+        lengths = ends - starts
+        mids = starts + lengths // 2
+        medians = orders[axis][mids]
+        slots[nodes] = medians
+        if cells:
+            bounds[0][nodes] = cell_low
+            bounds[1][nodes] = cell_high
+        # pozycje wszystkich elementów segmentów i numer segmentu każdego z nich
+        segment = np.repeat(np.arange(len(nodes)), lengths)
+        positions = np.arange(len(segment)) + np.repeat(starts - np.cumsum(lengths) + lengths,
+                                                        lengths)
+        if weights is None:
+            counts[nodes] = lengths
+        else:
+            # liczność poddrzewa to suma krotności jego punktów
+            counts[nodes] = np.bincount(segment, weights=weights[orders[axis][positions]],
+                                        minlength=len(nodes))
+        # stabilny podział pozostałych osi na elementy mniejsze, medianę i większe
+        # w czasie O(N): liczności części znamy z położenia mediany (mid - start,
+        # 1, end - mid - 1), a pozycja elementu w jego części to liczba wcześniejszych
+        # elementów tej części (skumulowana suma maski minus suma poprzednich segmentów)
+        median_ranks = ranks[axis][medians][segment]
+        lower = mids - starts
+        upper = ends - mids - 1
+        lower_shift = (starts - np.cumsum(lower) + lower)[segment]
+        upper_shift = (mids + 1 - np.cumsum(upper) + upper)[segment]
+        median_positions = mids[segment]
+        for other in range(dimensions):
+            if other == axis:
+                continue
+            secondary = orders[other]
+            values = secondary[positions]
+            side = ranks[axis][values] - median_ranks
+            smaller = side < 0
+            larger = side > 0
+            target = np.where(smaller, lower_shift + np.cumsum(smaller) - smaller,
+                              median_positions)
+            target = np.where(larger, upper_shift + np.cumsum(larger) - larger, target)
+            secondary[target] = values
+        # segmenty dzieci w kolejności rosnących początków (lewe, prawe)
+        child_starts = np.stack((starts, mids + 1), axis=1).ravel()
+        child_ends = np.stack((mids, ends), axis=1).ravel()
+        child_nodes = np.stack((2 * nodes + 1, 2 * nodes + 2), axis=1).ravel()
+        keep = child_ends > child_starts
+        starts, ends, nodes = child_starts[keep], child_ends[keep], child_nodes[keep]
+        if cells:
+            # komórki dzieci - komórka rodzica przecięta płaszczyzną podziału
+            split_high = cell_high.copy()
+            split_high[:, axis] = points[medians, axis]
+            split_low = cell_low.copy()
+            split_low[:, axis] = points[medians, axis]
+            cell_low = np.stack((cell_low, split_low), axis=1).reshape(-1, dimensions)[keep]
+            cell_high = np.stack((split_high, cell_high), axis=1).reshape(-1, dimensions)[keep]
+        tree_level += 1
+    if not cells:
+        return starts, ends, nodes, None, None
+    return starts, ends, nodes, cell_low, cell_high
+
+
+def _fill_leaves(orders, slots, frontier, tree_size, leaf_size):
+    """Zapisanie segmentów poziomu kubełków w ich miejscach tablicy drzewa
+    Kubełek węzła i (i >= tree_size) zajmuje miejsca od tree_size + (i - tree_size) * leaf_size,
+    punkty kubełka są w porządku osi poziomu kubełków (jak w KDTree.__make_split)
+
+    :param orders: indeksy punktów posortowane w kolejnych osiach
+    :param slots: indeksy punktów w kolejnych miejscach drzewa - wypełniana w miejscu
+    :param frontier: segmenty poziomu kubełków (jak w _split_levels)
+    :param tree_size: rozmiar tablicy węzłów wewnętrznych
+    :param leaf_size: pojemność kubełka
+    :return: None
+    """
+    starts, ends, nodes = frontier[:3]
+    lengths = ends - starts
+    # przesunięcie każdego elementu w jego segmencie
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    first = tree_size + (nodes - tree_size) * leaf_size
+    order = orders[tree_size.bit_length() % len(orders)]
+    slots[np.repeat(first, lengths) + offsets] = order[np.repeat(starts, lengths) + offsets]
+
+
+def _median_split(points, cells=False, leaf_size=1, collapse=True):
+    """Wektorowe budowanie drzewa (numpy) - poziom po poziomie zamiast rekurencji
+    Daje dokładnie ten sam układ kopca co KDTree.__make_split:
+    - kolejność punktów w osi a to kolejność leksykograficzna współrzędnych
+      (a, a+1, ..., a-1) wyznaczona raz przez lexsort, dalej porównywane
+      są tylko rangi punktów
+    - każde poddrzewo to ciągły segment we wszystkich tablicach indeksów,
+      mediana segmentu zostaje na swoim miejscu, więc segmenty dzieci
+      to [start, mid) oraz [mid+1, end)
+    - tablica osi podziału jest już posortowana, tablice pozostałych osi dzielimy
+      stabilnie maską porównań z rangą mediany (podział trójdzielny w czasie O(N)
+      na oś i poziom, bez sortowania)
+    - komórki węzłów (opcjonalnie) są przenoszone poziomami tak jak segmenty
+    - powtórzone punkty są zwijane po sortowaniu (_collapse_duplicates),
+      każdy zajmuje jeden węzeł, a liczności poddrzew uwzględniają krotności
+    - rozmiar drzewa wynika z liczby różnych punktów (_tree_size)
+    - z kubełkami (leaf_size > 1) podział kończy się na poziomie kubełków,
+      a ich segmenty są zapisywane w miejscach za tablicą węzłów (_fill_leaves)
+
+    :param points: tablica numpy (N, k) współrzędnych punktów
+    :param cells: czy wyznaczyć komórki węzłów
+    :param leaf_size: pojemność kubełka (1 - bez kubełków)
+    :param collapse: czy zwijać powtórzone punkty (False - każdy punkt w osobnym miejscu)
+    :return: krotka: indeksy punktów w kolejnych miejscach drzewa (-1 = puste miejsce,
+             najpierw węzły, potem kubełki), liczności poddrzew zaczepionych w węzłach
+             (długość tablicy to rozmiar drzewa), komórki węzłów (para tablic (rozmiar, k)
+             dolnych i górnych granic) lub None oraz krotności punktów (tablica N liczb)
+             lub None, jeśli punkty się nie powtarzają
+    """
+    count, dimensions = points.shape
+    orders, weights = [], None
+    if count > 0:
+        # indeksy punktów posortowane w każdej osi oraz odwrotne permutacje (rangi)
+        orders = [_presort(points, axis) for axis in range(dimensions)]
+        if collapse:
+            orders, weights = _collapse_duplicates(points, orders)
+    unique = len(orders[0]) if count > 0 else 0
+    tree_size = _tree_size(unique, leaf_size)
+    slots = np.full(_storage_size(tree_size, leaf_size), -1, dtype=np.intp)
+    counts = np.zeros(tree_size, dtype=np.intp)
+    bounds = None
+    if cells:
+        bounds = (np.full((tree_size, dimensions), -np.inf),
+                  np.full((tree_size, dimensions), np.inf))
+    if count == 0:
+        return slots, counts, bounds, None
+    ranks = []
+    for order in orders:
+        rank = np.empty(count, dtype=np.intp)
+        rank[order] = np.arange(unique)
+        ranks.append(rank)
+    # segment korzenia: początek, koniec, indeks węzła w drzewie i komórka
+    frontier = (np.zeros(1, dtype=np.intp), np.full(1, unique, dtype=np.intp),
+                np.zeros(1, dtype=np.intp), np.full((1, dimensions), -np.inf),
+                np.full((1, dimensions), np.inf))
+    if leaf_size > 1:
+        frontier = _split_levels(points, (orders, ranks, weights), (slots, counts, bounds),
+                                 frontier, 0, tree_size.bit_length())
+        _fill_leaves(orders, slots, frontier, tree_size, leaf_size)
+    else:
+        _split_levels(points, (orders, ranks, weights), (slots, counts, bounds), frontier, 0)
+    return slots, counts, bounds, weights
+
+
+def _shared_array(blocks, shape, dtype):
+    """Tablica numpy w nowym bloku pamięci współdzielonej
+
+    :param blocks: lista bloków, do której dopisywany jest nowy blok (do zwolnienia)
+    :param shape: kształt tablicy
+    :param dtype: typ elementów
+    :return: krotka (tablica, opis bloku (nazwa, kształt, typ) dla procesów roboczych)
+    """
+    dtype = np.dtype(dtype)
+    memory = shared_memory.SharedMemory(
+        create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+    blocks.append(memory)
+    return np.ndarray(shape, dtype=dtype, buffer=memory.buf), (memory.name, shape, dtype.str)
+
+
+def _attach_arrays(specs):
+    """Podłączenie procesu roboczego do tablic w pamięci współdzielonej
+
+    :param specs: słownik opisów bloków (nazwa, kształt, typ)
+    :return: krotka (lista bloków do zamknięcia, słownik tablic)
+    """
+    blocks = []
+    arrays = {}
+    for key, (name, shape, dtype) in specs.items():
+        memory = shared_memory.SharedMemory(name=name)
+        blocks.append(memory)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+    return blocks, arrays
+
+
+def _chunks(count, parts):
+    """Granice podziału zakresu indeksów na prawie równe, ciągłe części
+
+    :param count: długość zakresu
+    :param parts: liczba części
+    :return: lista par (początek, koniec)
+    """
+    return [(count * part // parts, count * (part + 1) // parts) for part in range(parts)]
+
+
+def _detach(blocks, arrays):
+    """Odłączenie procesu roboczego od pamięci współdzielonej
+
+    :param blocks: bloki zwrócone przez _attach_arrays
+    :param arrays: tablice zwrócone przez _attach_arrays
+    :return: None
+    """
+    arrays.clear()
+    for memory in blocks:
+        memory.close()
+
+
+def _bucket_worker(specs, axis, chunk, splitters):
+    """Zadanie procesu roboczego: pierwszy krok sortowania próbkowego osi
+    Indeksy fragmentu punktów są stabilnie grupowane według przedziałów
+    wartości osi wyznaczonych przez splitters i zapisywane w tablicy rang
+    (używanej tu jako bufor, rangi są wyznaczane dopiero po sortowaniu)
+
+    :param specs: opisy tablic w pamięci współdzielonej
+    :param axis: oś sortowania
+    :param chunk: fragment punktów (początek, koniec)
+    :param splitters: rosnące wartości osi rozdzielające przedziały
+    :return: liczności kolejnych przedziałów we fragmencie
+    """
+    blocks, arrays = _attach_arrays(specs)
+    start, end = chunk
+    buckets = np.searchsorted(splitters, arrays['points'][start:end, axis], side='right')
+    arrays['ranks'][axis][start:end] = start + np.argsort(buckets, kind='stable')
+    _detach(blocks, arrays)
+    return np.bincount(buckets, minlength=len(splitters) + 1)
+
+
+def _sort_worker(specs, axis, pieces, start):
+    """Zadanie procesu roboczego: drugi krok sortowania próbkowego osi
+    Przedział wartości osi składa się z kawałków kolejnych fragmentów (indeksy
+    rosnące), jego posortowane indeksy trafiają od pozycji start tablicy osi -
+    przedziały są uporządkowane, więc razem dają ten sam porządek co _presort
+
+    :param specs: opisy tablic w pamięci współdzielonej
+    :param axis: oś sortowania
+    :param pieces: kawałki przedziału w buforze rang - pary (początek, koniec)
+    :param start: pozycja przedziału w posortowanej tablicy osi
+    :return: None
+    """
+    blocks, arrays = _attach_arrays(specs)
+    rows = np.concatenate([arrays['ranks'][axis][first:last] for first, last in pieces])
+    arrays['orders'][axis][start:start + len(rows)] = _presort(arrays['points'], axis, rows)
+    _detach(blocks, arrays)
+
+
+def _duplicate_worker(specs, chunk):
+    """Zadanie procesu roboczego: sprawdzenie, czy fragment porządku pierwszej osi
+    zawiera punkt równy poprzedniemu (równe punkty sąsiadują ze sobą)
+
+    :param specs: opisy tablic w pamięci współdzielonej
+    :param chunk: fragment pozycji (początek, koniec)
+    :return: True, jeśli we fragmencie jest powtórzony punkt
+    """
+    blocks, arrays = _attach_arrays(specs)
+    start, end = chunk
+    order = arrays['orders'][0][max(start - 1, 0):end]
+    points = arrays['points'][order]
+    found = bool((points[1:] == points[:-1]).all(axis=1).any())
+    del order, points
+    _detach(blocks, arrays)
+    return found
+
+
+def _rank_worker(specs, axis, chunk):
+    """Zadanie procesu roboczego: rangi punktów fragmentu tablicy osi
+
+    :param specs: opisy tablic w pamięci współdzielonej
+    :param axis: oś
+    :param chunk: fragment pozycji (początek, koniec)
+    :return: None
+    """
+    blocks, arrays = _attach_arrays(specs)
+    start, end = chunk
+    arrays['ranks'][axis][arrays['orders'][axis][start:end]] = np.arange(start, end)
+    _detach(blocks, arrays)
+
+
+def _parallel_presort(pool, specs, points, workers):
+    """Równoległe sortowanie indeksów punktów we wszystkich osiach (sortowanie
+    próbkowe) - wynik jak _presort dla kolejnych osi
+    - z próbki wartości osi wybierane są granice workers przedziałów
+    - procesy grupują swoje fragmenty punktów według przedziałów (_bucket_worker)
+    - każdy przedział jest sortowany w osobnym procesie i zapisywany w swoim
+      miejscu tablicy osi (_sort_worker)
+    Wiele równych wartości osi trafia do jednego przedziału, więc przy dużej
+    liczbie powtórzeń podział pracy jest nierówny (wynik pozostaje poprawny)
+
+    :param pool: pula procesów
+    :param specs: opisy tablic w pamięci współdzielonej (points, orders, ranks)
+    :param points: tablica numpy (N, k) współrzędnych punktów
+    :param workers: liczba procesów
+    :return: None
+    """
+    count, dimensions = points.shape
+    chunks = _chunks(count, workers)
+    step = max(1, count // (workers * 256))
+    splitters = []
+    for axis in range(dimensions):
+        sample = np.sort(points[::step, axis])
+        splitters.append(np.unique(sample[[len(sample) * part // workers
+                                           for part in range(1, workers)]]))
+    tasks = [(axis, chunk) for axis in range(dimensions) for chunk in chunks]
+    sizes = list(pool.map(_bucket_worker, [specs] * len(tasks),
+                          [axis for axis, _ in tasks], [chunk for _, chunk in tasks],
+                          [splitters[axis] for axis, _ in tasks]))
+    axes, pieces, starts = [], [], []
+    for axis in range(dimensions):
+        # liczności przedziałów (kolumny) w kolejnych fragmentach (wiersze)
+        table = np.array(sizes[axis * workers:(axis + 1) * workers])
+        firsts = np.array([chunk[0] for chunk in chunks])[:, None] \
+            + np.cumsum(table, axis=1) - table
+        outputs = np.cumsum(table.sum(axis=0)) - table.sum(axis=0)
+        for bucket in range(table.shape[1]):
+            axes.append(axis)
+            pieces.append([(first, first + size) for first, size
+                           in zip(firsts[:, bucket].tolist(), table[:, bucket].tolist())])
+            starts.append(int(outputs[bucket]))
+    list(pool.map(_sort_worker, [specs] * len(axes), axes, pieces, starts))
+
+
+def _split_worker(specs, frontier, tree_level, leaf_size):
+    """Zadanie procesu roboczego: zbudowanie poddrzew zadanych segmentów
+    Segmenty są rozłączne z segmentami innych zadań, więc procesy zapisują
+    do wspólnych tablic bez synchronizacji
+
+    :param specs: opisy tablic w pamięci współdzielonej
+    :param frontier: segmenty poddrzew (jak w _split_levels)
+    :param tree_level: poziom drzewa segmentów
+    :param leaf_size: pojemność kubełka (1 - bez kubełków)
+    :return: None
+    """
+    blocks, arrays = _attach_arrays(specs)
+    bounds = arrays.get('bounds')
+    tree_size = len(arrays['counts'])
+    frontier = _split_levels(
+        arrays['points'], (arrays['orders'], arrays['ranks'], arrays.get('weights')),
+        (arrays['slots'], arrays['counts'], bounds), frontier, tree_level,
+        tree_size.bit_length() if leaf_size > 1 else None)
+    if leaf_size > 1:
+        _fill_leaves(arrays['orders'], arrays['slots'], frontier, tree_size, leaf_size)
+    bounds = None
+    _detach(blocks, arrays)
+
+
+def _parallel_median_split(points, cells, workers, leaf_size=1):
+    """Równoległa wersja _median_split (ten sam układ kopca)
+    - punkty, tablice indeksów, rang i wyniki leżą w pamięci współdzielonej
+      (multiprocessing.shared_memory), procesy nie kopiują danych
+    - sortowanie we wszystkich osiach jest próbkowe (_parallel_presort), po workers
+      zadań na oś, a wyszukiwanie powtórzeń i rangi - po fragmentach tablic
+    - górne poziomy drzewa (do głębokości, na której segmentów jest co najmniej
+      tyle co procesów) dzielimy w procesie głównym, a poddrzewa poniżej
+      są rozdzielane po równo między procesy ProcessPoolExecutor
+      i zapisywane bezpośrednio w swoich miejscach tablicy drzewa
+    W procesie głównym zostają: kopiowanie punktów i wyników między pamięcią
+    współdzieloną a zwykłą, górne poziomy podziału i zwijanie powtórzeń (tylko gdy
+    występują) - dla 2M punktów około 1-1.4 s czasu procesora przy 5.8 s (2D)
+    i 9.6 s (3D) budowania sekwencyjnego, co ogranicza przyspieszenie do około 4x
+
+    :param points: tablica numpy (N, k) współrzędnych punktów
+    :param cells: czy wyznaczyć komórki węzłów
+    :param workers: liczba procesów
+    :param leaf_size: pojemność kubełka (1 - bez kubełków)
+    :return: krotka jak w _median_split
+    """
+    count, dimensions = points.shape
+    if count == 0:
+        return _median_split(points, cells, leaf_size)
+    blocks = []
+    try:
+        specs = {}
+        shared_points, specs['points'] = _shared_array(blocks, points.shape, np.float64)
+        shared_points[:] = points
+        orders, specs['orders'] = _shared_array(blocks, (dimensions, count), np.intp)
+        ranks, specs['ranks'] = _shared_array(blocks, (dimensions, count), np.intp)
+        with ProcessPoolExecutor(workers) as pool:
+            _parallel_presort(pool, specs, shared_points, workers)
+            chunks = _chunks(count, workers)
+            unique, weights, shared_weights = count, None, None
+            if any(pool.map(_duplicate_worker, [specs] * workers, chunks)):
+                unique_orders, weights = _collapse_duplicates(shared_points, orders)
+                unique = len(unique_orders[0])
+                # indeksy bez powtórzeń na początku tablic - dalej używane są tylko one
+                for axis in range(dimensions):
+                    orders[axis][:unique] = unique_orders[axis]
+                shared_weights, specs['weights'] = _shared_array(blocks, (count,), np.intp)
+                shared_weights[:] = weights
+                del unique_orders
+                chunks = _chunks(unique, workers)
+            tasks = [(axis, chunk) for axis in range(dimensions) for chunk in chunks]
+            list(pool.map(_rank_worker, [specs] * len(tasks), [axis for axis, _ in tasks],
+                          [chunk for _, chunk in tasks]))
+            # tablice wyników - rozmiar drzewa wynika z liczby różnych punktów
+            tree_size = _tree_size(unique, leaf_size)
+            slots, specs['slots'] = _shared_array(
+                blocks, (_storage_size(tree_size, leaf_size),), np.intp)
+            slots.fill(-1)
+            counts, specs['counts'] = _shared_array(blocks, (tree_size,), np.intp)
+            counts.fill(0)
+            bounds = None
+            if cells:
+                bounds, specs['bounds'] = _shared_array(blocks, (2, tree_size, dimensions),
+                                                        np.float64)
+                bounds[0].fill(-np.inf)
+                bounds[1].fill(np.inf)
+            # głębokość podziału - co najmniej jeden segment na proces
+            # (z kubełkami nie głębiej niż poziom kubełków)
+            split_level = (workers - 1).bit_length()
+            if leaf_size > 1:
+                split_level = min(split_level, tree_size.bit_length())
+            frontier = (np.zeros(1, dtype=np.intp), np.full(1, unique, dtype=np.intp),
+                        np.zeros(1, dtype=np.intp), np.full((1, dimensions), -np.inf),
+                        np.full((1, dimensions), np.inf))
+            frontier = _split_levels(shared_points, (orders, ranks, shared_weights),
+                                     (slots, counts, bounds), frontier, 0, split_level)
+            tasks = np.array_split(np.arange(len(frontier[2])), workers)
+            list(pool.map(_split_worker, [specs] * len(tasks),
+                          [tuple(None if part is None else part[task] for part in frontier)
+                           for task in tasks],
+                          [split_level] * len(tasks), [leaf_size] * len(tasks)))
+        result = (slots.copy(), counts.copy(),
+                  None if bounds is None else (bounds[0].copy(), bounds[1].copy()), weights)
+        del shared_points, orders, ranks, slots, counts, bounds, shared_weights
+        return result
+    finally:
+        for memory in blocks:
+            try:
+                memory.close()
+            except BufferError:
+                # tablice nadal wskazują na blok (przerwana budowa) - zwolni go unlink
+                pass
+            memory.unlink()
+
+
+def _batch_range_search(columns, mask, lows, highs, tree_size=None, leaf_size=1, rows=None):
+    """Wektorowe wyszukiwanie wielu obszarów naraz (numpy)
+    Przechodzi drzewo poziomami, trzymając całą "granicę" przeszukiwania
+    jako pary (numer zapytania, indeks węzła) - jeden poziom drzewa to kilka
+    operacji numpy na wszystkich parach, zamiast wywołań Pythona na węzeł
+    Pary wskazujące kubełki są rozwijane na wszystkie miejsca kubełka
+    i sprawdzane jedną maską
+    Dla drzewa indeksów (rows) współrzędne są pobierane z kolumn punktów
+    przez indeksy wierszy zapisane w miejscach drzewa
+
+    :param columns: kolumny współrzędnych miejsc drzewa (po jednej tablicy numpy na wymiar)
+                    lub kolumny tablicy punktów, jeśli podano rows
+    :param mask: maska bool zajętych miejsc (None, jeśli podano rows)
+    :param lows: tablica (Q, wymiary) lewych dolnych rogów obszarów
+    :param highs: tablica (Q, wymiary) prawych górnych rogów obszarów
+    :param tree_size: rozmiar tablicy węzłów (domyślnie wszystkie miejsca to węzły)
+    :param leaf_size: pojemność kubełka (1 - bez kubełków)
+    :param rows: indeksy wierszy punktów w kolejnych miejscach drzewa (-1 = puste miejsce)
+                 lub None
+    :return: krotka tablic (numery zapytań, indeksy miejsc) wszystkich trafień
+    """
+    size = len(mask) if tree_size is None else tree_size
+    dimensions = len(columns)
+    found_queries = []
+    found_nodes = []
+    root = size > 0 and (mask[0] if rows is None else rows[0] >= 0)
+    queries = np.arange(len(lows) if root else 0, dtype=np.intp)
+    nodes = np.zeros(len(queries), dtype=np.intp)
+    depth = 0
+    while len(nodes) > 0:
+        if leaf_size > 1:
+            # kubełki - wszystkie zajęte miejsca porównywane we wszystkich osiach
+            leaves = nodes >= size
+            slots = (size + (nodes[leaves] - size) * leaf_size)[:, None] + np.arange(leaf_size)
+            slots = slots.ravel()
+            leaf_queries = np.repeat(queries[leaves], leaf_size)
+            keep = mask[slots] if rows is None else rows[slots] >= 0
+            slots, leaf_queries = slots[keep], leaf_queries[keep]
+            at = slots if rows is None else rows[slots]
+            inside = np.ones(len(slots), dtype=bool)
+            for axis in range(dimensions):
+                coordinates = columns[axis][at]
+                inside &= (lows[leaf_queries, axis] <= coordinates) \
+                    & (coordinates <= highs[leaf_queries, axis])
+            found_queries.append(leaf_queries[inside])
+            found_nodes.append(slots[inside])
+            queries, nodes = queries[~leaves], nodes[~leaves]
+        axis = depth % dimensions
+        at = nodes if rows is None else rows[nodes]
+        coordinates = [column[at] for column in columns]
+        # zejście w lewo/prawo - te same warunki co w wyszukiwaniu pojedynczym
+        go_left = lows[queries, axis] <= coordinates[axis]
+        go_right = highs[queries, axis] >= coordinates[axis]
+        inside = go_left & go_right
+        for other in range(dimensions):
+            if other != axis:
+                inside &= (lows[queries, other] <= coordinates[other]) \
+                    & (coordinates[other] <= highs[queries, other])
+        found_queries.append(queries[inside])
+        found_nodes.append(nodes[inside])
+        # kolejny poziom - tylko istniejące i zajęte węzły
+        queries = np.concatenate((queries[go_left], queries[go_right]))
+        nodes = np.concatenate((2 * nodes[go_left] + 1, 2 * nodes[go_right] + 2))
+        # istniejące i zajęte węzły oraz (z kubełkami) dzieci ostatniego poziomu
+        inner = nodes < size
+        keep = np.zeros(len(nodes), dtype=bool)
+        keep[inner] = mask[nodes[inner]] if rows is None else rows[nodes[inner]] >= 0
+        if leaf_size > 1:
+            keep |= ~inner
+        queries, nodes = queries[keep], nodes[keep]
+        depth += 1
+    if not found_nodes:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    return np.concatenate(found_queries), np.concatenate(found_nodes)
+
 
 class KDTree:
     """Klasa reprezentująca drzewo KD.
 
     Pozwala budować i wyszukiwać punkty w drzewie.
+    Po zbudowaniu drzewo nie jest modyfikowane przez zapytania,
+    więc może być współdzielone między wątkami bez blokad.
     """
 
-    # Domyślny poziom debugu - można zmieniac w trakcie używania klasy
-    DEBUG_LEVEL = 4
-
     @staticmethod
-    def __logger(level, indent, text):
+    def __log(level, indent, message, *args):
         """Funkcja usprawniająca logowanie
-        Pozwala na wygodniejsze wyświetlanie informacji
-        oraz na dynamiczną zmianę poziomu logowania
+        Formatowanie komunikatu odbywa się leniwie w module logging,
+        miejsca wywołań powinny być dodatkowo chronione sprawdzeniem poziomu
 
-        :param level: poziom informacji do zalogowania - pozwala na wybiórcze blokowanie danych
+        :param level: poziom informacji do zalogowania (0-5)
         :param indent: poziom wcięcia - pozwala polepszyć logi wizualnie
-        :param text: tekst do wyświetlenia
+        :param message: szablon komunikatu w stylu '%s'
+        :param args: argumenty szablonu
         :return: None
         """
+        LOGGER.log(LOG_LEVELS[level], '%s' + message, '  ' * indent, *args)
 
-        if level <= KDTree.DEBUG_LEVEL:
-            print('{}{}'.format(('  ' * indent), text))
-
-    def __init__(self, points):
+    def __init__(self, points, subtree_counts=False, cell_bounds=False, dimensions=None,
+                 alpha=0.75, workers=None, leaf_size=1):
         """Inicjalizacja i tworzenie drzewa na podstawie podanych punktów
         Drzewo jest prawidłowo zbalansowane, na każdym poziomie rekurencji
-        wybierane są miediany z osi X lub Y
-        Złożoność czasowa to O(N log N):
-        - na początku sortowanie O(N log N)
-        - potem rekurencyjne tworzenie drzewa o log N poziomach, każda operacja
-          podziału jest przeprowadzana w czasie liniowym - proporcjonalnym
-          do rozmiaru przekazanego poddrzewa
-        Złożoność pamięciowa to O(N):
+        wybierane są miediany kolejnej osi (poziom % liczba wymiarów)
+        Złożoność czasowa to O(k^2 N log N):
+        - na początku sortowanie indeksów punktów w każdej z k osi kluczem
+          k współrzędnych - O(k N log N) na oś (lexsort wykonuje k sortowań,
+          porównania krotek zwykle rozstrzyga pierwsza współrzędna)
+        - potem tworzenie drzewa o log N poziomach, każda operacja podziału
+          jest przeprowadzana w czasie liniowym - proporcjonalnym do rozmiaru
+          przekazanego poddrzewa (po jednym przejściu na oś), razem O(k N log N)
+        Złożoność pamięciowa to O(k N):
         - 1*N - wejściowa tablica punktów
-        - 2*N - tablice posortowane po X i Y
+        - k*N - tablice indeksów posortowanych w kolejnych osiach i ich rangi
         - w trakcie rekurencji tworzone są sortowane podtablice o łącznej
           wielkości, która nigdy nie przekracza wartości
-          2xN (1 + 1/2 + 1/4 + 1/8 -> lim = 2)
+          kxN (1 + 1/2 + 1/4 + 1/8 -> lim = 2)
         - wynikowa tablica zawierająca drzewo - pesymistyczny przypadek to rozmiar 2*N-1
           rozmiar taki pojawia się w momencie, kiedy ilość punktów = 2^x
           w takim przypadku ostatnie piętro drzewa będzie zawierało tylko 1 liść
           na 2^(x-1) miejsc
+        - węzły drzewa przechowywane są kolumnowo (PointStorage), więc każdy
+          węzeł to 8 bajtów na wymiar i 1 bit zajętości
+
+        Porządek punktów w osi a to porządek leksykograficzny współrzędnych
+        (a, a+1, ..., a-1) - dla 2D są to dawne porównania (x, y) i (y, x),
+        więc układ drzewa dla punktów 2D się nie zmienia
+
+        Tablica numpy (N, k) jest budowana wektorowo (_median_split),
+        bez porównywania pojedynczych krotek w Pythonie
+
+        Opcjonalnie każdy węzeł przechowuje liczność swojego poddrzewa
+        (4 bajty na węzeł), co pozwala zliczać punkty obszaru (count_range)
+        bez odwiedzania poddrzew całkowicie zawartych w obszarze
+
+        Opcjonalnie zapamiętywane są też komórki węzłów (obszary ograniczone
+        płaszczyznami podziału przodków, 16 bajtów na wymiar i węzeł) - find_bounds
+        staje się wtedy odczytem O(1), a wyszukiwanie obszaru przyjmuje całe poddrzewa,
+        których komórka leży w przeszukiwanym obszarze, bez porównań współrzędnych
+
+        Powtórzone punkty zajmują jeden węzeł z krotnością (4 bajty na węzeł, tablica
+        tworzona tylko wtedy, gdy punkty się powtarzają) - wyniki zapytań zawierają
+        punkt tyle razy, ile razy występuje w zbiorze
+
+        Opcjonalnie (leaf_size > 1) podział kończy się na kubełkach - każde dziecko
+        ostatniego poziomu węzłów to ciągły blok leaf_size miejsc za tablicą węzłów,
+        przeglądany liniowo (wyszukiwanie wielu obszarów sprawdza kubełki wektorowo)
+        Drzewo ma wtedy około log2(N / leaf_size) poziomów zamiast log2(N),
+        a zapytania odwiedzają w Pythonie leaf_size razy mniej węzłów
 
         :param points: zbiór punktów, z którego tworzymy kdtree
+                       (lista krotek lub tablica numpy o kształcie (N, k))
+        :param subtree_counts: czy zapamiętać liczności poddrzew
+        :param cell_bounds: czy zapamiętać komórki węzłów
+        :param dimensions: liczba wymiarów - wymagana tylko dla pustego zbioru punktów,
+                           domyślnie wyznaczana z danych (dla pustego zbioru 2)
+        :param alpha: próg zapełnienia tablicy drzewa (0 < alpha <= 1) przy wstawianiu
+                      punktów - cała tablica jest powiększana i budowana od nowa dopiero
+                      po jego przekroczeniu, wcześniej przebudowywane są tylko poddrzewa
+        :param workers: liczba procesów budowania (wymaga numpy) - dla co najmniej
+                        PARALLEL_MIN_POINTS punktów poddrzewa poniżej górnych poziomów
+                        są budowane równolegle (_parallel_median_split)
+        :param leaf_size: pojemność kubełka liści (1 - każdy punkt w osobnym węźle)
         """
-        self.__logger(0, 0, 'Creating kdtree')
-        self.__logger(1, 0, 'Input points: {}'.format(points))
-        # sortowanie po X i Y
-        xsorted = sorted(points)
-        ysorted = sorted(points, key=lambda k: [k[1], k[0]])
+        # poziom logowania sprawdzany raz na operację
+        self.__log_level = debug_level()
+        if self.__log_level >= 0:
+            self.__log(0, 0, 'Creating kdtree')
+        if self.__log_level >= 1:
+            self.__log(1, 0, 'Input points: %s', points)
+        parallel = workers is not None and workers > 1 and len(points) >= PARALLEL_MIN_POINTS
+        if parallel and np is None:
+            raise ImportError('numpy is required for the parallel build')
+        if parallel and not isinstance(points, np.ndarray):
+            points = np.asarray(points, dtype=np.float64)
+        array_input = np is not None and isinstance(points, np.ndarray)
+        if array_input:
+            points = np.asarray(points, dtype=np.float64)
+            if points.ndim != 2 or points.shape[1] < 1:
+                raise ValueError('Expected an (N, k) array of points, got shape {}'.format(
+                    points.shape))
+            found_dimensions = points.shape[1]
+        else:
+            found_dimensions = len(points[0]) if len(points) > 0 else dimensions or 2
+            for point in points:
+                if len(point) != found_dimensions:
+                    raise ValueError('Expected {:d}-dimensional point, got {}'.format(
+                        found_dimensions, point))
+        if dimensions is not None and dimensions != found_dimensions:
+            raise ValueError('Expected {:d}-dimensional points, got {:d}'.format(
+                dimensions, found_dimensions))
+        if not 0 < alpha <= 1:
+            raise ValueError('alpha must be in (0, 1], got {}'.format(alpha))
+        if not isinstance(leaf_size, int) or leaf_size < 1:
+            raise ValueError('leaf_size must be a positive integer, got {}'.format(leaf_size))
+        self.__dimensions = found_dimensions
+        self.__alpha = alpha
+        self.__leaf_size = leaf_size
+        # liczba punktów drzewa i licznik modyfikacji (insert/remove)
+        self.__point_count = len(points)
+        self.__version = 0
         # przygotowanie zmiennych
-        self.__size = self.__find_size(len(points))
-        self.__tree = [None] * self.__size
+        self.__allocate(self.__find_size(len(points)), subtree_counts, cell_bounds)
+        # obszar zajmowany przez wszystkie punkty - komórka korzenia drzewa
+        self.__extent = None
         # tworzenie drzewa
-        self.__make_split(0, 0, xsorted, ysorted)
-        # przygotowanie zmiennych związanych z wyszukiwaniem obszarów
-        self.range_points = None
-        self.traversed_points = None
-        self.range = [None, None]
+        if array_input:
+            self.__build_from_array(points, workers if parallel else None)
+        else:
+            self.__build_from_list(points)
 
     @property
     def size(self):
         """Getter prywatnej zmiennej __size
 
-        :return: rozmiar drzewa
+        :return: rozmiar drzewa (liczba węzłów, bez miejsc kubełków)
         """
         return self.__size
 
+    @property
+    def leaf_size(self):
+        """Getter prywatnej zmiennej __leaf_size
+
+        :return: pojemność kubełka liści (1 - drzewo bez kubełków)
+        """
+        return self.__leaf_size
+
+    @property
+    def storage(self):
+        """Getter prywatnej zmiennej __tree - kolumnowy magazyn węzłów drzewa
+        Pozwala odczytać wszystkie punkty (np. as_numpy) bez odpytywania węzłów po kolei
+        Miejsca kubełków (leaf_size > 1) leżą w magazynie za węzłami drzewa
+
+        :return: obiekt PointStorage (tylko do odczytu - nie należy go modyfikować)
+        """
+        return self.__tree
+
+    @property
+    def multiplicity(self):
+        """Getter prywatnej zmiennej __multiplicity - krotności punktów węzłów
+
+        :return: tablica krotności (po jednej na miejsce magazynu, 0 dla pustych miejsc)
+                 lub None, jeśli punkty drzewa się nie powtarzają
+        """
+        return self.__multiplicity
+
+    @property
+    def version(self):
+        """Getter prywatnej zmiennej __version
+        Licznik zwiększany przy każdej modyfikacji drzewa (insert/remove)
+
+        :return: numer wersji drzewa
+        """
+        return self.__version
+
+    def __len__(self):
+        """Liczba punktów przechowywanych w drzewie
+
+        :return: liczba punktów
+        """
+        return self.__point_count
+
+    @property
+    def dimensions(self):
+        """Getter prywatnej zmiennej __dimensions
+
+        :return: liczba wymiarów punktów drzewa
+        """
+        return self.__dimensions
+
     def __getitem__(self, index):
         """Nadpisanie operatora [] dla klasy KDTree
         Pozwala na wygodny dostęp do elementów drzewa
         bez ryzyka zniszczenia go
 
         :param index: indeks elementu drzewa
-        :return: element drzewa o zadanym indeksie
+        :return: element drzewa o zadanym indeksie (krotka lub None dla pustego węzła)
+                 - indeksy od size to miejsca kubełków
         """
         return self.__tree[index]
 
@@ -92,71 +901,290 @@ class KDTree:
             level_size *= 2
         return tree_contents
 
+    def __axis(self, index):
+        """Oś podziału węzła o zadanym indeksie (wynika z jego głębokości)
+
+        :param index: indeks węzła
+        :return: numer osi podziału
+        """
+        return ((index + 1).bit_length() - 1) % self.__dimensions
+
+    def __bucket(self, index):
+        """Miejsca kubełka - dziecka ostatniego poziomu węzłów (index >= size)
+
+        :param index: indeks kubełka w układzie kopca
+        :return: zakres indeksów miejsc kubełka w magazynie
+        """
+        first = self.__size + (index - self.__size) * self.__leaf_size
+        return range(first, first + self.__leaf_size)
+
+    def __node(self, slot):
+        """Indeks w układzie kopca dla miejsca magazynu (węzeł lub kubełek)
+
+        :param slot: indeks miejsca
+        :return: indeks węzła lub kubełka
+        """
+        if slot < self.__size:
+            return slot
+        return self.__size + (slot - self.__size) // self.__leaf_size
+
+    def __occupied(self, index):
+        """Sprawdzenie czy węzeł lub kubełek (index >= size) zawiera punkty
+
+        :param index: indeks w układzie kopca
+        :return: True jeśli jest tam co najmniej jeden punkt
+        """
+        if index < self.__size:
+            return self.__tree.is_valid(index)
+        return self.__leaf_size > 1 and any(self.__tree.is_valid(slot)
+                                            for slot in self.__bucket(index))
+
+    def __child_exists(self, index):
+        """Sprawdzenie czy dziecko węzła trzeba odwiedzić - zajęty węzeł albo kubełek
+        (kubełki nie są sprawdzane przed odwiedzeniem - pusty kubełek daje pusty przegląd)
+
+        :param index: indeks dziecka w układzie kopca
+        :return: True jeśli dziecko trafia na stos przeszukiwania
+        """
+        if index < self.__size:
+            return self.__valid[index >> 3] >> (index & 7) & 1 == 1
+        return self.__leaf_size > 1
+
+    def __scan_bucket(self, index, bounds=None, traversed=None):
+        """Liniowy przegląd zajętych miejsc kubełka we wszystkich osiach
+
+        :param index: indeks kubełka w układzie kopca
+        :param bounds: przedział (dolny róg, górny róg) lub None - wszystkie zajęte miejsca
+        :param traversed: lista na przejrzane punkty lub None (bez zapisu)
+        :return: krotka (liczba zajętych miejsc, lista miejsc należących do przedziału)
+        """
+        valid = self.__valid
+        columns = self.__tree.columns
+        # pary (kolumna, dolna, górna granica) porównywane dla każdego miejsca
+        limits = None if bounds is None else tuple(zip(columns, *bounds))
+        occupied = 0
+        matched = []
+        for slot in self.__bucket(index):
+            if not valid[slot >> 3] >> (slot & 7) & 1:
+                continue
+            occupied += 1
+            if traversed is not None:
+                traversed.append(tuple([column[slot] for column in columns]))
+            if limits is not None:
+                for column, lower, upper in limits:
+                    if not lower <= column[slot] <= upper:
+                        break
+                else:
+                    matched.append(slot)
+            else:
+                matched.append(slot)
+        return occupied, matched
+
+    def __copies(self, slot):
+        """Krotność punktu w miejscu magazynu
+
+        :param slot: indeks zajętego miejsca
+        :return: liczba kopii punktu (1 w drzewie bez powtórzonych punktów)
+        """
+        return 1 if self.__multiplicity is None else self.__multiplicity[slot]
+
     def __find_size(self, point_count):
         """Obliczenie minimalnej wielkości tablicy dla reprezentacji zbilansowanego kddrzewa
 
         :param point_count: liczba punktów zbioru, z którego budujemy drzewo
         :return: minimalna, bezpieczna wielkość tablicy, która pomieści punkty
         """
-        size = 1
-        while size <= point_count:
-            size *= 2
-        size -= 1
-        self.__logger(1, 0, 'Size required: {:d}'.format(size))
+        size = _tree_size(point_count, self.__leaf_size)
+        if self.__log_level >= 1:
+            self.__log(1, 0, 'Size required: %d', size)
         return size
 
-    def __make_split(self, tree_level, index, xsorted, ysorted):
+    def __allocate(self, size, subtree_counts, cell_bounds):
+        """Przygotowanie tablic liczności i komórek dla drzewa o zadanym rozmiarze
+
+        :param size: rozmiar tablicy drzewa (węzłów, bez kubełków)
+        :param subtree_counts: czy zapamiętywać liczności poddrzew
+        :param cell_bounds: czy zapamiętywać komórki węzłów
+        :return: None
+        """
+        self.__size = size
+        self.__counts = array('I', bytes(4 * size)) if subtree_counts else None
+        # krotności powtórzonych punktów - tworzone dopiero przy pierwszym powtórzeniu
+        self.__multiplicity = None
+        # komórki węzłów: (dolne granice, górne granice), po jednej tablicy na oś
+        self.__cells = None
+        if cell_bounds:
+            self.__cells = tuple(
+                tuple(array('d', [limit]) * size for _ in range(self.__dimensions))
+                for limit in (-math.inf, math.inf))
+
+    def __sort_points(self, points):
+        """Sortowanie indeksów punktów w każdej osi oraz rangi punktów w tych porządkach
+
+        :param points: lista punktów (krotek)
+        :return: krotka (porządki indeksów w kolejnych osiach, rangi w kolejnych osiach)
+        """
+        orders = [sorted(range(len(points)),
+                         key=lambda i, axis=axis: (*points[i][axis:], *points[i][:axis]))
+                  for axis in range(self.__dimensions)]
+        ranks = []
+        for order in orders:
+            rank = [0] * len(points)
+            for position, point_index in enumerate(order):
+                rank[point_index] = position
+            ranks.append(rank)
+        return orders, ranks
+
+    def __build_from_list(self, points, weights=None):
+        """Budowanie drzewa z listy punktów
+        Punkty sortowane są raz w każdej osi (jako indeksy), a dalsze porównania
+        w __make_split to porównania rang - liczb całkowitych
+        Powtórzone punkty są najpierw zliczane (słownik), do drzewa trafiają
+        tylko różne punkty wraz z krotnościami
+
+        :param points: lista punktów (krotek)
+        :param weights: krotności punktów (przy przebudowie) lub None - wyznaczane z danych
+        :return: None
+        """
+        dimensions = self.__dimensions
+        if weights is None:
+            groups = {}
+            for point in points:
+                point = tuple(point)
+                groups[point] = groups.get(point, 0) + 1
+            if len(groups) < len(points):
+                points, weights = list(groups), list(groups.values())
+                # tablica drzewa dla różnych punktów
+                self.__allocate(self.__find_size(len(points)),
+                                self.__counts is not None, self.__cells is not None)
+        slot_count = _storage_size(self.__size, self.__leaf_size)
+        if weights is not None:
+            self.__multiplicity = array('I', bytes(4 * slot_count))
+        self.__tree = PointStorage.empty(slot_count, dimensions)
+        # bitmapa magazynu odczytywana bezpośrednio w pętlach przeszukiwania (__child_exists)
+        self.__valid = self.__tree.valid
+        orders, ranks = self.__sort_points(points)
+        self.__extent = None
+        if points:
+            self.__extent = (tuple(points[orders[axis][0]][axis] for axis in range(dimensions)),
+                             tuple(points[orders[axis][-1]][axis] for axis in range(dimensions)))
+        cell = None
+        if self.__cells is not None:
+            cell = ((-math.inf,) * dimensions, (math.inf,) * dimensions)
+        self.__make_split(0, 0, orders, (points, ranks, weights), cell)
+
+    def __make_split(self, tree_level, index, orders, source, cell=None):
         """Funkcja budująca kolejne elementy drzewa (rekurencyjna)
 
         :param tree_level: poziom drzewa, na którym się znajdujemy (zagłębienie)
         :param index: indeks węzła w tablicy
-        :param xsorted: zbiór punktów posortowanych względem X
-        :param ysorted: ten sam zbiór punktów, ale posortowany względem Y
+        :param orders: indeksy punktów poddrzewa posortowane w kolejnych osiach
+        :param source: krotka (lista punktów, rangi punktów w kolejnych osiach,
+                       krotności punktów lub None)
+        :param cell: komórka węzła (dolne granice, górne granice) lub None,
+                     jeśli komórki nie są zapamiętywane
         :return: None
         """
-        # przygotowanie zmiennych do wygodnego wyboru osi podziału
-        points = (xsorted, ysorted)
-        axis = tree_level % 2
+        points, ranks, weights = source
+        # wybór osi podziału
+        axis = tree_level % self.__dimensions
+        primary = orders[axis]
         # aktualny rozmiar poddrzewa
-        size = len(xsorted)
+        size = len(primary)
         if size == 0:
             return
+        if index >= self.__size:
+            # kubełek - punkty segmentu w kolejnych miejscach
+            for slot, point_index in zip(self.__bucket(index), primary):
+                self.__tree[slot] = points[point_index]
+                if weights is not None:
+                    self.__multiplicity[slot] = weights[point_index]
+            return
         # obliczenie punktu podziału
         mid = size//2
-        mid_point = points[axis][mid]
+        median = primary[mid]
+        mid_point = points[median]
         # logowanie
-        self.__logger(1, tree_level,
-                      'Level: {:d} index: {:d} size: {:d}'.format(tree_level, index, size))
-        self.__logger(2, tree_level, 'Data: {}'.format(points[axis]))
+        if self.__log_level >= 1:
+            self.__log(1, tree_level, 'Level: %d index: %d size: %d', tree_level, index, size)
+        if self.__log_level >= 2:
+            self.__log(2, tree_level, 'Data: %s', [points[i] for i in primary])
         # zapisanie punktu podziału
         self.__tree[index] = mid_point
+        if weights is not None:
+            self.__multiplicity[index] = weights[median]
+        if self.__counts is not None:
+            self.__counts[index] = size if weights is None else sum(weights[i] for i in primary)
+        if cell is not None:
+            for bound in range(2):
+                for cell_axis in range(self.__dimensions):
+                    self.__cells[bound][cell_axis][index] = cell[bound][cell_axis]
         if size == 1:
             return
         # logowanie (tlyko jeśli faktycznie dzielimy tablice)
-        self.__logger(2, tree_level,
-                      'Split point at {:d}: {}'.format(mid, mid_point))
-        # dzielenie tablic względem aktualnej osi
-        primary_lo = points[axis][:mid]
-        primary_hi = points[axis][mid+1:]
-        # dzielenie tablic względem drugiej osi
-        # korzysta z wbudowanego porównywania tuple
-        secondary_lo = []
-        secondary_hi = []
-        for point in points[axis-1]:
-            if (point[axis], point[axis-1]) < (mid_point[axis], mid_point[axis-1]):
-                secondary_lo.append(point)
-            elif (point[axis], point[axis-1]) > (mid_point[axis], mid_point[axis-1]):
-                secondary_hi.append(point)
+        if self.__log_level >= 2:
+            self.__log(2, tree_level, 'Split point at %d: %s', mid, mid_point)
+        # dzielenie tablic wszystkich osi względem mediany aktualnej osi
+        # porównywane są rangi w porządku osi podziału
+        rank = ranks[axis]
+        median_rank = rank[median]
+        orders_lo = []
+        orders_hi = []
+        for other in range(self.__dimensions):
+            if other == axis:
+                orders_lo.append(primary[:mid])
+                orders_hi.append(primary[mid+1:])
+            else:
+                orders_lo.append([i for i in orders[other] if rank[i] < median_rank])
+                orders_hi.append([i for i in orders[other] if rank[i] > median_rank])
+        # komórki dzieci - komórka węzła przecięta płaszczyzną podziału
+        cell_lo = cell_hi = None
+        if cell is not None:
+            split = mid_point[axis]
+            cell_lo = (cell[0], cell[1][:axis] + (split,) + cell[1][axis+1:])
+            cell_hi = (cell[0][:axis] + (split,) + cell[0][axis+1:], cell[1])
         # aktualizacja głębokości drzewa i indeksu elementów
         tree_level += 1
         index *= 2
         # wykonanie rekurencyjne na nowych podzbiorach danych
-        if axis == 0:
-            self.__make_split(tree_level, index + 1, primary_lo, secondary_lo)
-            self.__make_split(tree_level, index + 2, primary_hi, secondary_hi)
+        self.__make_split(tree_level, index + 1, orders_lo, source, cell_lo)
+        self.__make_split(tree_level, index + 2, orders_hi, source, cell_hi)
+
+    def __build_from_array(self, points, workers=None):
+        """Budowanie drzewa z tablicy numpy (N, k)
+
+        :param points: tablica współrzędnych punktów
+        :param workers: liczba procesów budowania równoległego lub None
+        :return: None
+        """
+        if workers is None:
+            slots, counts, bounds, weights = _median_split(
+                points, self.__cells is not None, self.__leaf_size)
         else:
-            self.__make_split(tree_level, index + 1, secondary_lo, primary_lo)
-            self.__make_split(tree_level, index + 2, secondary_hi, primary_hi)
+            if self.__log_level >= 0:
+                self.__log(0, 0, 'Parallel build with %d workers', workers)
+            slots, counts, bounds, weights = _parallel_median_split(
+                points, self.__cells is not None, workers, self.__leaf_size)
+        # rozmiar wynika z liczby różnych punktów
+        self.__size = len(counts)
+        mask = slots >= 0
+        columns = np.zeros((self.__dimensions, len(slots)))
+        columns[:, mask] = points[slots[mask]].T
+        self.__tree = PointStorage.from_numpy(columns, mask)
+        self.__valid = self.__tree.valid
+        if weights is not None:
+            multiplicity = np.zeros(len(slots), dtype=np.uint32)
+            multiplicity[mask] = weights[slots[mask]]
+            self.__multiplicity = array('I', multiplicity.tobytes())
+        if self.__counts is not None:
+            self.__counts = array('I', counts.astype(np.uint32).tobytes())
+        if self.__cells is not None:
+            self.__cells = tuple(tuple(array('d', bound[:, cell_axis].tobytes())
+                                       for cell_axis in range(self.__dimensions))
+                                 for bound in bounds)
+        if len(points) > 0:
+            self.__extent = (tuple(points.min(axis=0).tolist()),
+                             tuple(points.max(axis=0).tolist()))
 
     @staticmethod
     def __parent(index):
@@ -174,112 +1202,1159 @@ class KDTree:
         Potrzebna do prawidłowego rysowania obszarów zajmowanych przez elementy drzewa
 
         :param point_index: indeks punkdu, dla którego szukamy ograniczeń
-        :param axis: oś, względem której działa wyszukiwanie (0=X, 1=Y)
+                            (dla miejsca kubełka - ograniczenia kubełka)
+        :param axis: oś, względem której działa wyszukiwanie (0=X, 1=Y, ...)
         :param axis_max: graniczne rozpatrywane wartości (-;+) - optymalizacja rysowania
         :return: krotka składająca się z 2 współrzednych ograniczających dany punkt
         """
+        # zapamiętane komórki węzłów - odczyt O(1) zamiast przechodzenia po przodkach
+        if self.__cells is not None and point_index < self.__size:
+            return (max(-axis_max, self.__cells[0][axis][point_index]),
+                    min(axis_max, self.__cells[1][axis][point_index]))
         # przygotowanie zmiennych
         result = (-axis_max, axis_max)
-        point = self.__tree[point_index]
-        parent_index = self.__parent(point_index)
+        column = self.__tree.columns[axis]
+        child_index = self.__node(point_index)
+        parent_index = self.__parent(child_index)
         # flagi znalezionych granic
         min_found = False
         max_found = False
-        self.__logger(1, 0, '{} Find {} bounds for {} {} {}'.format(
-            '-' * 18, ('Y', 'X')[axis == 0], point, result, '-' * 18,))
+        log_level = debug_level()
+        if log_level >= 1:
+            self.__log(1, 0, '%s Find bounds on axis %d for %s %s %s',
+                       '-' * 18, axis, self.__tree[point_index], result, '-' * 18)
         # trawersowanie w górę drzewa dopóki nie spotkamy granic lub roota
         while parent_index > -1 and not (min_found and max_found):
-            parent = self.__tree[parent_index]
-            self.__logger(2, 0, 'Checking: {}'.format(parent))
-            # sprawdzenie współrzędnych
-            if (parent[axis], parent[axis-1]) > (point[axis], point[axis-1]):
-                if result[1] > parent[axis]:
-                    result = (result[0], parent[axis])
-                    max_found = True
-            if (parent[axis], parent[axis-1]) < (point[axis], point[axis-1]):
-                if result[0] < parent[axis]:
-                    result = (parent[axis], result[1])
+            # ograniczają tylko przodkowie dzielący zadaną oś
+            if self.__axis(parent_index) == axis:
+                if log_level >= 2:
+                    self.__log(2, 0, 'Checking: %s', self.__tree[parent_index])
+                # strona przodka wynika z indeksu dziecka na ścieżce
+                if child_index == parent_index*2+1:
+                    if result[1] > column[parent_index]:
+                        result = (result[0], column[parent_index])
+                        max_found = True
+                elif result[0] < column[parent_index]:
+                    result = (column[parent_index], result[1])
                     min_found = True
-            self.__logger(2, 0, 'Updated bounds: {}'.format(result))
-            # sprawdzamy tylko co 2-gie piętro (bo szukamy ograniczenia 1 osi)
-            parent_index = self.__parent(self.__parent(parent_index))
-        self.__logger(1, 0, 'Final bounds: {}'.format(result))
+                if log_level >= 2:
+                    self.__log(2, 0, 'Updated bounds: %s', result)
+            child_index = parent_index
+            parent_index = self.__parent(parent_index)
+        if log_level >= 1:
+            self.__log(1, 0, 'Final bounds: %s', result)
         return result
 
-    def __point_in_range(self, point):
-        """Sprawdza czy punkt znajduje się w przeszukiwanym obszarze
-        Przeszukiwany obszar jest zapisany w klasie jako zmienna 'range'
+    def __search_range_iterative(self, low, high, traversed, log_level, visited_count=None,
+                                 version=None):
+        """Iteracyjne przeszukiwanie zadanego obszaru z jawnym stosem (generator)
+        Punkty są zwracane leniwie, w kolejności odwiedzin - przerwanie iteracji
+        kończy przeszukiwanie bez odwiedzania reszty drzewa
+        Cały stan zapytania jest lokalny - drzewo nie jest modyfikowane,
+        więc wiele wątków może przeszukiwać to samo drzewo bez blokad
+        - na stos trafiają tylko istniejące, niepuste węzły (sprawdzenie bitmapy
+          przed włożeniem), więc nie ma wywołań dla pustych liści
+        - oś podziału wynika z indeksu węzła (głębokość = bit_length(i+1) - 1),
+          stos przechowuje same indeksy
+        - w gałęzi "punkt w zakresie osi podziału" sprawdzane są już tylko
+          pozostałe osie, zamiast ponownego porównywania wszystkich współrzędnych
+        - krotka punktu jest tworzona tylko dla znalezionych punktów,
+          chyba że zapisujemy odwiedzone węzły lub logujemy szczegóły
+        - przy zapamiętanych komórkach węzłów poddrzewo, którego komórka leży
+          w przedziale, jest przyjmowane w całości - jego węzły są przeglądane
+          bez porównań (__accept_subtree, kolejność odwiedzin bez zmian)
+        - punkt węzła z krotnością m trafia do wyniku m razy
+        - kubełki (leaf_size > 1) trafiają na stos jak węzły, a po zdjęciu
+          ich zajęte miejsca są przeglądane liniowo we wszystkich osiach
+
+        :param low: dolny róg przedziału (najmniejsze współrzędne)
+        :param high: górny róg przedziału (największe współrzędne)
+        :param traversed: lista na odwiedzone węzły lub None (bez zapisu)
+        :param log_level: poziom logowania ustalony dla zapytania
+        :param visited_count: lista, do której po zakończeniu przeszukiwania dopisywana
+                              jest liczba odwiedzonych węzłów, lub None
+        :param version: wersja drzewa z chwili utworzenia iteratora, domyślnie bieżąca;
+                        jej zmiana po zwróceniu punktu powoduje RuntimeError
+        :return: generator punktów należących do przedziału
+        """
+        if version is None:
+            version = self.__version
+        size = self.__size
+        columns = self.__tree.columns
+        dimensions = self.__dimensions
+        axes = range(dimensions)
+        # osie sprawdzane po trafieniu w zakres osi podziału
+        others = [tuple(other for other in axes if other != axis) for axis in axes]
+        child_exists = self.__child_exists
+        multiplicity = self.__multiplicity
+        cells = self.__cells
+        # czwórki (dolna, górna granica przedziału, kolumny komórek) osi
+        bounds = None if cells is None else tuple(zip(low, high, *cells))
+        describe = traversed is not None or log_level >= 3
+        visited = 0
+        point = None
+        stack = [0] if self.__tree.is_valid(0) else []
+        while stack:
+            point_index = stack.pop()
+            visited += 1
+            if point_index >= size:
+                # kubełek - liniowy przegląd zajętych miejsc
+                occupied, slots = self.__scan_bucket(point_index, (low, high), traversed)
+                visited += occupied
+                for point in self.__slot_points(slots):
+                    yield point
+                    if self.__version != version:
+                        raise RuntimeError(_CHANGED_DURING_ITERATION)
+                continue
+            accepted = cells is not None
+            if accepted:
+                for lower, upper, cell_low, cell_high in bounds:
+                    if not lower <= cell_low[point_index] or not cell_high[point_index] <= upper:
+                        accepted = False
+                        break
+            if accepted:
+                if log_level >= 3:
+                    self.__log(3, (point_index + 1).bit_length() - 1, 'Subtree %d accepted',
+                               point_index)
+                # węzeł liczony już przy zdjęciu ze stosu
+                visited += (yield from self.__accept_subtree(point_index, traversed,
+                                                             version)) - 1
+                continue
+            if describe:
+                point = tuple([column[point_index] for column in columns])
+                # dodanie węzła do zbioru odwiedzonych
+                if traversed is not None:
+                    traversed.append(point)
+                if log_level >= 3:
+                    self.__log_node(point_index, low, high, point)
+            # oś podziału węzła
+            axis = ((point_index + 1).bit_length() - 1) % dimensions
+            value = columns[axis][point_index]
+            if value < low[axis]:
+                # jeżeli punkt jest niżej w rozważanym wymiarze - idź w prawo (w większe wartości)
+                children = (point_index*2+2,)
+            elif value > high[axis]:
+                # jeżeli punkt jest wyżej w rozważanym wymiarze - idź w lewo (w mniejsze wartości)
+                children = (point_index*2+1,)
+            else:
+                # punkt zawiera się w rozważanym wymiarze, sprawdź pozostałe osie
+                for other in others[axis]:
+                    if not low[other] <= columns[other][point_index] <= high[other]:
+                        break
+                else:
+                    # jesli tak, to dodaj go do zbioru znalezionych punktów
+                    found = point if describe else tuple([column[point_index]
+                                                          for column in columns])
+                    yield found
+                    if self.__version != version:
+                        raise RuntimeError(_CHANGED_DURING_ITERATION)
+                    if multiplicity is not None and multiplicity[point_index] > 1:
+                        for _ in range(multiplicity[point_index] - 1):
+                            yield found
+                            if self.__version != version:
+                                raise RuntimeError(_CHANGED_DURING_ITERATION)
+                # i odzwiedź jego oba poddrzewa (prawe na spód stosu - lewe pierwsze)
+                children = (point_index*2+2, point_index*2+1)
+            for child in children:
+                if child_exists(child):
+                    stack.append(child)
+        if visited_count is not None:
+            visited_count.append(visited)
+
+    def __accept_subtree(self, index, traversed, version):
+        """Zwrócenie wszystkich punktów poddrzewa, którego komórka leży w przedziale
+        Węzły odwiedzane są w tej samej kolejności co w przeszukiwaniu, bez porównań
+
+        :param index: indeks korzenia poddrzewa
+        :param traversed: lista na odwiedzone węzły lub None (bez zapisu)
+        :param version: wersja drzewa z chwili utworzenia iteratora
+        :return: generator punktów poddrzewa (z krotnościami), którego wartością
+                 końcową jest liczba odwiedzonych węzłów i miejsc kubełków
+        """
+        size = self.__size
+        columns = self.__tree.columns
+        child_exists = self.__child_exists
+        multiplicity = self.__multiplicity
+        visited = 0
+        stack = [index]
+        while stack:
+            node = stack.pop()
+            visited += 1
+            if node >= size:
+                occupied, slots = self.__scan_bucket(node, None, traversed)
+                visited += occupied
+            else:
+                slots = (node,)
+                if traversed is not None:
+                    traversed.append(tuple([column[node] for column in columns]))
+                for child in (node*2+2, node*2+1):
+                    if child_exists(child):
+                        stack.append(child)
+            for slot in slots:
+                point = tuple([column[slot] for column in columns])
+                yield point
+                if self.__version != version:
+                    raise RuntimeError(_CHANGED_DURING_ITERATION)
+                if multiplicity is not None and multiplicity[slot] > 1:
+                    for _ in range(multiplicity[slot] - 1):
+                        yield point
+                        if self.__version != version:
+                            raise RuntimeError(_CHANGED_DURING_ITERATION)
+        return visited
+
+    def __slot_points(self, slots):
+        """Punkty zadanych miejsc magazynu, każdy powtórzony tyle razy, ile wynosi krotność
 
-        :param point: sprawdzany punkt
-        :return: True jeślie punkt nalezy do obszaru, w przeciwnym razie False
+        :param slots: indeksy zajętych miejsc
+        :return: lista krotek punktów
         """
-        in_range = False
-        if self.range[0][0] <= point[0] <= self.range[1][0] \
-                and self.range[0][1] <= point[1] <= self.range[1][1]:
-            in_range = True
-        self.__logger(5, 0, 'Point {} is{} in range {}'.format(
-            point, (' not', '')[in_range], self.range))
-        return in_range
+        columns = self.__tree.columns
+        points = [tuple([column[slot] for column in columns]) for slot in slots]
+        if self.__multiplicity is None:
+            return points
+        return [point for point, slot in zip(points, slots)
+                for _ in range(self.__multiplicity[slot])]
 
-    def __search_range_recursive(self, point_index, depth):
-        """Rekurencyjne przeszukiwanie zadanego obszaru
-        Obszar jest zapisany w zmiennej 'range'
-        Punkty obszaru są zachowane w zmiennej 'range_points'
+    def __log_node(self, index, low, high, point):
+        """Zapis w logu porównania węzła z przedziałem (poziomy 3-5)
 
-        :param point_index: indeks sprawdzanego elementu
-        :param depth: poziom drzewa, na którym się znajdujemy
+        :param index: indeks węzła
+        :param low: dolny róg przedziału
+        :param high: górny róg przedziału
+        :param point: krotka punktu węzła
         :return: None
         """
-        # sprawdzenie, czy znajdujemy się w prawidłowym węźle
-        if point_index >= self.__size:
-            return
-        point = self.__tree[point_index]
-        if point is None:
-            return
-        # dodanie węzła do zbioru odwiedzonych
-        self.traversed_points.append(point)
-        # znacznik osi (0 = X, 1 = Y)
-        axis = depth % 2
-        if point[axis] < self.range[0][axis]:
-            self.__logger(3, depth, 'Point {} is smaller than {}'.format(point, self.range[0]))
-            # jeżeli punkt jest niżej w rozważanym wymiarze - idź w prawo (w większe wartości)
-            self.__search_range_recursive(point_index*2+2, depth+1)
-        elif point[axis] > self.range[1][axis]:
-            self.__logger(3, depth, 'Point {} is bigger than {}'.format(point, self.range[1]))
-            # jeżeli punkt jest wyżej w rozważanym wymiarze - idź w lewo (w mniejsze wartości)
-            self.__search_range_recursive(point_index*2+1, depth+1)
+        depth = (index + 1).bit_length() - 1
+        axis = depth % self.__dimensions
+        if point[axis] < low[axis]:
+            self.__log(3, depth, 'Point %s is smaller than %s', point, low)
+        elif point[axis] > high[axis]:
+            self.__log(3, depth, 'Point %s is bigger than %s', point, high)
         else:
-            self.__logger(
-                3,
-                depth,
-                'Point {} X is in {}'.format(point, (self.range[0][axis], self.range[1][axis])))
-            # punkt zawiera się w rozważanym wymiarze, sprawdź czy zawiera się w przedziale
-            if self.__point_in_range(point):
-                # jesli tak, to dodaj go do zbioru znalezionych punktów
-                self.__logger(4, depth, 'Point valid')
-                self.range_points.append(point)
-            # i odzwiedź jego oba poddrzewa
-            self.__search_range_recursive(point_index*2+1, depth+1)
-            self.__search_range_recursive(point_index*2+2, depth+1)
+            self.__log(3, depth, 'Point %s axis %d is in %s', point, axis, (low[axis], high[axis]))
+            if all(lower <= coordinate <= upper
+                   for lower, coordinate, upper in zip(low, point, high)):
+                self.__log(4, depth, 'Point valid')
+            else:
+                self.__log(5, depth, 'Point %s is not in range %s', point, (low, high))
+
+    def query_range(self, bottom_left, top_right, traversal=TRAVERSAL_NONE):
+        """Wyszukiwanie punktów przedziału zwracające pełny wynik zapytania
+        Nie zmienia stanu drzewa - bezpieczne przy współbieżnych zapytaniach
+
+        :param bottom_left: dolny róg przedziału (najmniejsze współrzędne we wszystkich osiach)
+        :param top_right: górny róg przedziału (największe współrzędne we wszystkich osiach)
+        :param traversal: tryb zapisu przebiegu (TRAVERSAL_NONE, TRAVERSAL_COUNTS,
+                          TRAVERSAL_POINTS - lista odwiedzonych węzłów do wizualizacji)
+        :return: obiekt RangeResult
+        """
+        if traversal not in (TRAVERSAL_NONE, TRAVERSAL_POINTS, TRAVERSAL_COUNTS):
+            raise ValueError('Unknown traversal mode: {}'.format(traversal))
+        log_level = debug_level()
+        if log_level >= 0:
+            self.__log(0, 0, 'Range search in: [%s %s]', bottom_left, top_right)
+        traversed = [] if traversal == TRAVERSAL_POINTS else None
+        visited = []
+        points = list(self.__search_range_iterative(
+            bottom_left, top_right, traversed, log_level, visited))
+        visited = None if traversal == TRAVERSAL_NONE else visited[0]
+        return RangeResult((bottom_left, top_right), points, traversed, visited)
 
     def search_range(self, bottom_left, top_right):
         """Funkcja uruchamiająca wyszukiwanie punktów należących do zadanego przedziału
 
-        :param bottom_left: lewy dolny róg przedziału
-        :param top_right: prawy górny róg przedziału
+        :param bottom_left: dolny róg przedziału (najmniejsze współrzędne we wszystkich osiach)
+        :param top_right: górny róg przedziału (największe współrzędne we wszystkich osiach)
         :return: punkty należące do przedziału
         """
-        self.__logger(0, 0, 'Range search in: [{} {}]'.format(bottom_left, top_right))
-        # przygotowanie zmiennych
-        self.range_points = []
-        self.traversed_points = []
-        self.range = [bottom_left, top_right]
-        # uruchomienie wyszukiwania
-        self.__search_range_recursive(0, 0)
-        # funkcja zwraca znalezione punkty, można je również odczytać później bezpośrednio z klasy
-        return self.range_points
+        return self.query_range(bottom_left, top_right).points
+
+    def iter_range(self, bottom_left, top_right, limit=None):
+        """Leniwe wyszukiwanie punktów przedziału - punkty są zwracane w kolejności
+        odwiedzin (tej samej co w search_range), bez budowania listy wyników
+        Przeszukiwanie trwa tylko tak długo, jak długo pobierane są kolejne punkty,
+        więc pierwsze trafienia dużego obszaru są dostępne od razu, a limit
+        (lub przerwanie iteracji) kończy je bez odwiedzania reszty drzewa
+        Modyfikacja drzewa (insert/remove) w trakcie iteracji powoduje RuntimeError
+        przy pobraniu kolejnego punktu (jak przy iteracji słownika)
+
+        :param bottom_left: dolny róg przedziału (najmniejsze współrzędne we wszystkich osiach)
+        :param top_right: górny róg przedziału (największe współrzędne we wszystkich osiach)
+        :param limit: największa liczba zwracanych punktów lub None (bez ograniczenia)
+        :return: iterator punktów należących do przedziału
+        """
+        if limit is not None and limit < 0:
+            raise ValueError('limit must be non-negative, got {}'.format(limit))
+        log_level = debug_level()
+        if log_level >= 0:
+            self.__log(0, 0, 'Range iteration in: [%s %s]', bottom_left, top_right)
+        # wersja z chwili utworzenia iteratora - generator startuje dopiero przy next()
+        points = self.__search_range_iterative(bottom_left, top_right, None, log_level,
+                                               version=self.__version)
+        return points if limit is None else itertools.islice(points, limit)
+
+    def count_range(self, bottom_left, top_right):
+        """Zliczanie punktów należących do przedziału bez ich zwracania
+        W trakcie zejścia śledzona jest komórka węzła (obszar, w którym leżą
+        wszystkie punkty jego poddrzewa), zaczynając od obszaru całego zbioru
+        - komórka całkowicie w przedziale: dodajemy liczność poddrzewa, bez zejścia
+        - komórka rozłączna z przedziałem: pomijamy poddrzewo
+        Przy dużych wynikach zamiast O(k) wychodzi około O(sqrt N) odwiedzonych węzłów
+        Bez zapamiętanych liczności (subtree_counts=False) zlicza wynik search_range
+
+        :param bottom_left: dolny róg przedziału
+        :param top_right: górny róg przedziału
+        :return: liczba punktów należących do przedziału
+        """
+        if self.__counts is None:
+            return len(self.search_range(bottom_left, top_right))
+        size = self.__size
+        columns = self.__tree.columns
+        counts = self.__counts
+        child_exists = self.__child_exists
+        copies = self.__copies
+        axes = range(self.__dimensions)
+        low, high = bottom_left, top_right
+        total = 0
+        stack = [(0,) + self.__extent] if self.__tree.is_valid(0) else []
+        while stack:
+            point_index, cell_low, cell_high = stack.pop()
+            inside = True
+            for axis in axes:
+                # komórka rozłączna z przedziałem
+                if cell_high[axis] < low[axis] or cell_low[axis] > high[axis]:
+                    break
+                if not low[axis] <= cell_low[axis] or not cell_high[axis] <= high[axis]:
+                    inside = False
+            else:
+                if point_index >= size:
+                    # kubełek - zliczenie zajętych miejsc należących do przedziału
+                    _, slots = self.__scan_bucket(point_index, None if inside else (low, high))
+                    total += sum(map(copies, slots))
+                    continue
+                # komórka zawarta w przedziale - całe poddrzewo należy do wyniku
+                if inside:
+                    total += counts[point_index]
+                    continue
+                axis = self.__axis(point_index)
+                for other in axes:
+                    if not low[other] <= columns[other][point_index] <= high[other]:
+                        break
+                else:
+                    total += copies(point_index)
+                # komórki dzieci - podział komórki węzła płaszczyzną jego osi
+                split = (columns[axis][point_index],)
+                left = (cell_low, cell_high[:axis] + split + cell_high[axis+1:])
+                right = (cell_low[:axis] + split + cell_low[axis+1:], cell_high)
+                for child, cell in ((point_index*2+1, left), (point_index*2+2, right)):
+                    if child_exists(child):
+                        stack.append((child,) + cell)
+        return total
+
+    def knn(self, point, k):
+        """Wyszukiwanie k najbliższych sąsiadów punktu (odległość euklidesowa)
+        Metoda podziału i ograniczeń na tej samej tablicy drzewa:
+        - kandydaci trzymani są w ograniczonym kopcu (max-kopiec przez ujemne odległości)
+        - najpierw odwiedzane jest poddrzewo po stronie punktu, drugie trafia na stos
+          z dolnym ograniczeniem odległości = kwadrat odległości od płaszczyzny podziału
+        - poddrzewa, których ograniczenie nie jest mniejsze od najgorszego kandydata,
+          są pomijane
+        - powtórzony punkt jest kandydatem tyle razy, ile wynosi jego krotność
+        - kubełki są przeglądane w całości
+
+        :param point: punkt, dla którego szukamy sąsiadów
+        :param k: liczba szukanych sąsiadów
+        :return: lista co najwyżej k punktów posortowana rosnąco po odległości
+        """
+        if k <= 0:
+            return []
+        size = self.__size
+        columns = self.__tree.columns
+        dimensions = self.__dimensions
+        child_exists = self.__child_exists
+        # kopiec kandydatów: (-kwadrat odległości, indeks miejsca)
+        candidates = []
+        # stos: (indeks węzła, dolne ograniczenie kwadratu odległości poddrzewa)
+        stack = [(0, 0.0)] if self.__tree.is_valid(0) else []
+        while stack:
+            point_index, bound = stack.pop()
+            if len(candidates) == k and bound >= -candidates[0][0]:
+                continue
+            slots = self.__scan_bucket(point_index)[1] if point_index >= size else (point_index,)
+            for slot in slots:
+                distance = 0.0
+                for coordinate, column in zip(point, columns):
+                    delta = coordinate - column[slot]
+                    distance += delta * delta
+                for _ in range(min(self.__copies(slot), k)):
+                    if len(candidates) < k:
+                        heapq.heappush(candidates, (-distance, slot))
+                    elif distance < -candidates[0][0]:
+                        heapq.heapreplace(candidates, (-distance, slot))
+                    else:
+                        break
+            if point_index >= size:
+                continue
+            axis = ((point_index + 1).bit_length() - 1) % dimensions
+            # odległość od płaszczyzny podziału węzła
+            plane = point[axis] - columns[axis][point_index]
+            if plane <= 0:
+                near, far = point_index*2+1, point_index*2+2
+            else:
+                near, far = point_index*2+2, point_index*2+1
+            # dalsze poddrzewo na spód stosu - bliższe odwiedzane pierwsze
+            if child_exists(far):
+                stack.append((far, max(bound, plane * plane)))
+            if child_exists(near):
+                stack.append((near, bound))
+        return [self.__tree[index]
+                for _, index in sorted(candidates, key=lambda item: (-item[0], item[1]))]
+
+    def nearest(self, point):
+        """Wyszukiwanie najbliższego punktu drzewa
+
+        :param point: punkt, dla którego szukamy sąsiada
+        :return: najbliższy punkt lub None dla pustego drzewa
+        """
+        result = self.knn(point, 1)
+        return result[0] if result else None
+
+    def search_ranges(self, rects, csr=False):
+        """Wyszukiwanie wielu obszarów jednym wywołaniem
+        Z numpy wszystkie obszary są przetwarzane wektorowo (_batch_range_search),
+        punkty każdego obszaru są w kolejności poziomów drzewa
+        Bez numpy wykonywane są kolejne wywołania search_range
+
+        :param rects: lista lub tablica (Q, 2, k) obszarów [(bottom_left, top_right), ...]
+        :param csr: jeśli True, wynik w formacie CSR: (offsets, indices) - indeksy miejsc
+                    magazynu drzewa dla zapytania i to indices[offsets[i]:offsets[i+1]]
+                    (węzeł powtórzonego punktu występuje tyle razy, ile wynosi krotność)
+        :return: lista list punktów dla kolejnych obszarów lub krotka (offsets, indices)
+        """
+        if np is None:
+            if csr:
+                raise ImportError('numpy is required for CSR results of search_ranges')
+            return [self.search_range(bottom_left, top_right) for bottom_left, top_right in rects]
+        rects = np.asarray(rects, dtype=np.float64).reshape(-1, 2, self.__dimensions)
+        columns, mask = self.__tree.as_numpy()
+        queries, nodes = _batch_range_search(columns, mask, rects[:, 0], rects[:, 1],
+                                             self.__size, self.__leaf_size)
+        if self.__multiplicity is not None:
+            copies = np.frombuffer(self.__multiplicity, dtype=np.uint32)[nodes]
+            queries, nodes = np.repeat(queries, copies), np.repeat(nodes, copies)
+        # grupowanie trafień według zapytań (stabilnie - zachowuje kolejność w zapytaniu)
+        indices = nodes[np.argsort(queries, kind='stable')]
+        offsets = np.zeros(len(rects) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(queries, minlength=len(rects)), out=offsets[1:])
+        if csr:
+            return offsets, indices
+        points = list(zip(*(column[indices].tolist() for column in columns)))
+        bounds = offsets.tolist()
+        return [points[bounds[query]:bounds[query + 1]] for query in range(len(rects))]
+
+    def save(self, path):
+        """Zapis drzewa do pliku binarnego, który można wczytać bez kopiowania (load)
+        Układ pliku (little endian, sekcje wyrównane do 8 bajtów):
+        - nagłówek: magic, wersja, liczba wymiarów, typ współrzędnych, flagi,
+          pojemność kubełka, rozmiar, liczba punktów (z krotnościami)
+        - obszar zbioru punktów: 2*k liczb double
+        - kolumny współrzędnych miejsc (węzły i kubełki): k*miejsca liczb double
+        - komórki węzłów (flaga _FILE_CELLS): 2*k*rozmiar liczb double
+        - liczności poddrzew (flaga _FILE_COUNTS): rozmiar liczb uint32
+        - krotności punktów (flaga _FILE_MULTIPLICITY): miejsca liczb uint32
+        - bitmapa zajętych miejsc
+
+        :param path: ścieżka pliku
+        :return: None
+        """
+        flags = 0
+        if self.__counts is not None:
+            flags |= _FILE_COUNTS
+        if self.__cells is not None:
+            flags |= _FILE_CELLS
+        if self.__extent is not None:
+            flags |= _FILE_EXTENT
+        if self.__multiplicity is not None:
+            flags |= _FILE_MULTIPLICITY
+        extent = self.__extent or ((0.0,) * self.__dimensions,) * 2
+        with open(path, 'wb') as file:
+            file.write(_FILE_HEADER.pack(_FILE_MAGIC, _FILE_VERSION, self.__dimensions,
+                                         b'd', flags, self.__leaf_size, self.__size,
+                                         self.__point_count))
+            file.write(array('d', extent[0] + extent[1]))
+            for column in self.__tree.columns:
+                file.write(column)
+            if self.__cells is not None:
+                for bound in self.__cells:
+                    for column in bound:
+                        file.write(column)
+            for column in (self.__counts, self.__multiplicity):
+                if column is not None:
+                    file.write(column)
+                    file.write(bytes(-4 * len(column) % 8))
+            file.write(self.__tree.valid)
+        if self.__log_level >= 0:
+            self.__log(0, 0, 'Tree of size %d saved to %s', self.__size, path)
+
+    @classmethod
+    def load(cls, path):
+        """Wczytanie drzewa zapisanego metodą save
+        Plik jest mapowany w pamięci (mmap) tylko do odczytu, a kolumny drzewa
+        to widoki memoryview na mapowanie - nic nie jest kopiowane ani budowane,
+        więc wiele procesów może współdzielić jeden indeks z cache stron systemu
+        Wczytane drzewo jest tylko do odczytu (read_only)
+        Pliki innej wersji niż _FILE_VERSION lub z nieznanymi flagami są odrzucane
+
+        :param path: ścieżka pliku
+        :return: drzewo KD
+        """
+        if sys.byteorder != 'little':
+            raise ValueError('Memory-mapped trees are supported only on little-endian hosts')
+        with open(path, 'rb') as file:
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapping)
+        header = _FILE_HEADER
+        if len(view) < header.size or bytes(view[:4]) != _FILE_MAGIC:
+            raise ValueError('{} is not a kdtree file'.format(path))
+        _, version, dimensions, dtype, flags, leaf_size, size, point_count = \
+            header.unpack_from(view)
+        if version != _FILE_VERSION:
+            raise ValueError('Unsupported kdtree file version {:d}'.format(version))
+        if dtype != b'd':
+            raise ValueError('Unsupported kdtree file dtype {}'.format(dtype))
+        if flags & ~_FILE_FLAGS:
+            raise ValueError('Unsupported kdtree file flags {:#04x}'.format(flags))
+        if leaf_size < 1:
+            raise ValueError('{} has invalid leaf size {:d}'.format(path, leaf_size))
+        slot_count = _storage_size(size, leaf_size)
+        sections = [(2 * dimensions * 8, 'd'), (dimensions * slot_count * 8, 'd')]
+        if flags & _FILE_CELLS:
+            sections.append((2 * dimensions * size * 8, 'd'))
+        if flags & _FILE_COUNTS:
+            sections.append((size * 4 + (-4 * size % 8), 'I'))
+        if flags & _FILE_MULTIPLICITY:
+            sections.append((slot_count * 4 + (-4 * slot_count % 8), 'I'))
+        sections.append(((slot_count + 7) // 8, 'B'))
+        if len(view) != header.size + sum(length for length, _ in sections):
+            raise ValueError('{} has unexpected length {:d}'.format(path, len(view)))
+        offset = header.size
+        buffers = []
+        for length, code in sections:
+            buffers.append(view[offset:offset + length].cast(code))
+            offset += length
+
+        def split(buffer, parts, length):
+            return tuple(buffer[part * length:(part + 1) * length] for part in range(parts))
+
+        tree = cls.__new__(cls)
+        tree.__log_level = debug_level()
+        tree.__dimensions = dimensions
+        tree.__alpha = 1
+        tree.__leaf_size = leaf_size
+        tree.__version = 0
+        tree.__size = size
+        tree.__extent = None
+        if flags & _FILE_EXTENT:
+            extent = buffers[0].tolist()
+            tree.__extent = (tuple(extent[:dimensions]), tuple(extent[dimensions:]))
+        tree.__tree = PointStorage(split(buffers[1], dimensions, slot_count), buffers[-1])
+        tree.__valid = tree.__tree.valid
+        tree.__cells = None
+        if flags & _FILE_CELLS:
+            cells = split(buffers[2], 2 * dimensions, size)
+            tree.__cells = (cells[:dimensions], cells[dimensions:])
+        tree.__multiplicity = None
+        if flags & _FILE_MULTIPLICITY:
+            tree.__multiplicity = buffers[-2][:slot_count]
+        tree.__counts = None
+        if flags & _FILE_COUNTS:
+            tree.__counts = buffers[-3 if flags & _FILE_MULTIPLICITY else -2][:size]
+        tree.__point_count = point_count
+        if tree.__log_level >= 0:
+            tree.__log(0, 0, 'Tree of size %d mapped from %s', size, path)
+        return tree
+
+    def __subtree(self, index):
+        """Indeksy wszystkich miejsc poddrzewa węzła, poziom po poziomie
+
+        :param index: indeks korzenia poddrzewa
+        :return: generator indeksów (zajętych i pustych, na końcu miejsca kubełków)
+        """
+        first, width = index, 1
+        while first < self.__size:
+            yield from range(first, min(first + width, self.__size))
+            first, width = first*2+1, width*2
+        if self.__leaf_size > 1:
+            # kubełki poddrzewa leżą w magazynie obok siebie
+            yield from range(self.__bucket(first).start, self.__bucket(first + width).start)
+
+    def __subtree_count(self, index):
+        """Liczba zajętych węzłów poddrzewa - odczyt liczności lub zliczenie bitmapy
+        (liczności uwzględniają krotności, więc przy powtórzonych punktach zliczana
+        jest bitmapa)
+
+        :param index: indeks korzenia poddrzewa
+        :return: liczba węzłów
+        """
+        if self.__counts is not None and self.__multiplicity is None:
+            return self.__counts[index]
+        return sum(1 for i in self.__subtree(index) if self.__tree.is_valid(i))
+
+    def __check_writable(self, point):
+        """Sprawdzenie czy drzewo można modyfikować zadanym punktem
+
+        :param point: wstawiany lub usuwany punkt
+        :return: None
+        """
+        if self.read_only:
+            raise ValueError('Tree mapped from a file is read-only')
+        if len(point) != self.__dimensions:
+            raise ValueError('Expected {:d}-dimensional point, got {}'.format(
+                self.__dimensions, point))
+
+    def __capacity_size(self, point_count):
+        """Najmniejszy rozmiar tablicy drzewa (2^k - 1), w którym punkty zajmują
+        co najwyżej część alpha miejsc (razem z miejscami kubełków)
+
+        :param point_count: liczba punktów
+        :return: rozmiar tablicy drzewa
+        """
+        size = 1 if self.__leaf_size > 1 else 0
+        while point_count > self.__alpha * _storage_size(size, self.__leaf_size):
+            size = size*2+1
+        return size
+
+    def __collect(self, index=0):
+        """Punkty poddrzewa węzła wraz z krotnościami (do przebudowy)
+
+        :param index: indeks korzenia poddrzewa
+        :return: krotka (lista punktów, lista krotności lub None bez powtórzonych punktów)
+        """
+        slots = [slot for slot in self.__subtree(index) if self.__tree.is_valid(slot)]
+        weights = None
+        if self.__multiplicity is not None:
+            weights = [self.__multiplicity[slot] for slot in slots]
+        return [self.__tree[slot] for slot in slots], weights
+
+    def __rebuild(self, index, points, weights=None):
+        """Zbalansowana przebudowa poddrzewa węzła z zadanych punktów
+        Poprzednie punkty poddrzewa są usuwane, komórka węzła zostaje ta sama
+        Dla korzenia (index = -1) budowana jest cała tablica od nowa,
+        o rozmiarze dobranym do progu alpha
+
+        :param index: indeks korzenia poddrzewa lub -1 dla całego drzewa
+        :param points: różne punkty nowego poddrzewa
+        :param weights: krotności punktów lub None (drzewo bez powtórzonych punktów)
+        :return: None
+        """
+        if self.__log_level >= 1:
+            self.__log(1, 0, 'Rebuilding subtree %d of %d points', index, len(points))
+        if index < 0:
+            self.__allocate(self.__capacity_size(len(points)),
+                            self.__counts is not None, self.__cells is not None)
+            self.__build_from_list(points, weights)
+            return
+        for slot in self.__subtree(index):
+            self.__tree[slot] = None
+            if self.__counts is not None and slot < self.__size:
+                self.__counts[slot] = 0
+            if self.__multiplicity is not None:
+                self.__multiplicity[slot] = 0
+        cell = None
+        if self.__cells is not None:
+            cell = tuple(tuple(column[index] for column in bound) for bound in self.__cells)
+        orders, ranks = self.__sort_points(points)
+        self.__make_split((index + 1).bit_length() - 1, index, orders,
+                          (points, ranks, weights), cell)
+
+    def insert(self, point):
+        """Wstawienie punktu do drzewa
+        Punkt schodzi ścieżką porównań (ten sam porządek co przy budowaniu)
+        do pierwszego pustego miejsca w tablicy drzewa:
+        - jeśli miejsce mieści się w tablicy, punkt jest tam zapisywany - O(log N)
+        - w przeciwnym razie szukany jest najniższy przodek, którego poddrzewo
+          wraz z nowym punktem nie przekroczy progu zapełnienia swoich miejsc,
+          i tylko to poddrzewo jest przebudowywane - próg to alpha dla korzenia
+          i rośnie do 1 dla głębokich poddrzew, więc przebudowane poddrzewo
+          zostawia swoim potomkom zapas miejsc (jak w tablicach z lukami, PMA)
+        - dopiero gdy nawet korzeń przekracza próg, tablica rośnie
+          i całe drzewo jest budowane od nowa
+        Przebudowa poddrzewa o m punktach kosztuje O(m log m), a kolejna przebudowa
+        tego samego poddrzewa wymaga wstawienia do niego wielu punktów, więc koszt
+        zamortyzowany jest polilogarytmiczny
+        Punkt już obecny w drzewie leży na ścieżce zejścia - zwiększana jest tylko
+        jego krotność, bez zajmowania nowego węzła
+        Z kubełkami (leaf_size > 1) zejście kończy się w kubełku - punkt zajmuje
+        jego wolne miejsce, a przebudowa następuje dopiero po zapełnieniu kubełka
+
+        :param point: wstawiany punkt
+        :return: None
+        """
+        self.__check_writable(point)
+        self.__log_level = debug_level()
+        if self.__log_level >= 1:
+            self.__log(1, 0, 'Inserting %s', point)
+        path, slot, duplicate = self.__descend(point)
+        if duplicate:
+            if self.__multiplicity is None:
+                self.__multiplicity = array('I', [self.__tree.is_valid(index)
+                                                  for index in range(len(self.__tree))])
+            self.__multiplicity[slot] += 1
+        elif slot >= 0:
+            self.__place(slot, path, point)
+        else:
+            path = self.__rebuild_for(path, point)
+        if self.__counts is not None:
+            for ancestor in path:
+                self.__counts[ancestor] += 1
+        if self.__extent is None:
+            self.__extent = (tuple(point), tuple(point))
+        else:
+            self.__extent = (tuple(map(min, self.__extent[0], point)),
+                             tuple(map(max, self.__extent[1], point)))
+        self.__point_count += 1
+        self.__version += 1
+
+    def __descend(self, point):
+        """Zejście wstawianego punktu ścieżką porównań do pierwszego wolnego miejsca
+        (lub miejsca z tym samym punktem) - komórki mijanych węzłów są poszerzane o punkt
+
+        :param point: wstawiany punkt
+        :return: krotka (ścieżka mijanych węzłów, indeks miejsca lub -1 gdy brak
+                 wolnego miejsca, czy miejsce zawiera ten sam punkt)
+        """
+        tree = self.__tree
+        path = []
+        index = 0
+        while index < self.__size and tree.is_valid(index):
+            path.append(index)
+            if self.__cells is not None:
+                # komórki po usunięciach mogą być węższe niż nowe płaszczyzny podziału
+                for cell_axis, coordinate in enumerate(point):
+                    low, high = self.__cells[0][cell_axis], self.__cells[1][cell_axis]
+                    low[index] = min(low[index], coordinate)
+                    high[index] = max(high[index], coordinate)
+            axis = self.__axis(index)
+            value = tree.columns[axis][index]
+            if point[axis] < value:
+                index = index*2+1
+            elif point[axis] > value:
+                index = index*2+2
+            else:
+                # krotki porównywane tylko przy równej współrzędnej osi podziału
+                node = tree[index]
+                if node == tuple(point):
+                    return path, index, True
+                if (*point[axis:], *point[:axis]) < (*node[axis:], *node[:axis]):
+                    index = index*2+1
+                else:
+                    index = index*2+2
+        if index < self.__size:
+            return path, index, False
+        if self.__leaf_size == 1:
+            return path, -1, False
+        # ten sam punkt w kubełku lub jego wolne miejsce
+        slots = self.__scan_bucket(index, (point, point))[1]
+        if slots:
+            return path, slots[0], True
+        free = [slot for slot in self.__bucket(index) if not tree.is_valid(slot)]
+        return path, free[0] if free else -1, False
+
+    def __place(self, slot, path, point):
+        """Zapis nowego punktu w wolnym miejscu (węźle lub miejscu kubełka)
+
+        :param slot: indeks wolnego miejsca
+        :param path: ścieżka węzłów od korzenia do rodzica miejsca
+        :param point: wstawiany punkt
+        :return: None
+        """
+        self.__tree[slot] = point
+        if self.__multiplicity is not None:
+            self.__multiplicity[slot] = 1
+        if slot >= self.__size:
+            return
+        if self.__cells is not None:
+            for bound, limit in zip(self.__cells, (-math.inf, math.inf)):
+                for column in bound:
+                    column[slot] = column[path[-1]] if path else limit
+            if path:
+                # komórka dziecka - komórka rodzica przecięta jego płaszczyzną podziału
+                axis = self.__axis(path[-1])
+                self.__cells[slot % 2][axis][slot] = self.__tree.columns[axis][path[-1]]
+        if self.__counts is not None:
+            self.__counts[slot] = 1
+
+    def __rebuild_for(self, path, point):
+        """Przebudowa najniższego przodka z miejscem na zbalansowane poddrzewo
+        z dodatkowym punktem (lub całego drzewa w większej tablicy)
+
+        :param path: ścieżka węzłów od korzenia do miejsca wstawienia
+        :param point: wstawiany punkt
+        :return: przodkowie przebudowanego poddrzewa (ich liczności trzeba zwiększyć)
+        """
+        levels = self.__size.bit_length()
+        for depth in range(len(path) - 1, -1, -1):
+            count = self.__subtree_count(path[depth]) + 1
+            # próg zapełnienia rośnie liniowo od alpha w korzeniu do 1 przy liściach
+            threshold = self.__alpha + (1 - self.__alpha) * depth / levels
+            if count <= threshold * _storage_size((1 << (levels - depth)) - 1,
+                                                  self.__leaf_size):
+                points, weights = self.__collect(path[depth])
+                self.__rebuild(path[depth], points + [tuple(point)],
+                               None if weights is None else weights + [1])
+                return path[:depth]
+        points, weights = self.__collect()
+        self.__rebuild(-1, points + [tuple(point)], None if weights is None else weights + [1])
+        return []
+
+    def __find(self, point):
+        """Wyszukanie miejsca (węzła lub kubełka) przechowującego dokładnie zadany punkt
+
+        :param point: szukany punkt
+        :return: indeks miejsca lub -1, jeśli punktu nie ma w drzewie
+        """
+        columns = self.__tree.columns
+        stack = [0] if self.__tree.is_valid(0) else []
+        while stack:
+            index = stack.pop()
+            if index >= self.__size:
+                slots = self.__scan_bucket(index, (point, point))[1]
+                if slots:
+                    return slots[0]
+                continue
+            axis = self.__axis(index)
+            value = columns[axis][index]
+            if point[axis] < value:
+                children = (index*2+1,)
+            elif point[axis] > value:
+                children = (index*2+2,)
+            else:
+                if all(coordinate == column[index]
+                       for coordinate, column in zip(point, columns)):
+                    return index
+                children = (index*2+2, index*2+1)
+            stack.extend(child for child in children if self.__occupied(child))
+        return -1
+
+    def __extreme(self, index, axis, largest):
+        """Wyszukanie węzła poddrzewa o najmniejszym (największym) punkcie w porządku osi
+        Porządek osi to porządek leksykograficzny współrzędnych (a, a+1, ..., a-1),
+        ten sam co przy budowaniu - zastępca usuwanego węzła zachowuje więc porządek
+        drzewa także dla punktów o równej współrzędnej osi podziału, a insert
+        znajduje istniejący punkt na swojej ścieżce zejścia
+        W węzłach dzielących tę samą oś przeszukiwana jest tylko jedna strona
+
+        :param index: indeks korzenia poddrzewa (lub kubełka)
+        :param axis: oś porównania
+        :param largest: True - szukamy maksimum, False - minimum
+        :return: indeks znalezionego miejsca (węzła lub miejsca kubełka)
+        """
+        columns = self.__tree.columns[axis:] + self.__tree.columns[:axis]
+        best = -1
+        best_key = None
+        stack = [index]
+        while stack:
+            node = stack.pop()
+            slots = self.__scan_bucket(node)[1] if node >= self.__size else (node,)
+            for slot in slots:
+                key = tuple(column[slot] for column in columns)
+                if best < 0 or (key > best_key if largest else key < best_key):
+                    best, best_key = slot, key
+            if node >= self.__size:
+                continue
+            if self.__axis(node) == axis:
+                children = (node*2+2,) if largest else (node*2+1,)
+            else:
+                children = (node*2+1, node*2+2)
+            stack.extend(child for child in children if self.__occupied(child))
+        return best
+
+    def remove(self, point):
+        """Usunięcie punktu z drzewa
+        Punktowi powtórzonemu zmniejszana jest tylko krotność
+        Usuwany węzeł jest zastępowany najmniejszym w porządku osi podziału punktem
+        z prawego poddrzewa (lub największym z lewego, gdy prawego brak),
+        a zwolnione miejsce przesuwa się w dół aż do liścia - O(log N) na poziom
+        Komórki węzłów nie są przeliczane - pozostają obszarami zawierającymi
+        poddrzewa (insert poszerza je o wstawiane punkty), więc wyszukiwanie
+        jest poprawne, a kolejna przebudowa przywraca dokładne komórki
+        Gdy punkty zajmują mniej niż alpha/4 tablicy, drzewo jest budowane od nowa
+        w mniejszej tablicy
+
+        :param point: usuwany punkt
+        :return: None
+        """
+        self.__check_writable(point)
+        self.__log_level = debug_level()
+        if self.__log_level >= 1:
+            self.__log(1, 0, 'Removing %s', point)
+        tree = self.__tree
+        counts = self.__counts
+        multiplicity = self.__multiplicity
+        index = self.__find(point)
+        if index < 0:
+            raise ValueError('Point {} is not in the tree'.format(point))
+        # usunięty punkt ubywa ze wszystkich poddrzew zawierających jego węzeł
+        if counts is not None:
+            ancestor = self.__node(index)
+            while ancestor >= 0:
+                if ancestor < self.__size:
+                    counts[ancestor] -= 1
+                ancestor = self.__parent(ancestor)
+        self.__point_count -= 1
+        self.__version += 1
+        if multiplicity is not None and multiplicity[index] > 1:
+            multiplicity[index] -= 1
+            return
+        # miejsce kubełka jest po prostu zwalniane
+        while index < self.__size:
+            axis = self.__axis(index)
+            if self.__occupied(index*2+2):
+                replacement = self.__extreme(index*2+2, axis, False)
+            elif self.__occupied(index*2+1):
+                replacement = self.__extreme(index*2+1, axis, True)
+            else:
+                break
+            tree[index] = tree[replacement]
+            copies = 1
+            if multiplicity is not None:
+                copies = multiplicity[index] = multiplicity[replacement]
+            if counts is not None:
+                # przeniesiony punkt opuszcza poddrzewa pomiędzy węzłami
+                node = self.__node(replacement)
+                while node != index:
+                    if node < self.__size:
+                        counts[node] -= copies
+                    node = self.__parent(node)
+            index = replacement
+        tree[index] = None
+        if multiplicity is not None:
+            multiplicity[index] = 0
+        if self.__point_count * 4 < self.__alpha * _storage_size(self.__size, self.__leaf_size) \
+                and self.__capacity_size(self.__point_count) < self.__size:
+            self.__rebuild(-1, *self.__collect())
+
+    @property
+    def read_only(self):
+        """Czy drzewo jest tylko do odczytu (wczytane z pliku przez load)
+
+        :return: True dla drzewa opartego na mapowanym pliku
+        """
+        return isinstance(self.__tree.valid, memoryview)
+
+
+class IndexKDTree:
+    """Klasa reprezentująca zwarte drzewo KD przechowujące tylko indeksy punktów
+    Współrzędne nie są kopiowane - miejsca drzewa zawierają indeksy int32 wierszy
+    tablicy punktów przekazanej przez wywołującego (4 bajty na miejsce), a zapytania
+    zwracają tablice tych indeksów, gotowe do wybrania wierszy tablicy punktów
+    i kolumn z danymi towarzyszącymi (np. payload[indices]) bez tworzenia krotek
+    Układ drzewa jest taki sam jak w KDTree zbudowanym z tej tablicy (_median_split),
+    ale powtórzone punkty nie są zwijane - każdy wiersz ma własne miejsce
+    Zapytania wykonywane są wektorowo (_batch_range_search), wymagany jest numpy
+    Tablica punktów nie może być modyfikowana, dopóki drzewo jest używane
+
+    """
+
+    def __init__(self, points, leaf_size=1):
+        """Budowanie drzewa indeksów dla tablicy punktów
+
+        :param points: tablica numpy (N, k) współrzędnych punktów - drzewo przechowuje
+                       do niej referencję, bez kopiowania
+        :param leaf_size: pojemność kubełka liści (jak w KDTree)
+        """
+        if np is None:
+            raise ImportError('numpy is required for IndexKDTree')
+        if not isinstance(points, np.ndarray) or points.ndim != 2 or points.shape[1] < 1:
+            raise ValueError('Expected an (N, k) array of points, got {}'.format(
+                getattr(points, 'shape', type(points).__name__)))
+        if len(points) > np.iinfo(np.int32).max:
+            raise ValueError('IndexKDTree supports at most {:d} points'.format(
+                np.iinfo(np.int32).max))
+        if not isinstance(leaf_size, int) or leaf_size < 1:
+            raise ValueError('leaf_size must be a positive integer, got {}'.format(leaf_size))
+        if debug_level() >= 0:
+            LOGGER.log(LOG_LEVELS[0], 'Creating index kdtree of %d points', len(points))
+        self.__points = points
+        self.__leaf_size = leaf_size
+        # kolumny tablicy punktów - widoki, bez kopiowania
+        self.__columns = tuple(points[:, axis] for axis in range(points.shape[1]))
+        slots, counts, _, _ = _median_split(np.asarray(points, dtype=np.float64),
+                                            leaf_size=leaf_size, collapse=False)
+        self.__size = len(counts)
+        self.__rows = slots.astype(np.int32)
+
+    @property
+    def points(self):
+        """Getter prywatnej zmiennej __points
+
+        :return: tablica punktów, do której odnoszą się indeksy drzewa
+        """
+        return self.__points
+
+    @property
+    def rows(self):
+        """Getter prywatnej zmiennej __rows
+
+        :return: tablica int32 indeksów wierszy w kolejnych miejscach drzewa (-1 = puste)
+                 - tylko do odczytu
+        """
+        return self.__rows
+
+    @property
+    def size(self):
+        """Getter prywatnej zmiennej __size
+
+        :return: rozmiar drzewa (liczba węzłów, bez miejsc kubełków)
+        """
+        return self.__size
+
+    @property
+    def leaf_size(self):
+        """Getter prywatnej zmiennej __leaf_size
+
+        :return: pojemność kubełka liści
+        """
+        return self.__leaf_size
+
+    @property
+    def dimensions(self):
+        """Liczba wymiarów punktów drzewa
+
+        :return: liczba kolumn tablicy punktów
+        """
+        return len(self.__columns)
+
+    @property
+    def nbytes(self):
+        """Rozmiar danych drzewa w bajtach (bez tablicy punktów)
+
+        :return: liczba bajtów tablicy indeksów
+        """
+        return self.__rows.nbytes
+
+    def __len__(self):
+        """Liczba punktów drzewa
+
+        :return: liczba wierszy tablicy punktów
+        """
+        return len(self.__points)
+
+    def search_ranges(self, rects, csr=False):
+        """Wyszukiwanie wielu obszarów jednym wywołaniem
+
+        :param rects: lista lub tablica (Q, 2, k) obszarów [(bottom_left, top_right), ...]
+        :param csr: jeśli True, wynik w formacie CSR: (offsets, indices) - indeksy wierszy
+                    dla zapytania i to indices[offsets[i]:offsets[i+1]]
+        :return: lista tablic int32 indeksów wierszy dla kolejnych obszarów
+                 lub krotka (offsets, indices)
+        """
+        rects = np.asarray(rects, dtype=np.float64).reshape(-1, 2, self.dimensions)
+        queries, nodes = _batch_range_search(self.__columns, None, rects[:, 0], rects[:, 1],
+                                             self.__size, self.__leaf_size, self.__rows)
+        indices = self.__rows[nodes[np.argsort(queries, kind='stable')]]
+        offsets = np.zeros(len(rects) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(queries, minlength=len(rects)), out=offsets[1:])
+        if csr:
+            return offsets, indices
+        return np.split(indices, offsets[1:-1])
+
+    def search_range(self, bottom_left, top_right):
+        """Wyszukiwanie punktów należących do zadanego przedziału
+
+        :param bottom_left: dolny róg przedziału (najmniejsze współrzędne we wszystkich osiach)
+        :param top_right: górny róg przedziału (największe współrzędne we wszystkich osiach)
+        :return: tablica int32 indeksów wierszy punktów należących do przedziału
+        """
+        return self.search_ranges([(bottom_left, top_right)], csr=True)[1]
+
+    def count_range(self, bottom_left, top_right):
+        """Zliczanie punktów należących do przedziału
+
+        :param bottom_left: dolny róg przedziału
+        :param top_right: górny róg przedziału
+        :return: liczba punktów należących do przedziału
+        """
+        return len(self.search_range(bottom_left, top_right))
+
+
+class RangeResult:
+    """Klasa reprezentująca wynik wyszukiwania obszaru
+    Zastępuje dawne pola drzewa (range, range_points, traversed_points),
+    dzięki czemu kolejne zapytania nie nadpisują sobie wyników
+
+    """
+
+    def __init__(self, bounds, points, traversed=None, visited_count=None):
+        """Inicjalizacja wyniku
+
+        :param bounds: przeszukiwany obszar (bottom_left, top_right)
+        :param points: punkty należące do obszaru
+        :param traversed: odwiedzone węzły lub None, jeśli nie były zapisywane
+        :param visited_count: liczba odwiedzonych węzłów lub None, jeśli nie była liczona
+        """
+        self.__bounds = bounds
+        self.__points = points
+        self.__traversed = traversed
+        self.__visited_count = visited_count
+
+    @property
+    def bounds(self):
+        """Przeszukiwany obszar
+
+        :return: krotka (bottom_left, top_right)
+        """
+        return self.__bounds
+
+    @property
+    def points(self):
+        """Punkty należące do obszaru
+
+        :return: lista punktów
+        """
+        return self.__points
+
+    @property
+    def traversed(self):
+        """Węzły odwiedzone w trakcie wyszukiwania
+
+        :return: lista punktów lub None, jeśli nie były zapisywane
+        """
+        return self.__traversed
+
+    @property
+    def visited_count(self):
+        """Liczba węzłów odwiedzonych w trakcie wyszukiwania
+
+        :return: liczba węzłów lub None (tryb TRAVERSAL_NONE)
+        """
+        return self.__visited_count
+
+    @property
+    def matched_count(self):
+        """Liczba znalezionych punktów
+
+        :return: liczba punktów należących do obszaru
+        """
+        return len(self.__points)
+
+    def __len__(self):
+        """Liczba znalezionych punktów
+
+        :return: długość listy punktów
+        """
+        return len(self.__points)
+
+    def __iter__(self):
+        """Iteracja po znalezionych punktach
+
+        :return: iterator listy punktów
+        """
+        return iter(self.__points)
+
 
 if __name__ == "__main__":
+    configure_logging(4)
     print('TEST')
     T = KDTree([(0,0), (1,1), (2,2), (3,3), (4,4), (5,5), (6,6)])
     print(T)
@@ -8,13 +8,14 @@ import math
 from collections import deque
 import data_generator as dg
 import kdtree as kdt
+import query_cache as qc
 os.environ['SDL_VIDEO_WINDOW_POS'] = "0, 32"
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
 import pygame
 
 # poziom wypisywania logów na 0 - żeby nie spowalniać
-# można dać wartości z zakresu 0-5
-kdt.KDTree.DEBUG_LEVEL = 0
+# można dać wartości z zakresu 0-5, None wyłącza logi całkowicie
+kdt.configure_logging(0)
 
 # sekcja stałych globalnych i ważniejszych zmiennych wyświetlania
 TARGET_FPS = 60
@@ -156,17 +157,19 @@ class FPSCounter:
         return self.__fps
 
 
-def do_stuff(set_array, range_bounds):
+def do_stuff(set_array, range_bounds, cache):
     """Funkcja pomocnicza do tworzenia drzewa na podstawie zadanych parametrów
 
     :param set_array: zbiór punktów
     :param range_bounds: obszar przeszukiwania
-    :return: drzewo kd
+    :param cache: pamięć wyników zapytań - przełączana na nowe drzewo
+    :return: drzewo kd oraz wynik wyszukiwania obszaru
     """
-    tree = kdt.KDTree(set_array)
-    tree.search_range(range_bounds[0], range_bounds[1])
+    tree = kdt.KDTree(set_array, cell_bounds=True)
+    cache.tree = tree
+    result = cache.query_range(range_bounds[0], range_bounds[1], traversal=kdt.TRAVERSAL_POINTS)
     print(tree)
-    return tree
+    return tree, result
 
 
 def draw_points(surface, points, point_color, size):
@@ -207,8 +210,10 @@ if __name__ == "__main__":
     # przygotowanie zestawów danych
     vertices = G.point_set
     search_range = G.range
+    # pamięć wyników - powrót do odwiedzonego obszaru nie przeszukuje drzewa ponownie
+    C = qc.RangeQueryCache(max_points=1000000)
     # operacje na drzewie
-    T = do_stuff(vertices, search_range)
+    T, R = do_stuff(vertices, search_range, C)
 
     # inicjalizacja grafiki
     print(LOG_SPACER)
@@ -258,7 +263,7 @@ if __name__ == "__main__":
                     big_font.render(WARNING_STRING, True, FONT_INFO_RGB),
                     (X_OFFSET, Y_OFFSET))
                 pygame.display.flip()
-                T = do_stuff(vertices, search_range)
+                T, R = do_stuff(vertices, search_range, C)
                 data_update_flag = True
             # zmiana zakresu klawiszem 'r'
             if event.type == pygame.KEYDOWN and event.key == pygame.K_r:
@@ -268,7 +273,7 @@ if __name__ == "__main__":
                     G.next_range()
                 search_range = G.range
                 print(LOG_SPACER)
-                T.search_range(search_range[0], search_range[1])
+                R = C.query_range(search_range[0], search_range[1], traversal=kdt.TRAVERSAL_POINTS)
                 data_update_flag = True
             # zmiana poziomu rysowania odcięć
             if event.type == pygame.KEYDOWN and event.key == pygame.K_d:
@@ -297,7 +302,7 @@ if __name__ == "__main__":
                 G.add_range(mouse_range_canvas)
                 search_range = G.range
                 print(LOG_SPACER)
-                T.search_range(search_range[0], search_range[1])
+                R = C.query_range(search_range[0], search_range[1], traversal=kdt.TRAVERSAL_POINTS)
                 data_update_flag = True
                 mouse_range_canvas = None
                 mouse_range_screen = None
@@ -322,7 +327,7 @@ if __name__ == "__main__":
                     big_font.render(WARNING_STRING, True, FONT_INFO_RGB),
                     (X_OFFSET, Y_OFFSET))
                 pygame.display.flip()
-                T = do_stuff(vertices, search_range)
+                T, R = do_stuff(vertices, search_range, C)
                 data_update_flag = True
 
         if data_update_flag:
@@ -342,9 +347,9 @@ if __name__ == "__main__":
             range_points = []
             for vertex in vertices:
                 set_points.append(point_to_screen(vertex))
-            for vertex in T.range_points:
+            for vertex in R.points:
                 range_points.append(point_to_screen(vertex))
-            for vertex in T.traversed_points:
+            for vertex in R.traversed:
                 traversed_points.append(point_to_screen(vertex))
             T_screen = []
             for index in range(T.size):
@@ -371,12 +376,12 @@ if __name__ == "__main__":
                                      (0, Y_OFFSET - y_line),
                                      (WINDOW_WIDTH, Y_OFFSET - y_line), 1)
             # range search
-            if T.range[0] is not None:
+            if R.bounds[0] is not None:
                 pygame.draw.rect(geometry_image, RANGE_RGB, (
-                    x_to_screen(T.range[0][0]),
-                    y_to_screen(T.range[0][1]),
-                    x_to_screen(T.range[1][0]) - x_to_screen(T.range[0][0]),
-                    y_to_screen(T.range[1][1]) - y_to_screen(T.range[0][1])), 0)
+                    x_to_screen(R.bounds[0][0]),
+                    y_to_screen(R.bounds[0][1]),
+                    x_to_screen(R.bounds[1][0]) - x_to_screen(R.bounds[0][0]),
+                    y_to_screen(R.bounds[1][1]) - y_to_screen(R.bounds[0][1])), 0)
             # linie odcięć
             level_bound = 1
             depth = 0
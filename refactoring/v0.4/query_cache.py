@@ -0,0 +1,241 @@
+"""Moduł zawierający pamięć podręczną wyników zapytań obszarowych
+
+"""
+
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy jest opcjonalny - bez niego filtrowanie wyników odbywa się w pętli
+    np = None
+
+
+class RangeQueryCache:
+    """Klasa zapamiętująca wyniki wyszukiwania obszarów (LRU)
+    - kluczem jest obszar (bottom_left, top_right) i tryb zapisu przebiegu
+    - po przekroczeniu limitu wpisów lub łącznej liczby zapamiętanych punktów
+      (razem z wierszami tablic filtrowania) usuwane są najdawniej używane wpisy
+    - zmiana drzewa (przypisanie nowego) lub jego modyfikacja (zmiana version)
+      czyści pamięć, więc wyniki nigdy nie są nieaktualne
+    - opcjonalnie (containment) obszar zawarty w zapamiętanym obszarze jest
+      wyznaczany przez filtrowanie punktów tego obszaru (wektorowo z numpy),
+      bez przechodzenia drzewa - np. przy przybliżaniu widoku
+    Zwracane wyniki są współdzielone z pamięcią - nie należy ich modyfikować
+
+    """
+
+    def __init__(self, tree=None, max_entries=128, max_points=None, containment=False):
+        """Inicjalizacja pamięci
+
+        :param tree: drzewo KD (lub inny obiekt z search_range/query_range)
+        :param max_entries: maksymalna liczba zapamiętanych obszarów
+        :param max_points: maksymalna łączna liczba zapamiętanych punktów
+                           (wyniki, odwiedzone węzły i wiersze tablic numpy
+                           zawartych obszarów), None - bez limitu
+        :param containment: czy wyznaczać wyniki zawartych obszarów z zapamiętanych
+                            wyników (kolejność punktów jest wtedy kolejnością
+                            w zapamiętanym wyniku, nie w drzewie)
+        """
+        self.__max_entries = max_entries
+        self.__max_points = max_points
+        self.__entries = OrderedDict()
+        self.__containment = containment
+        # tablice numpy punktów wpisów używanych do filtrowania (tworzone przy potrzebie)
+        self.__arrays = {}
+        self.__points = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__contained_hits = 0
+        self.__tree = None
+        self.__version = None
+        self.tree = tree
+
+    @property
+    def tree(self):
+        """Getter drzewa, którego wyniki są zapamiętywane
+
+        :return: drzewo KD
+        """
+        return self.__tree
+
+    @tree.setter
+    def tree(self, tree):
+        """Setter drzewa - nowe drzewo unieważnia zapamiętane wyniki
+
+        :param tree: drzewo KD
+        """
+        if tree is not self.__tree:
+            self.clear()
+        self.__tree = tree
+        self.__version = getattr(tree, 'version', None)
+
+    @property
+    def hits(self):
+        """Getter liczby trafień
+
+        :return: liczba zapytań obsłużonych z pamięci
+        """
+        return self.__hits
+
+    @property
+    def misses(self):
+        """Getter liczby chybień
+
+        :return: liczba zapytań przekazanych do drzewa
+        """
+        return self.__misses
+
+    @property
+    def contained_hits(self):
+        """Getter liczby chybień obsłużonych filtrowaniem zapamiętanego obszaru
+
+        :return: liczba zapytań wyznaczonych bez przeszukiwania drzewa
+        """
+        return self.__contained_hits
+
+    @property
+    def points(self):
+        """Getter łącznej liczby zapamiętanych punktów
+
+        :return: liczba punktów wszystkich wpisów i wierszy ich tablic numpy
+        """
+        return self.__points
+
+    def __len__(self):
+        """Liczba zapamiętanych obszarów
+
+        :return: liczba wpisów
+        """
+        return len(self.__entries)
+
+    def clear(self):
+        """Usunięcie wszystkich zapamiętanych wyników (liczniki zostają)
+
+        :return: None
+        """
+        self.__entries.clear()
+        self.__arrays.clear()
+        self.__points = 0
+
+    @staticmethod
+    def __weight(result):
+        """Rozmiar wpisu - liczba punktów wyniku i odwiedzonych węzłów
+
+        :param result: lista punktów lub obiekt RangeResult
+        :return: liczba punktów
+        """
+        if isinstance(result, list):
+            return len(result)
+        return len(result.points) + len(result.traversed or ())
+
+    def __keep_array(self, key, points):
+        """Zapamiętanie tablicy numpy punktów wpisu - jej wiersze liczą się do max_points
+
+        :param key: klucz wpisu
+        :param points: tablica (n, k) punktów
+        :return: None
+        """
+        self.__drop_array(key)
+        self.__arrays[key] = points
+        self.__points += len(points)
+
+    def __drop_array(self, key):
+        """Usunięcie tablicy numpy punktów wpisu (jeśli istnieje)
+
+        :param key: klucz wpisu
+        :return: None
+        """
+        points = self.__arrays.pop(key, None)
+        if points is not None:
+            self.__points -= len(points)
+
+    def __lookup(self, key, compute):
+        """Odczyt wpisu lub wyznaczenie i zapamiętanie wyniku
+
+        :param key: klucz wpisu
+        :param compute: funkcja wyznaczająca wynik przy chybieniu
+        :return: wynik zapytania
+        """
+        if getattr(self.__tree, 'version', None) != self.__version:
+            # drzewo zmodyfikowane od ostatniego zapytania
+            self.clear()
+            self.__version = getattr(self.__tree, 'version', None)
+        result = self.__entries.get(key)
+        if result is not None:
+            self.__hits += 1
+            self.__entries.move_to_end(key)
+            return result
+        self.__misses += 1
+        result = compute()
+        weight = self.__weight(result)
+        if self.__max_points is not None \
+                and weight + len(self.__arrays.get(key, ())) > self.__max_points:
+            # pojedynczy wynik większy niż cała pamięć - nie zapamiętujemy
+            # (tablica nadzbioru utworzona przy filtrowaniu mogła jednak przekroczyć limit)
+            self.__drop_array(key)
+        else:
+            self.__entries[key] = result
+            self.__points += weight
+        while len(self.__entries) > self.__max_entries or \
+                self.__max_points is not None and self.__points > self.__max_points:
+            evicted_key, evicted = self.__entries.popitem(last=False)
+            self.__drop_array(evicted_key)
+            self.__points -= self.__weight(evicted)
+        return result
+
+    def search_range(self, bottom_left, top_right):
+        """Wyszukiwanie punktów należących do zadanego przedziału (z pamięci, jeśli to możliwe)
+
+        :param bottom_left: dolny róg przedziału
+        :param top_right: górny róg przedziału
+        :return: punkty należące do przedziału
+        """
+        key = (tuple(bottom_left), tuple(top_right), None)
+        return self.__lookup(key, lambda: self.__search_range(key))
+
+    def __search_range(self, key):
+        """Wyznaczenie wyniku przy chybieniu - filtrowanie najmniejszego zapamiętanego
+        obszaru zawierającego zadany albo przeszukanie drzewa
+
+        :param key: klucz obszaru (bottom_left, top_right, None)
+        :return: punkty należące do przedziału
+        """
+        low, high, _ = key
+        superset = None
+        if self.__containment:
+            for cached_key, cached in self.__entries.items():
+                cached_low, cached_high, mode = cached_key
+                if mode is None and (superset is None or len(cached) < len(superset[1])) \
+                        and all(a <= b for a, b in zip(cached_low, low)) \
+                        and all(a >= b for a, b in zip(cached_high, high)):
+                    superset = (cached_key, cached)
+        if superset is None:
+            return self.__tree.search_range(low, high)
+        self.__contained_hits += 1
+        cached_key, cached = superset
+        if np is None:
+            return [point for point in cached
+                    if all(a <= c <= b for a, c, b in zip(low, point, high))]
+        points = self.__arrays.get(cached_key)
+        if points is None:
+            points = np.array(cached, dtype=np.float64).reshape(len(cached), len(low))
+            self.__keep_array(cached_key, points)
+        points = points[((points >= low) & (points <= high)).all(axis=1)]
+        # wynik też może być nadzbiorem kolejnych zapytań - zachowujemy jego tablicę
+        self.__keep_array(key, points)
+        # krotki budowane z kolumn (zip) - kilka razy szybciej niż tuple() dla wierszy
+        return list(zip(*points.T.tolist()))
+
+    def query_range(self, bottom_left, top_right, **options):
+        """Wyszukiwanie przedziału zwracające pełny wynik (KDTree.query_range),
+        z pamięci, jeśli to możliwe
+
+        :param bottom_left: dolny róg przedziału
+        :param top_right: górny róg przedziału
+        :param options: parametry KDTree.query_range (np. traversal)
+        :return: obiekt RangeResult
+        """
+        key = (tuple(bottom_left), tuple(top_right), tuple(sorted(options.items())))
+        return self.__lookup(key, lambda: self.__tree.query_range(bottom_left, top_right,
+                                                                  **options))
@@ -0,0 +1,161 @@
+"""Moduł zawierający równoległe wykonywanie zapytań na współdzielonym drzewie KD
+
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import kdtree as kdt
+
+# drzewo procesu roboczego - mapowane z pliku raz, przy starcie procesu
+_WORKER_TREE = None
+
+
+def _load_worker_tree(path):
+    """Inicjalizacja procesu roboczego - mapowanie drzewa z pliku (bez kopiowania)
+
+    :param path: ścieżka pliku drzewa (KDTree.save)
+    :return: None
+    """
+    global _WORKER_TREE  # pylint: disable=global-statement
+    _WORKER_TREE = kdt.KDTree.load(path)
+
+
+def _search_batch(rects):
+    """Zadanie procesu roboczego: wyszukanie paczki obszarów
+
+    :param rects: tablica (Q, 2, k) obszarów
+    :return: krotka (offsets, indices) w formacie CSR - indeksy węzłów drzewa jako int32
+    """
+    offsets, indices = _WORKER_TREE.search_ranges(rects, csr=True)
+    return offsets.astype(np.int64), indices.astype(np.int32)
+
+
+class QueryPool:
+    """Klasa wykonująca zapytania obszarowe w wielu procesach
+    Każdy proces roboczy mapuje to samo drzewo z pliku (KDTree.load),
+    więc dane drzewa są współdzielone przez cache stron systemu,
+    a nie kopiowane do każdego procesu
+    Wyniki wracają jako tablice CSR indeksów węzłów (offsets, indices),
+    a nie listy krotek - serializacja to kilka buforów numpy
+
+    """
+
+    def __init__(self, tree, workers=None):
+        """Inicjalizacja puli
+
+        :param tree: ścieżka pliku drzewa (KDTree.save) lub drzewo KD -
+                     drzewo jest wtedy zapisywane do pliku tymczasowego
+        :param workers: liczba procesów, domyślnie liczba rdzeni
+        """
+        self.__temporary = None
+        if isinstance(tree, kdt.KDTree):
+            handle, self.__temporary = tempfile.mkstemp(suffix='.kdt')
+            os.close(handle)
+            tree.save(self.__temporary)
+            tree = self.__temporary
+        self.__path = tree
+        # własne mapowanie pliku - do zamiany indeksów węzłów na punkty
+        self.__tree = kdt.KDTree.load(self.__path)
+        self.__workers = workers or os.cpu_count() or 1
+        self.__executor = ProcessPoolExecutor(self.__workers, initializer=_load_worker_tree,
+                                              initargs=(self.__path,))
+
+    @property
+    def tree(self):
+        """Getter drzewa puli (mapowanego z pliku, tylko do odczytu)
+
+        :return: drzewo KD lub None po zamknięciu puli
+        """
+        return self.__tree
+
+    @property
+    def workers(self):
+        """Getter liczby procesów roboczych
+
+        :return: liczba procesów
+        """
+        return self.__workers
+
+    def __enter__(self):
+        """Użycie puli w bloku with
+
+        :return: pula
+        """
+        return self
+
+    def __exit__(self, *exc_info):
+        """Zamknięcie puli na końcu bloku with
+
+        :param exc_info: informacje o wyjątku (ignorowane)
+        :return: None
+        """
+        self.close()
+
+    def close(self):
+        """Zatrzymanie procesów roboczych, zwolnienie mapowania drzewa
+        i usunięcie pliku tymczasowego
+
+        :return: None
+        """
+        self.__executor.shutdown()
+        # mapowanie pliku jest zamykane razem z ostatnim odwołaniem do drzewa
+        self.__tree = None
+        if self.__temporary is not None:
+            # pod Windows usunięcie może się nie udać, jeśli drzewo (tree) jest nadal używane
+            try:
+                os.remove(self.__temporary)
+            except OSError:
+                pass
+            self.__temporary = None
+
+    def __rects(self, rects):
+        """Ujednolicenie obszarów do tablicy (Q, 2, k)
+
+        :param rects: lista lub tablica obszarów [(bottom_left, top_right), ...]
+        :return: tablica numpy
+        """
+        if self.__tree is None:
+            raise RuntimeError('QueryPool is closed')
+        return np.asarray(rects, dtype=np.float64).reshape(-1, 2, self.__tree.dimensions)
+
+    def submit(self, rects):
+        """Wysłanie jednej paczki obszarów do procesu roboczego
+
+        :param rects: lista lub tablica obszarów [(bottom_left, top_right), ...]
+        :return: Future z wynikiem (offsets, indices) w formacie CSR
+        """
+        return self.__executor.submit(_search_batch, self.__rects(rects))
+
+    def search_ranges(self, rects, csr=False, chunk_size=None):
+        """Wyszukiwanie wielu obszarów - paczka dzielona jest równo między procesy,
+        a częściowe wyniki CSR łączone
+
+        :param rects: lista lub tablica obszarów [(bottom_left, top_right), ...]
+        :param csr: jeśli True, wynik w formacie CSR (offsets, indices),
+                    jak w KDTree.search_ranges
+        :param chunk_size: liczba obszarów jednego zadania, domyślnie Q / liczba procesów
+        :return: lista list punktów dla kolejnych obszarów lub krotka (offsets, indices)
+        """
+        rects = self.__rects(rects)
+        if chunk_size is None:
+            chunk_size = max(1, -(-len(rects) // self.__workers))
+        futures = [self.submit(rects[start:start + chunk_size])
+                   for start in range(0, len(rects), chunk_size)]
+        offsets = [np.zeros(1, dtype=np.int64)]
+        indices = []
+        for future in futures:
+            part_offsets, part_indices = future.result()
+            offsets.append(part_offsets[1:] + offsets[-1][-1])
+            indices.append(part_indices)
+        offsets = np.concatenate(offsets)
+        indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32)
+        if csr:
+            return offsets, indices
+        columns, _ = self.__tree.storage.as_numpy()
+        points = list(zip(*(column[indices].tolist() for column in columns)))
+        bounds = offsets.tolist()
+        return [points[bounds[query]:bounds[query + 1]] for query in range(len(rects))]
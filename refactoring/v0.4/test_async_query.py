@@ -0,0 +1,109 @@
+"""Testy modułu async_query - paczkowanie zapytań asyncio
+
+Uruchomienie z katalogu modułu: python -m unittest test_async_query (lub pytest)
+"""
+import asyncio
+import random
+import unittest
+
+import kdtree
+from async_query import AsyncRangeQueries
+from test_kdtree import random_rects
+
+
+class FailingSource:
+    """Źródło zapytań, którego search_ranges zawsze zgłasza błąd
+
+    """
+
+    def __init__(self):
+        """Inicjalizacja licznika wywołań
+
+        """
+        self.calls = 0
+
+    def search_ranges(self, rects):
+        """Wyszukiwanie zakończone błędem
+
+        :param rects: lista obszarów
+        :return: nic - zawsze ValueError
+        """
+        self.calls += 1
+        raise ValueError('search failed for {:d} rectangles'.format(len(rects)))
+
+
+class AsyncRangeQueriesTest(unittest.IsolatedAsyncioTestCase):
+    """Łączenie zapytań w paczki, wyniki i błędy
+
+    """
+
+    def setUp(self):
+        """Drzewo i kilka różnych obszarów
+
+        """
+        rng = random.Random(17)
+        self.points = [(rng.uniform(0, 10), rng.uniform(0, 10)) for _ in range(400)]
+        self.tree = kdtree.KDTree(self.points)
+        self.rects = random_rects(rng, 2, 4)
+
+    async def test_coalescing(self):
+        """Zapytania jednego okna to jedna paczka, powtórzone obszary dzielą wynik
+
+        """
+        queries = AsyncRangeQueries(self.tree, window=0.05)
+        requested = [self.rects[index % 3] for index in range(10)]
+        results = await asyncio.gather(*(queries.search_range(low, high)
+                                         for low, high in requested))
+        self.assertEqual((queries.requests, queries.batches), (10, 1))
+        for (low, high), result in zip(requested, results):
+            self.assertEqual(sorted(result), sorted(self.tree.search_range(low, high)))
+        # każdy oczekujący dostaje własną listę
+        results[0].append(None)
+        self.assertNotIn(None, results[3])
+
+    async def test_max_batch(self):
+        """Paczka z max_batch różnymi obszarami jest wysyłana bez czekania na okno
+
+        """
+        queries = AsyncRangeQueries(self.tree, window=60, max_batch=2)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(queries.search_range(low, high) for low, high in self.rects)), 5)
+        self.assertEqual((queries.requests, queries.batches), (4, 2))
+        for (low, high), result in zip(self.rects, results):
+            self.assertEqual(sorted(result), sorted(self.tree.search_range(low, high)))
+
+    async def test_error(self):
+        """Błąd wyszukiwania trafia do wszystkich oczekujących na paczkę
+
+        """
+        source = FailingSource()
+        queries = AsyncRangeQueries(source, window=0.01)
+        results = await asyncio.gather(*(queries.search_range(low, high)
+                                         for low, high in self.rects + self.rects[:1]),
+                                       return_exceptions=True)
+        self.assertEqual(source.calls, 1)
+        self.assertEqual(len(results), 5)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+
+    async def test_close(self):
+        """close wysyła oczekującą paczkę przed upływem okna i czeka na jej wynik
+
+        """
+        queries = AsyncRangeQueries(self.tree, window=60)
+        low, high = self.rects[0]
+        waiting = [asyncio.ensure_future(queries.search_range(low, high)) for _ in range(2)]
+        await asyncio.sleep(0)
+        waiting[0].cancel()
+        await asyncio.wait_for(queries.close(), 5)
+        self.assertEqual(queries.batches, 1)
+        self.assertEqual(sorted(await waiting[1]), sorted(self.tree.search_range(low, high)))
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting[0]
+        # zamknięcie bez oczekujących zapytań
+        await queries.close()
+        self.assertEqual(queries.batches, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
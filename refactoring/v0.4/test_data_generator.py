@@ -0,0 +1,130 @@
+"""Testy modułu data_generator - zbiory punktów przypadków testowych
+
+Uruchomienie z katalogu modułu: python -m unittest test_data_generator (lub pytest)
+"""
+import os
+import tempfile
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from data_generator import DISTRIBUTIONS, Generator, generate_points, write_points
+
+
+class GeneratePointSetTest(unittest.TestCase):
+    """Losowanie zbioru punktów o różnych współrzędnych X i Y (generate_point_set)
+
+    """
+
+    def test_point_set(self):
+        """Różne współrzędne, zakres, rozdzielczość i pusty obszar wokół (0, 0)
+
+        """
+        generator = Generator()
+        sets = generator.point_set_count
+        generator.generate_point_set(400, (50, 30), div=10, empty=5, seed=20)
+        self.assertEqual(generator.point_set_count, sets + 1)
+        generator.jump_set(sets - generator.point_set_index)
+        points = generator.point_set
+        self.assertEqual(len(points), 400)
+        for axis, bound in ((0, 50), (1, 30)):
+            values = [point[axis] for point in points]
+            self.assertEqual(len(set(values)), len(values))
+            self.assertTrue(all(-bound <= value < bound for value in values))
+            self.assertTrue(all(value < -5 or value >= 5 for value in values))
+            self.assertTrue(all(round(value * 10) == value * 10 for value in values))
+
+    def test_seed(self):
+        """Ten sam seed daje ten sam zbiór, in_place nadpisuje wskazany zbiór
+
+        """
+        generator = Generator()
+        generator.generate_point_set(100, (10, 10), seed=1)
+        generator.generate_point_set(100, (10, 10), seed=1)
+        generator.generate_point_set(100, (10, 10), seed=2)
+        count = generator.point_set_count
+        generator.jump_set(count - 3 - generator.point_set_index)
+        first = generator.point_set
+        generator.next_set()
+        self.assertEqual(generator.point_set, first)
+        generator.next_set()
+        self.assertNotEqual(generator.point_set, first)
+        generator.generate_point_set(10, (10, 10), in_place=True, index=0, seed=3)
+        self.assertEqual(generator.point_set_count, count)
+        generator.jump_set(-generator.point_set_index)
+        self.assertEqual(len(generator.point_set), 10)
+
+    def test_range_too_small(self):
+        """Więcej punktów niż dostępnych współrzędnych daje błąd
+
+        """
+        generator = Generator()
+        with self.assertRaisesRegex(Exception, 'allowed range too small'):
+            generator.generate_point_set(150, (10, 10), div=10, empty=3)
+        # 200 - 2*30 = 140 wartości na oś
+        generator.generate_point_set(140, (10, 10), div=10, empty=3, seed=4)
+
+
+@unittest.skipIf(np is None, 'numpy is required for streaming generators')
+class GeneratePointsTest(unittest.TestCase):
+    """Strumieniowe generowanie punktów (generate_points, write_points)
+
+    """
+
+    def test_chunks(self):
+        """Paczki mają zadany rozmiar, a punkty nie zależą od rozmiaru paczek
+
+        """
+        for distribution in DISTRIBUTIONS:
+            with self.subTest(distribution=distribution):
+                chunks = list(generate_points(150000, distribution, (10, 20, 5), seed=21,
+                                              chunk_size=40000))
+                self.assertEqual([len(chunk) for chunk in chunks], [40000] * 3 + [30000])
+                points = np.concatenate(chunks)
+                self.assertEqual(points.shape, (150000, 3))
+                self.assertTrue((np.abs(points) <= (10, 20, 5)).all())
+                whole = np.concatenate(list(generate_points(150000, distribution, (10, 20, 5),
+                                                            seed=21, chunk_size=1 << 20)))
+                self.assertTrue((points == whole).all())
+                other = np.concatenate(list(generate_points(150000, distribution, (10, 20, 5),
+                                                            seed=22)))
+                self.assertEqual((points == other).all(), distribution == 'grid')
+
+    def test_distributions(self):
+        """Własności rozkładów siatki i punktów powtórzonych
+
+        """
+        grid = np.concatenate(list(generate_points(1000, 'grid', (1, 1), chunk_size=300)))
+        self.assertEqual(len(np.unique(grid, axis=0)), 1000)
+        duplicates = np.concatenate(list(generate_points(5000, 'duplicates', seed=1,
+                                                         distinct=50)))
+        self.assertLessEqual(len(np.unique(duplicates, axis=0)), 50)
+        self.assertEqual(list(generate_points(0)), [])
+
+    def test_errors(self):
+        """Nieznany rozkład lub parametr rozkładu daje ValueError
+
+        """
+        with self.assertRaises(ValueError):
+            next(generate_points(10, 'poisson'))
+        with self.assertRaises(ValueError):
+            next(generate_points(10, 'gaussian', clusterz=3))
+
+    def test_write_points(self):
+        """Plik .npy zawiera te same punkty co generator
+
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'points.npy')
+            write_points(path, 70000, 'gaussian', (5, 5), seed=3, chunk_size=30000)
+            points = np.load(path, mmap_mode='r')
+            expected = np.concatenate(list(generate_points(70000, 'gaussian', (5, 5), seed=3)))
+            self.assertTrue((points == expected).all())
+            del points
+
+
+if __name__ == '__main__':
+    unittest.main()
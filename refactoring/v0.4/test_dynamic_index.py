@@ -0,0 +1,112 @@
+"""Testy modułu dynamic_index - indeks dynamiczny porównywany z licznikiem punktów
+
+Uruchomienie z katalogu modułu: python -m unittest test_dynamic_index (lub pytest)
+"""
+import random
+import unittest
+from collections import Counter
+
+from dynamic_index import DynamicKDTree
+from test_kdtree import brute_range, random_rects, squared_distance
+
+
+class DynamicKDTreeTest(unittest.TestCase):
+    """Wstawianie i usuwanie punktów indeksu dynamicznego
+
+    """
+
+    def check_index(self, index, oracle, rng, queries=10):
+        """Porównanie indeksu z licznikiem punktów na losowych zapytaniach
+
+        :param index: indeks dynamiczny
+        :param oracle: Counter punktów, które powinien zawierać indeks
+        :param rng: generator losowy zapytań
+        :param queries: liczba zapytań
+        :return: None
+        """
+        points = list(oracle.elements())
+        self.assertEqual(len(index), len(points))
+        for low, high in random_rects(rng, 2, queries):
+            expected = brute_range(points, low, high)
+            self.assertEqual(sorted(index.search_range(low, high)), expected)
+            self.assertEqual(sorted(index.iter_range(low, high)), expected)
+            self.assertEqual(index.count_range(low, high), len(expected))
+            distances = sorted(squared_distance(point, low) for point in points)
+            self.assertEqual([squared_distance(point, low) for point in index.knn(low, 5)],
+                             distances[:5])
+
+    def test_levels(self):
+        """Poziom i zawiera buffer_size*2^i punktów jak bity licznika binarnego
+
+        """
+        rng = random.Random(1)
+        index = DynamicKDTree(buffer_size=8)
+        for count in range(1, 300):
+            index.insert((rng.uniform(0, 10), rng.uniform(0, 10)))
+            levels = index.levels
+            self.assertEqual(sum(8 << level for level, _ in levels), count - count % 8)
+            for level, tree in levels:
+                self.assertEqual(len(tree), 8 << level)
+        self.assertEqual(index.version, 299)
+
+    def test_updates(self):
+        """Losowy ciąg wstawień i usunięć z powtórzonymi punktami
+
+        """
+        rng = random.Random(2)
+        for options in ({}, {'subtree_counts': True}):
+            with self.subTest(options=options):
+                index = DynamicKDTree([(1.0, 1.0)] * 5, buffer_size=4, **options)
+                oracle = Counter({(1.0, 1.0): 5})
+                for step in range(800):
+                    present = sorted(+oracle)
+                    if present and rng.random() < 0.4:
+                        point = rng.choice(present)
+                        index.remove(point)
+                        oracle[point] -= 1
+                    else:
+                        point = (float(rng.randint(0, 9)), rng.choice((0.5, 2.5, 7.5)))
+                        index.insert(point)
+                        oracle[point] += 1
+                    if step % 200 == 0:
+                        self.check_index(index, oracle, rng)
+                self.check_index(index, oracle, rng, 40)
+
+    def test_modified_during_iteration(self):
+        """insert/remove w trakcie iter_range dają RuntimeError, limit skraca wynik
+
+        """
+        rng = random.Random(3)
+        points = [(rng.uniform(0, 10), rng.uniform(0, 10)) for _ in range(100)]
+        index = DynamicKDTree(points, buffer_size=8)
+        index.insert((5.0, 5.0))
+        full = list(index.iter_range((0.0, 0.0), (10.0, 10.0)))
+        self.assertEqual(len(full), 101)
+        self.assertEqual(list(index.iter_range((0.0, 0.0), (10.0, 10.0), 7)), full[:7])
+        with self.assertRaises(ValueError):
+            index.iter_range((0.0, 0.0), (10.0, 10.0), -1)
+        for update, point in (('insert', (1.0, 1.0)), ('remove', points[-1])):
+            with self.subTest(update=update):
+                iterator = index.iter_range((0.0, 0.0), (10.0, 10.0))
+                next(iterator)
+                getattr(index, update)(point)
+                with self.assertRaises(RuntimeError):
+                    next(iterator)
+
+    def test_errors(self):
+        """Błędne parametry i usuwanie nieobecnego punktu
+
+        """
+        with self.assertRaises(ValueError):
+            DynamicKDTree(buffer_size=0)
+        index = DynamicKDTree([(1.0, 2.0)])
+        self.assertEqual(index.dimensions, 2)
+        with self.assertRaises(ValueError):
+            index.insert((1.0, 2.0, 3.0))
+        with self.assertRaises(ValueError):
+            index.remove((2.0, 1.0))
+        self.assertIsNone(DynamicKDTree().nearest((0.0, 0.0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,675 @@
+"""Testy modułu kdtree - porównanie drzewa z przeszukiwaniem siłowym
+
+Uruchomienie z katalogu modułu: python -m unittest test_kdtree (lub pytest)
+"""
+import io
+import logging
+import os
+import random
+import tempfile
+import unittest
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import kdtree
+
+
+def brute_range(points, low, high):
+    """Przeszukiwanie siłowe przedziału
+
+    :param points: lista punktów
+    :param low: dolny róg przedziału
+    :param high: górny róg przedziału
+    :return: posortowana lista punktów przedziału (z powtórzeniami)
+    """
+    return sorted(point for point in points
+                  if all(a <= c <= b for a, c, b in zip(low, point, high)))
+
+
+def squared_distance(first, second):
+    """Kwadrat odległości euklidesowej dwóch punktów
+
+    :param first: pierwszy punkt
+    :param second: drugi punkt
+    :return: kwadrat odległości
+    """
+    return sum((a - b) ** 2 for a, b in zip(first, second))
+
+
+def random_rects(rng, dimensions, count, lowest=-1.0, width=6.0):
+    """Losowe przedziały do zapytań
+
+    :param rng: generator losowy
+    :param dimensions: liczba wymiarów
+    :param count: liczba przedziałów
+    :param lowest: najmniejsza współrzędna dolnego rogu
+    :param width: największa szerokość przedziału w każdej osi
+    :return: lista par (bottom_left, top_right)
+    """
+    rects = []
+    for _ in range(count):
+        low = tuple(rng.uniform(lowest, lowest + 10) for _ in range(dimensions))
+        rects.append((low, tuple(a + rng.uniform(0, width) for a in low)))
+    return rects
+
+
+class LoggingTest(unittest.TestCase):
+    """Logi drzewa - poziomy komunikatów i własny handler configure_logging
+
+    """
+
+    def setUp(self):
+        """Zapamiętanie konfiguracji loggera modułu
+
+        """
+        self.handlers = list(kdtree.LOGGER.handlers)
+        self.level = kdtree.LOGGER.level
+        self.propagate = kdtree.LOGGER.propagate
+
+    def tearDown(self):
+        """Przywrócenie konfiguracji loggera modułu
+
+        """
+        kdtree.LOGGER.handlers[:] = self.handlers
+        kdtree.LOGGER.setLevel(self.level)
+        kdtree.LOGGER.propagate = self.propagate
+
+    def test_operations_below_info(self):
+        """Komunikaty o pojedynczych operacjach nie przechodzą przez poziom INFO
+
+        """
+        self.assertTrue(all(level <= logging.DEBUG for level in kdtree.LOG_LEVELS))
+        kdtree.LOGGER.setLevel(logging.INFO)
+        with self.assertNoLogs(kdtree.LOGGER, logging.INFO):
+            tree = kdtree.KDTree([(1.0, 2.0), (3.0, 4.0)])
+            tree.search_range((0, 0), (5, 5))
+
+    def test_configure_logging(self):
+        """configure_logging wypisuje każdy komunikat raz, bez loggera głównego
+
+        """
+        kdtree.LOGGER.handlers[:] = []
+        stream = io.StringIO()
+        kdtree.configure_logging(0, stream)
+        self.assertFalse(kdtree.LOGGER.propagate)
+        kdtree.KDTree([(1.0, 2.0), (3.0, 4.0)]).search_range((0, 0), (5, 5))
+        self.assertEqual(stream.getvalue().count('Range search in'), 1)
+
+
+class TraversalTest(unittest.TestCase):
+    """Tryby zapisu przebiegu wyszukiwania obszaru (query_range)
+
+    """
+
+    def test_modes(self):
+        """Liczniki i lista odwiedzonych węzłów są zgodne we wszystkich trybach
+
+        """
+        rng = random.Random(6)
+        points = [(rng.uniform(0, 10), rng.uniform(0, 10)) for _ in range(300)]
+        tree = kdtree.KDTree(points)
+        for low, high in random_rects(rng, 2, 30):
+            with self.subTest(low=low, high=high):
+                plain = tree.query_range(low, high)
+                counted = tree.query_range(low, high, kdtree.TRAVERSAL_COUNTS)
+                listed = tree.query_range(low, high, kdtree.TRAVERSAL_POINTS)
+                expected = brute_range(points, low, high)
+                for result in (plain, counted, listed):
+                    self.assertEqual(sorted(result.points), expected)
+                    self.assertEqual(result.bounds, (low, high))
+                self.assertIsNone(plain.traversed)
+                self.assertIsNone(plain.visited_count)
+                self.assertIsNone(counted.traversed)
+                # odwiedzone węzły to punkty drzewa, każdy znaleziony punkt był odwiedzony
+                self.assertEqual(listed.visited_count, len(listed.traversed))
+                self.assertEqual(counted.visited_count, listed.visited_count)
+                self.assertLessEqual(set(listed.points), set(listed.traversed))
+                self.assertLessEqual(set(listed.traversed), set(points))
+
+    def test_unknown_mode(self):
+        """Nieznany tryb zapisu przebiegu daje ValueError
+
+        """
+        with self.assertRaises(ValueError):
+            kdtree.KDTree([(1.0, 2.0)]).query_range((0, 0), (1, 1), traversal=7)
+
+
+class DimensionsTest(unittest.TestCase):
+    """Zapytania drzewa k-wymiarowego porównywane z przeszukiwaniem siłowym
+
+    """
+
+    def test_queries(self):
+        """search_range, count_range i knn dla 1-4 wymiarów
+
+        """
+        rng = random.Random(11)
+        for dimensions in (1, 2, 3, 4):
+            points = [tuple(float(rng.randint(0, 9)) for _ in range(dimensions))
+                      for _ in range(300)]
+            tree = kdtree.KDTree(points, subtree_counts=True, cell_bounds=True)
+            self.assertEqual(tree.dimensions, dimensions)
+            for low, high in random_rects(rng, dimensions, 20):
+                with self.subTest(dimensions=dimensions, low=low, high=high):
+                    expected = brute_range(points, low, high)
+                    self.assertEqual(sorted(tree.search_range(low, high)), expected)
+                    self.assertEqual(tree.count_range(low, high), len(expected))
+                    distances = sorted(squared_distance(point, low) for point in points)
+                    self.assertEqual([squared_distance(point, low) for point in tree.knn(low, 7)],
+                                     distances[:7])
+
+    def test_leaf_size(self):
+        """Kubełki: zapytania zgodne z przeszukiwaniem siłowym, błędna pojemność
+
+        """
+        rng = random.Random(23)
+        points = [(rng.uniform(0, 10), rng.uniform(0, 10)) for _ in range(300)]
+        for leaf_size in (2, 7, 1000):
+            tree = kdtree.KDTree(points, subtree_counts=True, leaf_size=leaf_size)
+            self.assertEqual((tree.leaf_size, len(tree)), (leaf_size, len(points)))
+            for low, high in random_rects(rng, 2, 10):
+                with self.subTest(leaf_size=leaf_size, low=low, high=high):
+                    expected = brute_range(points, low, high)
+                    self.assertEqual(sorted(tree.search_range(low, high)), expected)
+                    self.assertEqual(sorted(tree.iter_range(low, high)), expected)
+                    self.assertEqual(tree.count_range(low, high), len(expected))
+                    result = tree.query_range(low, high, kdtree.TRAVERSAL_POINTS)
+                    self.assertLessEqual(set(result.points), set(result.traversed))
+        for leaf_size in (0, 1.5):
+            with self.assertRaises(ValueError):
+                kdtree.KDTree(points, leaf_size=leaf_size)
+
+    def test_wrong_dimensions(self):
+        """Punkty o innej liczbie współrzędnych niż drzewo dają ValueError
+
+        """
+        with self.assertRaises(ValueError):
+            kdtree.KDTree([(1.0, 2.0), (1.0, 2.0, 3.0)])
+        with self.assertRaises(ValueError):
+            kdtree.KDTree([(1.0, 2.0)], dimensions=3)
+
+
+class IterRangeTest(unittest.TestCase):
+    """Leniwe przeszukiwanie przedziału: limit, przerwanie i modyfikacja drzewa
+
+    """
+
+    def setUp(self):
+        rng = random.Random(29)
+        self.points = [(float(rng.randint(0, 9)), float(rng.randint(0, 9))) for _ in range(400)]
+
+    def test_limit(self):
+        """Limit i wcześniejsze przerwanie zwracają początek pełnego wyniku
+
+        """
+        for options in ({}, {'leaf_size': 4}):
+            tree = kdtree.KDTree(self.points, **options)
+            full = list(tree.iter_range((2.0, 2.0), (7.0, 7.0)))
+            self.assertEqual(sorted(full), brute_range(self.points, (2.0, 2.0), (7.0, 7.0)))
+            for limit in (0, 1, 10, len(full) + 5):
+                with self.subTest(options=options, limit=limit):
+                    self.assertEqual(list(tree.iter_range((2.0, 2.0), (7.0, 7.0), limit)),
+                                     full[:limit])
+            points = tree.iter_range((2.0, 2.0), (7.0, 7.0))
+            self.assertEqual([next(points) for _ in range(3)], full[:3])
+            with self.assertRaises(ValueError):
+                tree.iter_range((2.0, 2.0), (7.0, 7.0), -1)
+
+    def test_modified_during_iteration(self):
+        """insert/remove po utworzeniu iteratora dają RuntimeError przy kolejnym punkcie
+
+        """
+        for options in ({}, {'leaf_size': 4}):
+            for update in ('insert', 'remove'):
+                with self.subTest(options=options, update=update):
+                    tree = kdtree.KDTree(self.points, **options)
+                    points = tree.iter_range((0.0, 0.0), (9.0, 9.0))
+                    next(points)
+                    getattr(tree, update)(self.points[0])
+                    with self.assertRaises(RuntimeError):
+                        next(points)
+                    # iterator utworzony przed modyfikacją, ale jeszcze nie uruchomiony
+                    points = tree.iter_range((0.0, 0.0), (9.0, 9.0), 5)
+                    tree.insert((1.0, 1.0))
+                    with self.assertRaises(RuntimeError):
+                        list(points)
+                    # nowy iterator widzi zmienione drzewo
+                    self.assertEqual(len(list(tree.iter_range((0.0, 0.0), (9.0, 9.0)))),
+                                     len(tree))
+
+
+@unittest.skipIf(np is None, 'numpy is required for batch queries')
+class BatchQueryTest(unittest.TestCase):
+    """Wyszukiwanie wielu obszarów jednym wywołaniem (search_ranges)
+
+    """
+
+    def check_batch(self, tree, rects):
+        """Porównanie wyników search_ranges (listy i CSR) z search_range
+
+        :param tree: drzewo KD
+        :param rects: lista par (bottom_left, top_right)
+        :return: None
+        """
+        expected = [sorted(tree.search_range(low, high)) for low, high in rects]
+        self.assertEqual([sorted(points) for points in tree.search_ranges(rects)], expected)
+        offsets, indices = tree.search_ranges(rects, csr=True)
+        self.assertEqual(offsets.tolist()[0], 0)
+        self.assertEqual(len(offsets), len(rects) + 1)
+        self.assertEqual(offsets.tolist()[-1], len(indices))
+        storage = tree.storage
+        self.assertEqual([sorted(storage[index] for index in indices[start:end].tolist())
+                          for start, end in zip(offsets.tolist(), offsets.tolist()[1:])],
+                         expected)
+
+    def test_batch(self):
+        """Wyniki zgodne z pojedynczymi zapytaniami, także dla powtórzonych punktów
+
+        """
+        rng = random.Random(7)
+        points = [(float(rng.randint(0, 9)), rng.uniform(0, 10)) for _ in range(400)]
+        points += points[:40]
+        for options in ({}, {'subtree_counts': True}, {'leaf_size': 8}):
+            with self.subTest(options=options):
+                tree = kdtree.KDTree(points, **options)
+                rects = random_rects(rng, 2, 25)
+                # przedział pusty i przedział obejmujący całe drzewo
+                rects += [((5.0, 5.0), (4.0, 4.0)), ((-1.0, -1.0), (11.0, 11.0))]
+                self.check_batch(tree, rects)
+
+    def test_empty(self):
+        """Pusta lista zapytań i puste drzewo
+
+        """
+        tree = kdtree.KDTree([(1.0, 2.0), (3.0, 4.0)])
+        self.assertEqual(tree.search_ranges([]), [])
+        offsets, indices = tree.search_ranges([], csr=True)
+        self.assertEqual((offsets.tolist(), len(indices)), ([0], 0))
+        self.check_batch(kdtree.KDTree([], dimensions=2), [((0.0, 0.0), (1.0, 1.0))])
+
+
+class RandomUpdatesTest(unittest.TestCase):
+    """Losowe ciągi insert/remove porównywane z licznikiem punktów (Counter)
+
+    """
+
+    # zestawy parametrów konstruktora sprawdzane przy modyfikacjach
+    OPTIONS = ({}, {'subtree_counts': True}, {'subtree_counts': True, 'cell_bounds': True},
+               {'leaf_size': 4}, {'leaf_size': 4, 'subtree_counts': True, 'cell_bounds': True})
+
+    def check_tree(self, tree, oracle, rng, queries=10):
+        """Porównanie drzewa z licznikiem punktów na losowych zapytaniach
+
+        :param tree: drzewo KD
+        :param oracle: Counter punktów, które powinno zawierać drzewo
+        :param rng: generator losowy zapytań
+        :param queries: liczba zapytań
+        :return: None
+        """
+        dimensions = tree.dimensions
+        points = list(oracle.elements())
+        self.assertEqual(len(tree), len(points))
+        # każdy punkt zajmuje dokładnie jedno miejsce, powtórzenia to krotność
+        stored = Counter(point for point in tree.storage[:] if point is not None)
+        self.assertEqual(set(stored), set(+oracle))
+        self.assertEqual(max(stored.values(), default=1), 1)
+        for low, high in random_rects(rng, dimensions, queries):
+            expected = brute_range(points, low, high)
+            self.assertEqual(sorted(tree.search_range(low, high)), expected)
+            self.assertEqual(tree.count_range(low, high), len(expected))
+            k = rng.randint(1, 12)
+            distances = sorted(squared_distance(point, low) for point in points)
+            self.assertEqual([squared_distance(point, low) for point in tree.knn(low, k)],
+                             distances[:k])
+
+    def run_updates(self, dimensions, seed, **options):
+        """Losowy ciąg wstawień i usunięć punktów o małych współrzędnych całkowitych
+        (dużo powtórzeń i równych współrzędnych osi podziału)
+
+        :param dimensions: liczba wymiarów
+        :param seed: ziarno losowania
+        :param options: parametry konstruktora KDTree
+        :return: None
+        """
+        rng = random.Random(seed)
+        tree = kdtree.KDTree([], dimensions=dimensions, **options)
+        oracle = Counter()
+        for step in range(600):
+            present = sorted(+oracle)
+            if present and rng.random() < 0.45:
+                point = rng.choice(present)
+                tree.remove(point)
+                oracle[point] -= 1
+            else:
+                point = tuple(float(rng.randint(0, 8)) for _ in range(dimensions))
+                tree.insert(point)
+                oracle[point] += 1
+            if step % 100 == 0:
+                self.check_tree(tree, oracle, rng)
+        self.check_tree(tree, oracle, rng, 40)
+        for point in list((+oracle).elements()):
+            tree.remove(point)
+        self.assertEqual(len(tree), 0)
+        self.assertEqual(tree.search_range((-1,) * dimensions, (10,) * dimensions), [])
+        with self.assertRaises(ValueError):
+            tree.remove((0.0,) * dimensions)
+
+    def test_updates(self):
+        """insert/remove dla różnych wymiarów i opcji drzewa
+
+        """
+        for dimensions in (1, 2, 3):
+            for seed, options in enumerate(self.OPTIONS):
+                with self.subTest(dimensions=dimensions, options=options):
+                    self.run_updates(dimensions, seed, **options)
+
+    def test_updates_of_built_tree(self):
+        """insert/remove na drzewie zbudowanym z listy punktów
+
+        """
+        rng = random.Random(7)
+        points = [(rng.uniform(0, 10), rng.uniform(0, 10)) for _ in range(500)]
+        for options in self.OPTIONS:
+            with self.subTest(options=options):
+                tree = kdtree.KDTree(points, **options)
+                oracle = Counter(points)
+                self.check_tree(tree, oracle, rng)
+                for point in points[::3]:
+                    tree.remove(point)
+                    oracle[point] -= 1
+                for _ in range(300):
+                    point = (float(rng.randint(0, 9)), float(rng.randint(0, 9)))
+                    tree.insert(point)
+                    oracle[point] += 1
+                self.check_tree(tree, oracle, rng, 40)
+
+    def test_duplicates_of_built_tree(self):
+        """insert/remove na drzewie zbudowanym z listy punktów z powtórzeniami
+
+        """
+        rng = random.Random(8)
+        points = [(float(rng.randint(0, 6)), float(rng.randint(0, 6))) for _ in range(500)]
+        for options in self.OPTIONS:
+            with self.subTest(options=options):
+                tree = kdtree.KDTree(points, **options)
+                self.assertIsNotNone(tree.multiplicity)
+                oracle = Counter(points)
+                self.check_tree(tree, oracle, rng)
+                for point in points[::2]:
+                    tree.remove(point)
+                    oracle[point] -= 1
+                self.check_tree(tree, oracle, rng)
+                for point in points[::3]:
+                    tree.insert(point)
+                    oracle[point] += 1
+                self.check_tree(tree, oracle, rng, 40)
+
+    def test_alpha(self):
+        """Drzewo pozostaje poprawne dla skrajnych progów przebudowy
+
+        """
+        for alpha in (0.5, 1.0):
+            with self.subTest(alpha=alpha):
+                self.run_updates(2, 13, alpha=alpha)
+        with self.assertRaises(ValueError):
+            kdtree.KDTree([], alpha=0)
+
+
+class FileTest(unittest.TestCase):
+    """Zapis drzewa do pliku (save) i wczytanie go bez kopiowania (load)
+
+    """
+
+    def setUp(self):
+        """Katalog tymczasowy na pliki drzew
+
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'tree.kdt')
+
+    def tearDown(self):
+        """Usunięcie katalogu tymczasowego
+
+        """
+        self.directory.cleanup()
+
+    def check_round_trip(self, points, options_list):
+        """Wczytane drzewo ma ten sam układ i te same wyniki zapytań
+
+        :param points: lista punktów 3D
+        :param options_list: zestawy parametrów konstruktora KDTree
+        :return: None
+        """
+        rng = random.Random(3)
+        for options in options_list:
+            with self.subTest(options=options):
+                tree = kdtree.KDTree(points, **options)
+                tree.save(self.path)
+                loaded = kdtree.KDTree.load(self.path)
+                self.assertTrue(loaded.read_only)
+                self.assertEqual(len(loaded), len(tree))
+                self.assertEqual((loaded.size, loaded.leaf_size), (tree.size, tree.leaf_size))
+                self.assertEqual(loaded.storage[:], tree.storage[:])
+                self.assertEqual(loaded.multiplicity is None, tree.multiplicity is None)
+                if tree.multiplicity is not None:
+                    self.assertEqual(list(loaded.multiplicity), list(tree.multiplicity))
+                for _ in range(20):
+                    low = (rng.uniform(0, 20), rng.uniform(0, 20), 0.0)
+                    high = (low[0] + 5, low[1] + 5, rng.random())
+                    self.assertEqual(loaded.search_range(low, high), tree.search_range(low, high))
+                    self.assertEqual(loaded.count_range(low, high), tree.count_range(low, high))
+                    self.assertEqual(loaded.knn(low, 5), tree.knn(low, 5))
+                    for index in range(0, tree.size, 7):
+                        self.assertEqual(loaded.find_bounds(index, 0, 100),
+                                         tree.find_bounds(index, 0, 100))
+                with self.assertRaises(ValueError):
+                    loaded.insert((0.0, 0.0, 0.0))
+                del loaded
+
+    def test_round_trip(self):
+        """Zapis i odczyt drzewa bez i z opcjonalnymi sekcjami
+
+        """
+        rng = random.Random(3)
+        points = [(rng.uniform(0, 20), rng.uniform(0, 20), rng.random()) for _ in range(400)]
+        self.check_round_trip(points, ({}, {'subtree_counts': True, 'cell_bounds': True},
+                                       {'subtree_counts': True, 'leaf_size': 6}))
+        self.check_round_trip([], ({}, {'leaf_size': 6}))
+
+    def test_duplicates(self):
+        """Krotności powtórzonych punktów są zapisywane razem z drzewem
+
+        """
+        rng = random.Random(4)
+        points = [(float(rng.randint(0, 20)), float(rng.randint(0, 20)), 0.5)
+                  for _ in range(400)]
+        self.check_round_trip(points, ({}, {'subtree_counts': True, 'cell_bounds': True},
+                                       {'leaf_size': 6}))
+
+    def test_rejects_unknown_format(self):
+        """Obcy plik, nieznana wersja, nieznane flagi sekcji lub zła długość
+        dają czytelny błąd
+
+        """
+        kdtree.KDTree([(1.0, 2.0), (3.0, 4.0)], subtree_counts=True).save(self.path)
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        header = kdtree._FILE_HEADER  # pylint: disable=protected-access
+        fields = header.unpack_from(data)
+        body = data[header.size:]
+        cases = (('magic', b'NOPE' + data[4:], 'not a kdtree file'),
+                 ('version', header.pack(fields[0], 99, *fields[2:]) + body, 'version'),
+                 ('flags', header.pack(*fields[:4], fields[4] | 0x80, *fields[5:]) + body,
+                  'flags'),
+                 ('truncated', data[:-1], 'length'),
+                 ('header', data[:header.size - 1], 'not a kdtree file'))
+        for name, changed, message in cases:
+            with self.subTest(name=name):
+                with open(self.path, 'wb') as file:
+                    file.write(changed)
+                with self.assertRaisesRegex(ValueError, message):
+                    kdtree.KDTree.load(self.path)
+
+
+@unittest.skipIf(np is None, 'numpy is required for IndexKDTree')
+class IndexKDTreeTest(unittest.TestCase):
+    """Drzewo indeksów wierszy porównywane z przeszukiwaniem siłowym tablicy
+
+    """
+
+    def test_queries(self):
+        """Indeksy wierszy obszarów, także dla powtórzonych wierszy i kubełków
+
+        """
+        rng = np.random.default_rng(24)
+        for dimensions in (2, 3):
+            points = rng.integers(0, 8, size=(600, dimensions)).astype(float)
+            # powtórzone wiersze nie są zwijane - każdy ma własne miejsce
+            points = np.concatenate((points, points[:100]))
+            for leaf_size in (1, 3, 16):
+                tree = kdtree.IndexKDTree(points, leaf_size=leaf_size)
+                rows = tree.rows[tree.rows >= 0]
+                self.assertEqual(sorted(rows.tolist()), list(range(len(points))))
+                self.assertEqual((len(tree), tree.leaf_size, tree.dimensions),
+                                 (len(points), leaf_size, dimensions))
+                self.assertEqual(tree.nbytes, 4 * len(tree.rows))
+                lows = rng.uniform(-1, 8, size=(30, dimensions))
+                highs = lows + rng.uniform(0, 5, size=(30, dimensions))
+                rects = np.stack((lows, highs), axis=1)
+                expected = [np.flatnonzero(((points >= low) & (points <= high)).all(axis=1))
+                            for low, high in zip(lows, highs)]
+                offsets, indices = tree.search_ranges(rects, csr=True)
+                for query, (low, high) in enumerate(zip(lows, highs)):
+                    with self.subTest(dimensions=dimensions, leaf_size=leaf_size, query=query):
+                        found = indices[offsets[query]:offsets[query + 1]]
+                        self.assertEqual(sorted(found.tolist()), expected[query].tolist())
+                        self.assertEqual(sorted(tree.search_range(low, high).tolist()),
+                                         expected[query].tolist())
+                        self.assertEqual(tree.count_range(low, high), len(expected[query]))
+                self.assertEqual([sorted(part.tolist()) for part in tree.search_ranges(rects)],
+                                 [part.tolist() for part in expected])
+
+    def test_same_layout(self):
+        """Układ drzewa indeksów to układ KDTree tej samej tablicy bez powtórzeń
+
+        """
+        points = np.random.default_rng(2).random((500, 2))
+        for leaf_size in (1, 4):
+            reference = kdtree.KDTree(points, leaf_size=leaf_size)
+            tree = kdtree.IndexKDTree(points, leaf_size=leaf_size)
+            self.assertEqual(tree.size, reference.size)
+            self.assertEqual([None if row < 0 else tuple(points[row].tolist())
+                              for row in tree.rows.tolist()], reference.storage[:])
+
+    def test_errors(self):
+        """Tablica o złym kształcie lub błędna pojemność kubełka
+
+        """
+        with self.assertRaises(ValueError):
+            kdtree.IndexKDTree([(1.0, 2.0)])
+        with self.assertRaises(ValueError):
+            kdtree.IndexKDTree(np.zeros(5))
+        with self.assertRaises(ValueError):
+            kdtree.IndexKDTree(np.zeros((5, 2)), leaf_size=0)
+
+
+@unittest.skipIf(np is None, 'numpy is required for array builds')
+class BuildLayoutTest(unittest.TestCase):
+    """Budowanie z listy, z tablicy numpy i równoległe daje ten sam układ drzewa
+
+    """
+
+    def setUp(self):
+        """Budowanie równoległe także dla małych zbiorów
+
+        """
+        self.parallel_min_points = kdtree.PARALLEL_MIN_POINTS
+        kdtree.PARALLEL_MIN_POINTS = 0
+
+    def tearDown(self):
+        """Przywrócenie progu budowania równoległego
+
+        """
+        kdtree.PARALLEL_MIN_POINTS = self.parallel_min_points
+
+    def assert_same_layout(self, first, second):
+        """Porównanie układu dwóch drzew
+
+        :param first: pierwsze drzewo
+        :param second: drugie drzewo
+        :return: None
+        """
+        self.assertEqual((first.size, len(first)), (second.size, len(second)))
+        self.assertEqual(first.storage[:], second.storage[:])
+        self.assertEqual(first.multiplicity is None, second.multiplicity is None)
+        if first.multiplicity is not None:
+            self.assertEqual(list(first.multiplicity), list(second.multiplicity))
+        for index in range(first.size):
+            if first[index] is not None:
+                for axis in range(first.dimensions):
+                    self.assertEqual(first.find_bounds(index, axis, 1000),
+                                     second.find_bounds(index, axis, 1000))
+
+    def check_layouts(self, dimensions, options_list, counts=(0, 1, 2, 7, 300), spread=20,
+                      **build):
+        """Porównanie drzew zbudowanych z listy i z tablicy numpy
+
+        :param dimensions: liczba wymiarów
+        :param options_list: zestawy parametrów konstruktora wspólnych dla obu drzew
+        :param counts: liczby punktów kolejnych zbiorów
+        :param spread: zakres współrzędnych całkowitych (-spread, spread)
+        :param build: dodatkowe parametry budowania z tablicy (np. workers)
+        :return: None
+        """
+        rng = np.random.default_rng(11)
+        for count in counts:
+            # małe współrzędne całkowite - dużo równych współrzędnych osi podziału
+            points = rng.integers(-spread, spread, size=(count, dimensions)).astype(float)
+            for options in options_list:
+                with self.subTest(dimensions=dimensions, count=count, options=options):
+                    reference = kdtree.KDTree([tuple(point) for point in points.tolist()],
+                                              dimensions=dimensions, **options)
+                    self.assert_same_layout(reference,
+                                            kdtree.KDTree(points, **options, **build))
+
+    def test_same_layout(self):
+        """Układ drzewa 2D nie zależy od sposobu budowania
+
+        """
+        self.check_layouts(2, ({}, {'subtree_counts': True}, {'cell_bounds': True}))
+
+    def test_buckets(self):
+        """Układ drzewa z kubełkami nie zależy od sposobu budowania
+
+        """
+        options_list = ({'subtree_counts': True, 'leaf_size': 5},
+                        {'cell_bounds': True, 'leaf_size': 2})
+        for dimensions in (1, 2, 3):
+            self.check_layouts(dimensions, options_list)
+            self.check_layouts(dimensions, options_list, workers=2)
+
+    def test_dimensions(self):
+        """Układ drzewa k-wymiarowego nie zależy od sposobu budowania
+
+        """
+        for dimensions in (1, 3, 4):
+            self.check_layouts(dimensions, ({'subtree_counts': True, 'cell_bounds': True},))
+
+    def test_parallel(self):
+        """Budowanie równoległe daje układ budowania z listy
+
+        """
+        options_list = ({'subtree_counts': True}, {'cell_bounds': True})
+        for dimensions in (1, 2, 3):
+            self.check_layouts(dimensions, options_list, workers=2)
+        # więcej procesów niż punktów i przedziały sortowania z samymi powtórzeniami
+        self.check_layouts(2, options_list, counts=(3, 2000), spread=2, workers=3)
+        self.check_layouts(3, options_list, counts=(5000,), spread=1000, workers=3)
+
+
+if __name__ == '__main__':
+    unittest.main()
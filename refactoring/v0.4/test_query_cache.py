@@ -0,0 +1,143 @@
+"""Testy modułu query_cache - pamięć podręczna wyników zapytań obszarowych
+
+Uruchomienie z katalogu modułu: python -m unittest test_query_cache (lub pytest)
+"""
+import random
+import unittest
+
+import kdtree
+from query_cache import RangeQueryCache
+from test_kdtree import brute_range
+
+
+class RangeQueryCacheTest(unittest.TestCase):
+    """Trafienia, usuwanie najdawniej używanych wpisów i unieważnianie
+
+    """
+
+    def setUp(self):
+        """Drzewo punktów siatki 10 x 10
+
+        """
+        self.points = [(float(x), float(y)) for x in range(10) for y in range(10)]
+        self.tree = kdtree.KDTree(self.points)
+
+    def test_hits(self):
+        """Powtórzone zapytanie jest obsługiwane z pamięci
+
+        """
+        cache = RangeQueryCache(self.tree)
+        first = cache.search_range((0, 0), (2, 2))
+        self.assertEqual(sorted(first), brute_range(self.points, (0, 0), (2, 2)))
+        self.assertIs(cache.search_range([0, 0], [2, 2]), first)
+        self.assertEqual((cache.hits, cache.misses, len(cache), cache.points), (1, 1, 1, 9))
+        result = cache.query_range((0, 0), (2, 2), traversal=kdtree.TRAVERSAL_POINTS)
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.query_range((0, 0), (2, 2), traversal=kdtree.TRAVERSAL_POINTS),
+                      result)
+        self.assertEqual(cache.points, 9 + len(result.points) + len(result.traversed))
+
+    def test_eviction(self):
+        """Limity liczby wpisów i punktów usuwają najdawniej używane wpisy
+
+        """
+        cache = RangeQueryCache(self.tree, max_entries=2)
+        cache.search_range((0, 0), (1, 1))
+        cache.search_range((0, 0), (2, 2))
+        cache.search_range((0, 0), (1, 1))
+        cache.search_range((0, 0), (3, 3))
+        self.assertEqual(len(cache), 2)
+        cache.search_range((0, 0), (1, 1))
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+        cache = RangeQueryCache(self.tree, max_points=20)
+        cache.search_range((0, 0), (2, 2))
+        cache.search_range((5, 5), (7, 7))
+        cache.search_range((0, 0), (1, 1))
+        self.assertEqual((len(cache), cache.points), (2, 13))
+        # wynik większy niż cała pamięć nie jest zapamiętywany
+        cache.search_range((0, 0), (9, 9))
+        self.assertEqual((len(cache), cache.points), (2, 13))
+
+    def test_invalidation(self):
+        """Modyfikacja drzewa lub przypisanie nowego drzewa czyści pamięć
+
+        """
+        cache = RangeQueryCache(self.tree)
+        cache.search_range((0, 0), (2, 2))
+        self.tree.insert((1.5, 1.5))
+        self.assertEqual(len(cache.search_range((0, 0), (2, 2))), 10)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        self.tree.remove((1.5, 1.5))
+        self.assertEqual(len(cache.search_range((0, 0), (2, 2))), 9)
+        cache.tree = kdtree.KDTree([(1.0, 1.0)])
+        self.assertEqual((len(cache), cache.points), (0, 0))
+        self.assertEqual(cache.search_range((0, 0), (2, 2)), [(1.0, 1.0)])
+        self.assertEqual(cache.misses, 4)
+
+
+class ContainmentTest(unittest.TestCase):
+    """Wyniki obszarów zawartych w zapamiętanych obszarach (containment=True)
+
+    """
+
+    def setUp(self):
+        """Drzewo losowych punktów
+
+        """
+        rng = random.Random(19)
+        self.points = [(rng.uniform(0, 10), rng.uniform(0, 10)) for _ in range(500)]
+        self.tree = kdtree.KDTree(self.points)
+
+    def test_contained(self):
+        """Zawarty obszar jest filtrowany z nadzbioru, inne trafiają do drzewa
+
+        """
+        cache = RangeQueryCache(self.tree, containment=True)
+        outer = cache.search_range((1, 1), (8, 8))
+        inner = cache.search_range((2, 3), (5, 6))
+        self.assertEqual(sorted(inner), brute_range(self.points, (2, 3), (5, 6)))
+        self.assertEqual(cache.contained_hits, 1)
+        # wynik zawartego obszaru też jest nadzbiorem, wybierany jest najmniejszy
+        self.assertEqual(sorted(cache.search_range((3, 4), (4, 5))),
+                         brute_range(self.points, (3, 4), (4, 5)))
+        self.assertEqual(cache.contained_hits, 2)
+        cache.search_range((0, 0), (5, 5))
+        self.assertEqual((cache.contained_hits, cache.misses), (2, 4))
+        # pusty nadzbiór
+        cache.search_range((20, 20), (30, 30))
+        self.assertEqual(cache.search_range((21, 21), (22, 22)), [])
+        self.assertEqual(cache.contained_hits, 3)
+        self.assertEqual(sorted(outer), brute_range(self.points, (1, 1), (8, 8)))
+
+    def test_memory_limit(self):
+        """Tablice filtrowania liczą się do max_points i znikają z wpisami
+
+        """
+        cache = RangeQueryCache(self.tree, containment=True)
+        outer = cache.search_range((1, 1), (8, 8))
+        inner = cache.search_range((2, 3), (5, 6))
+        if kdtree.np is not None:
+            # wyniki, tablica nadzbioru i tablica wyniku zawartego obszaru
+            self.assertEqual(cache.points, 2 * (len(outer) + len(inner)))
+        limit = 3 * len(outer)
+        cache = RangeQueryCache(self.tree, containment=True, max_points=limit)
+        rng = random.Random(5)
+        low, high = (0, 0), (10, 10)
+        for _ in range(200):
+            if rng.random() < 0.5:
+                # obszar wewnątrz poprzedniego - filtrowany z pamięci, jeśli ta go zachowała
+                low = tuple(a + rng.uniform(0, 1) for a in low)
+                high = tuple(b - rng.uniform(0, 1) for b in high)
+            else:
+                low = (rng.uniform(0, 6), rng.uniform(0, 6))
+                high = (low[0] + rng.uniform(0, 4), low[1] + rng.uniform(0, 4))
+            self.assertEqual(sorted(cache.search_range(low, high)),
+                             brute_range(self.points, low, high))
+            self.assertLessEqual(cache.points, limit)
+        self.assertGreater(cache.contained_hits, 0)
+        cache.clear()
+        self.assertEqual(cache.points, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""Testy modułu query_pool - wyniki puli porównywane z KDTree.search_ranges
+
+Uruchomienie z katalogu modułu: python -m unittest test_query_pool (lub pytest)
+"""
+import os
+import random
+import tempfile
+import unittest
+
+import kdtree
+from test_kdtree import random_rects
+
+try:
+    import numpy as np
+    from query_pool import QueryPool
+except ImportError:
+    np = QueryPool = None
+
+
+@unittest.skipIf(np is None, 'numpy is required for QueryPool')
+class QueryPoolTest(unittest.TestCase):
+    """Zapytania wykonywane w procesach roboczych
+
+    """
+
+    def setUp(self):
+        """Drzewo z powtórzonymi punktami i zapytania do niego
+
+        """
+        rng = random.Random(16)
+        points = [(float(rng.randint(0, 9)), rng.uniform(0, 10)) for _ in range(500)]
+        self.tree = kdtree.KDTree(points + points[:30], subtree_counts=True)
+        self.rects = random_rects(rng, 2, 23) + [((5.0, 5.0), (4.0, 4.0))]
+
+    def check_pool(self, pool, rects, **options):
+        """Porównanie wyników puli (CSR i listy punktów) z KDTree.search_ranges
+
+        :param pool: pula zapytań
+        :param rects: lista par (bottom_left, top_right)
+        :param options: parametry QueryPool.search_ranges (np. chunk_size)
+        :return: None
+        """
+        expected_offsets, expected_indices = self.tree.search_ranges(rects, csr=True)
+        offsets, indices = pool.search_ranges(rects, csr=True, **options)
+        self.assertEqual(offsets.tolist(), expected_offsets.tolist())
+        self.assertEqual(indices.tolist(), expected_indices.tolist())
+        self.assertEqual(pool.search_ranges(rects, **options), self.tree.search_ranges(rects))
+
+    def test_from_tree(self):
+        """Pula zbudowana z drzewa - pełna paczka, paczki po jednym obszarze i pusta paczka
+
+        """
+        with QueryPool(self.tree, workers=2) as pool:
+            self.check_pool(pool, self.rects)
+            self.check_pool(pool, self.rects, chunk_size=1)
+            self.check_pool(pool, [])
+            offsets, indices = pool.submit(self.rects[:3]).result()
+            self.assertEqual(offsets.tolist(),
+                             self.tree.search_ranges(self.rects[:3], csr=True)[0].tolist())
+            self.assertEqual(len(indices), offsets[-1])
+
+    def test_from_path(self):
+        """Pula zbudowana ze ścieżki pliku - zamknięcie zwalnia mapowanie, plik zostaje
+
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'tree.kdt')
+            self.tree.save(path)
+            pool = QueryPool(path, workers=2)
+            try:
+                self.assertTrue(pool.tree.read_only)
+                self.check_pool(pool, self.rects)
+            finally:
+                pool.close()
+            self.assertIsNone(pool.tree)
+            self.assertTrue(os.path.exists(path))
+            with self.assertRaises(RuntimeError):
+                pool.search_ranges(self.rects)
+
+    def test_close_removes_temporary(self):
+        """Zamknięcie puli zbudowanej z drzewa usuwa plik tymczasowy
+
+        """
+        temporary_directory = tempfile.tempdir
+        with tempfile.TemporaryDirectory() as directory:
+            tempfile.tempdir = directory
+            try:
+                pool = QueryPool(self.tree, workers=1)
+                self.assertEqual(len(os.listdir(directory)), 1)
+                pool.close()
+                self.assertEqual(os.listdir(directory), [])
+                self.assertIsNone(pool.tree)
+            finally:
+                tempfile.tempdir = temporary_directory
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+"""Moduł zawierający zwartą reprezentację tablicy węzłów drzewa KD
+
+"""
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy jest opcjonalny - potrzebny tylko dla from_numpy i as_numpy
+    np = None
+
+
+class PointStorage:
+    """Klasa przechowująca punkty drzewa w układzie "structure of arrays"
+    Każda współrzędna jest trzymana w osobnej, ciągłej tablicy array('d'),
+    a zajętość węzłów w bitmapie (1 bit na węzeł)
+    Zamiast ~100+ bajtów na węzeł (wskaźnik listy + krotka + 2 obiekty float)
+    każdy węzeł zajmuje 8 bajtów na wymiar i 1 bit
+
+    """
+
+    def __init__(self, columns, valid):
+        """Inicjalizacja magazynu na podstawie gotowych kolumn
+
+        :param columns: krotka tablic array('d') - po jednej na wymiar, równej długości
+                        (lub widoków memoryview 'd' na mapowany plik - tylko do odczytu)
+        :param valid: bytearray z bitmapą zajętych węzłów (bit i = węzeł i)
+                      lub widok memoryview 'B'
+        """
+        self.__columns = tuple(columns)
+        self.__valid = valid
+        self.__size = len(self.__columns[0])
+
+    @classmethod
+    def empty(cls, size, dimensions=2):
+        """Tworzy pusty magazyn na zadaną liczbę węzłów
+
+        :param size: liczba węzłów
+        :param dimensions: liczba wymiarów punktów
+        :return: nowy magazyn, wszystkie węzły puste
+        """
+        return cls([array('d', bytes(8 * size)) for _ in range(dimensions)],
+                   bytearray((size + 7) // 8))
+
+    @classmethod
+    def from_numpy(cls, columns, mask):
+        """Tworzy magazyn z tablic numpy (używane przy budowaniu wektorowym)
+
+        :param columns: tablica numpy (wymiary, rozmiar) współrzędnych węzłów
+        :param mask: tablica numpy bool - które węzły są zajęte
+        :return: nowy magazyn
+        """
+        return cls([array('d', np.ascontiguousarray(column, dtype=np.float64).tobytes())
+                    for column in columns],
+                   bytearray(np.packbits(mask, bitorder='little').tobytes()))
+
+    def as_numpy(self):
+        """Widok magazynu jako tablice numpy, bez kopiowania współrzędnych
+
+        :return: krotka (krotka kolumn numpy - po jednej na wymiar, maska bool zajętych węzłów)
+        """
+        columns = tuple(np.frombuffer(column, dtype=np.float64) for column in self.__columns)
+        mask = np.unpackbits(np.frombuffer(self.__valid, dtype=np.uint8),
+                             bitorder='little')[:self.__size].astype(bool)
+        return columns, mask
+
+    @property
+    def columns(self):
+        """Kolumny współrzędnych - do szybkiego odczytu w pętlach wyszukiwania
+
+        :return: krotka tablic współrzędnych (jedna na wymiar)
+        """
+        return self.__columns
+
+    @property
+    def valid(self):
+        """Bitmapa zajętych węzłów
+
+        :return: bytearray, bit (i & 7) bajtu (i >> 3) opisuje węzeł i
+        """
+        return self.__valid
+
+    @property
+    def dimensions(self):
+        """Liczba wymiarów przechowywanych punktów
+
+        :return: liczba kolumn
+        """
+        return len(self.__columns)
+
+    @property
+    def nbytes(self):
+        """Rozmiar danych magazynu w bajtach (bez narzutu obiektów)
+
+        :return: liczba bajtów kolumn i bitmapy
+        """
+        return sum(column.itemsize * len(column) for column in self.__columns) \
+            + len(self.__valid)
+
+    def __len__(self):
+        """Liczba węzłów (zajętych i pustych)
+
+        :return: rozmiar magazynu
+        """
+        return self.__size
+
+    def is_valid(self, index):
+        """Sprawdza czy węzeł o podanym indeksie zawiera punkt
+
+        :param index: indeks węzła
+        :return: True jeśli węzeł jest zajęty
+        """
+        return 0 <= index < self.__size and self.__valid[index >> 3] >> (index & 7) & 1 == 1
+
+    def __getitem__(self, index):
+        """Odczyt punktu jako krotki (lub listy krotek dla wycinka)
+
+        :param index: indeks węzła lub wycinek
+        :return: krotka współrzędnych albo None dla pustego węzła
+        """
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.__size))]
+        if index < 0:
+            index += self.__size
+        if not 0 <= index < self.__size:
+            raise IndexError('storage index out of range')
+        if not self.__valid[index >> 3] >> (index & 7) & 1:
+            return None
+        return tuple(column[index] for column in self.__columns)
+
+    def __setitem__(self, index, point):
+        """Zapis punktu w węźle, None oznacza opróżnienie węzła
+
+        :param index: indeks węzła
+        :param point: krotka współrzędnych lub None
+        """
+        if point is None:
+            self.__valid[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+            return
+        for column, value in zip(self.__columns, point):
+            column[index] = value
+        self.__valid[index >> 3] |= 1 << (index & 7)